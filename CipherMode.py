@@ -0,0 +1,8 @@
+from enum import Enum
+from Crypto.Cipher import AES
+
+class CipherMode(Enum):
+    # values are block modes of AES cipher
+    CBC = AES.MODE_CBC
+    CTR = AES.MODE_CTR
+    GCM = AES.MODE_GCM
\ No newline at end of file
@@ -0,0 +1,6 @@
+from enum import Enum
+
+class Codec(Enum):
+    NONE = 0
+    ZLIB = 1
+    LZMA = 2
\ No newline at end of file
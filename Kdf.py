@@ -0,0 +1,6 @@
+from enum import Enum
+
+class Kdf(Enum):
+    NONE = 0 # password padded or truncated to the key length
+    SCRYPT = 1
+    PBKDF2 = 2
\ No newline at end of file
@@ -0,0 +1,306 @@
+import io
+import struct
+import zlib
+from enum import Enum
+from typing import BinaryIO, Callable
+from CipherMode import CipherMode
+from Codec import Codec
+from ContentType import ContentType
+from generators import DATA_SIZE_BYTES, MESSAGE_CONTENT_SIZE, HEADER_SIZE
+
+
+class HeaderField(Enum):
+    """Tags of optional header fields"""
+    DEPTH = 1
+    CODEC = 2
+    KDF = 3 # key derivation record (KDF, parameters, salt, key check), see KeyService
+    CIPHER = 4
+    LAYOUT = 5
+    SHARD = 6 # set ID, index and count of shard of data split across images
+    SCATTER = 7 # salt of permutation scattering data over channels, see scatter.py
+    FRAMES = 8 # number of bytes held by every frame of multi-frame image data are spread over, see frames.py
+
+
+class MessageHeader:
+    """Header preceding embedded data - data size, content type and optional fields. Optional fields with
+    non-default values are stored as (tag, length, value) records in an extension following the content type,
+    whose byte is then flagged by `EXTENDED_FLAG`. Header without optional fields is the original 5-byte header.
+
+    Versioned header starts with `MAGIC` and version and ends with CRC32 of the header, so that image without
+    embedded data (or with corrupted header) is rejected after reading its first channels. Its data are followed
+    by their digest (CRC32), verified while they are read. Header without magic (version 0) is the header of
+    earlier versions, it's embedded by legacy engine.
+
+        magic (4) | version (1) | size (4) | content type (1) | [extension size (2) | fields] | CRC32 (4)
+
+    Header is always embedded 1 bit per channel from the first channel, data follow it `depth` bits per channel
+    (in channel order, or scattered over the channels following the header).
+    """
+
+    MAGIC = b'\x89STG' # read as size of unversioned header it exceeds capacity of any image
+    VERSION = 1
+    CHECKSUM_FORMAT = '>I' # CRC32 of header and digest of data
+    EXTENDED_FLAG = 0x80 # set in content type byte when extension follows
+    EXTENSION_SIZE_LENGTH = 2 # number of bytes used for storing extension size
+    MAX_DEPTH = 4 # max number of bits embedded into one channel
+    PLAIN_LAYOUT = 1 # data are the (compressed) payload
+    CONTAINER_LAYOUT = 2 # data are chunk-indexed container of files, see container.py
+    SHARD_ID_LENGTH = 8 # number of bytes of random ID shared by shards of one payload
+    SHARD_FORMAT = '>HH' # index and count of shard
+    FRAME_FORMAT = '>I' # number of bytes (data and digest) held by a frame
+    MAX_FRAMES = 255 // struct.calcsize(FRAME_FORMAT) # number of frames whose sizes fit into one field
+
+    def __init__(self, size: int, contentType: ContentType, depth: int = 1, codec: Codec = Codec.NONE, keyDerivation: bytes = b'',
+                 cipherMode: CipherMode = CipherMode.CBC, layout: int = PLAIN_LAYOUT, shard: tuple[bytes, int, int] = None,
+                 scatter: bytes = b'', frames: list[int] = None, version: int = VERSION):
+        """
+        Args:
+            size (int): size of embedded data in bytes
+            contentType (ContentType): content type of embedded data
+            depth (int, optional): number of least significant bits of each channel holding data. Defaults to 1.
+            codec (Codec, optional): codec data were compressed with before encryption. Defaults to Codec.NONE.
+            keyDerivation (bytes, optional): record of key derivation from password. Defaults to b'' (password
+                padded to the key length).
+            cipherMode (CipherMode, optional): block cipher mode data were encrypted with. Defaults to CipherMode.CBC.
+            layout (int, optional): layout of data before encryption. Defaults to PLAIN_LAYOUT.
+            shard (tuple[bytes, int, int], optional): set ID, index and count of shard when data are a part of
+                encrypted payload split across images. Defaults to None (whole payload).
+            scatter (bytes, optional): salt of permutation of channels data are scattered over. Defaults to b''
+                (data follow the header in channel order).
+            frames (list[int], optional): number of bytes held by every frame when data are spread over frames
+                of multi-frame image, the first frame holds the header. Defaults to None (data are in the first frame).
+            version (int, optional): version of the header, 0 for header without magic, checksum and digest of
+                data. Defaults to VERSION.
+
+        Raises:
+            ValueError: when depth is out of range
+        """
+        if not 1 <= depth <= self.MAX_DEPTH:
+            raise ValueError(f'depth must be between 1 and {self.MAX_DEPTH}, not {depth}')
+
+        self.size = size
+        self.contentType = contentType
+        self.depth = depth
+        self.codec = codec
+        self.keyDerivation = keyDerivation
+        self.cipherMode = cipherMode
+        self.layout = layout
+        self.shard = shard
+        self.scatter = scatter
+        self.frames = frames
+        self.version = version
+
+
+    def to_bytes(self) -> bytes:
+        """Serialize header
+
+        Returns:
+            bytes: header
+        """
+        extension = b''.join(tag.value.to_bytes(1, 'big') + len(value).to_bytes(1, 'big') + value
+                             for tag, value in self._fields())
+        contentTypeByte = self.contentType.value | (self.EXTENDED_FLAG if extension else 0)
+        header = self.size.to_bytes(DATA_SIZE_BYTES, 'big') + contentTypeByte.to_bytes(MESSAGE_CONTENT_SIZE, 'big')
+
+        if extension:
+            header += len(extension).to_bytes(self.EXTENSION_SIZE_LENGTH, 'big') + extension
+        if self.version:
+            header = self.MAGIC + self.version.to_bytes(1, 'big') + header
+            header += struct.pack(self.CHECKSUM_FORMAT, zlib.crc32(header))
+        return header
+
+
+    def __len__(self) -> int:
+        return len(self.to_bytes())
+
+
+    def payload_offset(self) -> int:
+        """Position of the first bit of data - index of channel following the header times depth.
+
+        Returns:
+            int: position of the first data bit
+        """
+        return len(self) * 8 * self.depth
+
+
+    def channels(self) -> int:
+        """Number of channels holding header, data and their digest (their part held by the first frame, when
+        they are spread over frames)
+
+        Returns:
+            int: number of channels
+        """
+        storedSize = self.frames[0] if self.frames else self.stored_size()
+        return len(self) * 8 + -(-storedSize * 8 // self.depth)
+
+
+    def stored_size(self) -> int:
+        """Number of bytes embedded after the header - data and their digest
+
+        Returns:
+            int: number of bytes
+        """
+        return self.size + (struct.calcsize(self.CHECKSUM_FORMAT) if self.version else 0)
+
+
+    def digest(self, checksum: int) -> bytes:
+        """Digest embedded after data
+
+        Args:
+            checksum (int): CRC32 of the data
+
+        Returns:
+            bytes: digest, empty for header without version
+        """
+        return struct.pack(self.CHECKSUM_FORMAT, checksum) if self.version else b''
+
+
+    def _fields(self) -> list[tuple[HeaderField, bytes]]:
+        """Optional fields with non-default values
+
+        Returns:
+            list[tuple[HeaderField, bytes]]: tags and values
+        """
+        fields = []
+        if self.depth != 1:
+            fields.append((HeaderField.DEPTH, self.depth.to_bytes(1, 'big')))
+        if self.codec != Codec.NONE:
+            fields.append((HeaderField.CODEC, self.codec.value.to_bytes(1, 'big')))
+        if self.keyDerivation:
+            fields.append((HeaderField.KDF, self.keyDerivation))
+        if self.cipherMode != CipherMode.CBC:
+            fields.append((HeaderField.CIPHER, self.cipherMode.value.to_bytes(1, 'big')))
+        if self.layout != self.PLAIN_LAYOUT:
+            fields.append((HeaderField.LAYOUT, self.layout.to_bytes(1, 'big')))
+        if self.shard is not None:
+            setId, index, count = self.shard
+            fields.append((HeaderField.SHARD, setId + struct.pack(self.SHARD_FORMAT, index, count)))
+        if self.scatter:
+            fields.append((HeaderField.SCATTER, self.scatter))
+        if self.frames:
+            fields.append((HeaderField.FRAMES, b''.join(struct.pack(self.FRAME_FORMAT, size) for size in self.frames)))
+        return fields
+
+
+    @classmethod
+    def read(cls, readHeader: Callable[[int], bytes]) -> 'MessageHeader':
+        """Read header from the beginning of embedded bytes
+
+        Args:
+            readHeader (Callable[[int], bytes]): returns first n embedded bytes, called with growing n
+
+        Raises:
+            ValueError: when there is no header (image holds no embedded data), header is in wrong format,
+                of unsupported version or corrupted
+
+        Returns:
+            MessageHeader: header
+        """
+        # magic and version take as many bytes as unversioned header, so that clean image is rejected right away
+        header = readHeader(HEADER_SIZE)
+        version, start = 0, 0
+        if header[:len(cls.MAGIC)] == cls.MAGIC:
+            version, start = header[len(cls.MAGIC)], len(cls.MAGIC) + 1
+            if version > cls.VERSION:
+                raise ValueError(f'header version {version} is not supported, the newest supported is {cls.VERSION}')
+            header = readHeader(start + HEADER_SIZE)
+
+        try:
+            size = int.from_bytes(header[start:start + DATA_SIZE_BYTES], 'big')
+            contentTypeByte = header[start + DATA_SIZE_BYTES]
+            contentType = ContentType(contentTypeByte & ~cls.EXTENDED_FLAG)
+
+            fields = {}
+            end = start + HEADER_SIZE
+            if contentTypeByte & cls.EXTENDED_FLAG:
+                extensionStart = end + cls.EXTENSION_SIZE_LENGTH
+                extensionSize = int.from_bytes(readHeader(extensionStart)[end:], 'big')
+                end = extensionStart + extensionSize
+                extension = readHeader(end)[extensionStart:]
+
+                position = 0
+                while position < extensionSize:
+                    tag, length = HeaderField(extension[position]), extension[position + 1]
+                    fields[tag] = extension[position + 2:position + 2 + length]
+                    position += 2 + length
+        except (ValueError, IndexError):
+            raise ValueError('image holds no embedded data (or their header is corrupted)') from None
+
+        if version:
+            checksumLength = struct.calcsize(cls.CHECKSUM_FORMAT)
+            header = readHeader(end + checksumLength)
+            checksum, = struct.unpack(cls.CHECKSUM_FORMAT, header[end:end + checksumLength])
+            if checksum != zlib.crc32(header[:end]):
+                raise ValueError('header of embedded data is corrupted, its checksum doesn\'t match')
+
+        depth = int.from_bytes(fields.get(HeaderField.DEPTH, b'\x01'), 'big')
+        codec = Codec(int.from_bytes(fields.get(HeaderField.CODEC, b'\x00'), 'big'))
+        cipherMode = CipherMode(int.from_bytes(fields.get(HeaderField.CIPHER, CipherMode.CBC.value.to_bytes(1, 'big')), 'big'))
+        layout = int.from_bytes(fields.get(HeaderField.LAYOUT, cls.PLAIN_LAYOUT.to_bytes(1, 'big')), 'big')
+        shard = None
+        if HeaderField.SHARD in fields:
+            setId = fields[HeaderField.SHARD][:cls.SHARD_ID_LENGTH]
+            shard = (setId, *struct.unpack(cls.SHARD_FORMAT, fields[HeaderField.SHARD][cls.SHARD_ID_LENGTH:]))
+        frames = None
+        if HeaderField.FRAMES in fields:
+            frames = [size for size, in struct.iter_unpack(cls.FRAME_FORMAT, fields[HeaderField.FRAMES])]
+            if sum(frames) != size + (struct.calcsize(cls.CHECKSUM_FORMAT) if version else 0):
+                raise ValueError('header of embedded data is corrupted, sizes of its frames don\'t match its size')
+        return cls(size, contentType, depth, codec, fields.get(HeaderField.KDF, b''), cipherMode, layout, shard,
+                   fields.get(HeaderField.SCATTER, b''), frames, version)
+
+
+class DigestReader(io.RawIOBase):
+    """Binary stream of embedded data verifying their digest, which follows them in the wrapped stream. Digest is
+    checked as soon as the last data are read (before they are returned), so that data are verified in the same
+    pass that decrypts them.
+    """
+
+    def __init__(self, stream: BinaryIO, size: int):
+        """
+        Args:
+            stream (BinaryIO): stream of data followed by their digest
+            size (int): number of bytes of data
+        """
+        super().__init__()
+        self.stream = stream
+        self.remaining = size
+        self.checksum = 0
+
+
+    def readable(self) -> bool:
+        return True
+
+
+    def readinto(self, buffer) -> int:
+        """Read bytes of data into buffer
+
+        Args:
+            buffer (bytearray | memoryview): buffer to fill
+
+        Raises:
+            ValueError: when digest of the data doesn't match
+
+        Returns:
+            int: number of read bytes, 0 at the end of the data
+        """
+        if self.remaining == 0:
+            return 0
+        buffer = memoryview(buffer).cast('B')[:self.remaining]
+        size = self.stream.readinto(buffer)
+        if not size:
+            raise ValueError(f'embedded data end {self.remaining} bytes before their size')
+        self.checksum = zlib.crc32(buffer[:size], self.checksum)
+        self.remaining -= size
+
+        if self.remaining == 0:
+            digest = bytearray(struct.calcsize(MessageHeader.CHECKSUM_FORMAT))
+            position = 0
+            while position < len(digest):
+                length = self.stream.readinto(memoryview(digest)[position:])
+                if not length:
+                    break
+                position += length
+            if digest != struct.pack(MessageHeader.CHECKSUM_FORMAT, self.checksum):
+                raise ValueError('embedded data are corrupted, their digest doesn\'t match')
+        return size
@@ -0,0 +1,327 @@
+import io
+import os
+import zlib
+import numpy as np
+from PIL import Image
+from typing import BinaryIO, Union
+from bitplane import BitWriter, CoverLayout, extract_bits, extract_bytes
+from CipherMode import CipherMode
+from Codec import Codec
+from ContentType import ContentType
+from encoder import encode_image, image_format, preserve_source
+from Kdf import Kdf
+from MessageHeader import MessageHeader
+from scatter import SALT_LENGTH, ScatterPermutation, ScatterWriter, gather_bits, scatter_seed
+from service.CompressService import CompressService
+from service.EncryptService import EncryptService
+from service.KeyService import KeyService
+
+# Images are accepted as encoded bytes (bytes, bytearray, memoryview), binary file-like objects, paths,
+# pillow Images or arrays of shape (height, width, bands) or (height, width) - uint8, or uint16 of 16-bit grayscale.
+# Payloads are accepted as bytes-like objects, binary file-like objects or strings (embedded as ContentType.STRING).
+# Payloads are embedded into channels of cover layout of images, see CoverLayout.
+ImageInput = Union[bytes, bytearray, memoryview, BinaryIO, str, Image.Image, np.ndarray]
+PayloadInput = Union[bytes, bytearray, memoryview, BinaryIO, str]
+
+
+class Embedder:
+    """Embeds payloads into images in memory. Scratch buffers (pixels, encrypted payload, unpacked bits) are kept
+    between calls, so that embedding many payloads into same-sized covers doesn't allocate them again.
+
+        embedder = Embedder('5340mllJKlkdfs90')
+        stegoImage = embedder.embed(b'secret', 'wallpaper.png')
+    """
+
+    def __init__(self, secret: str = '', depth: int = 1, codec: Codec = Codec.NONE, autoCodec: bool = False, kdf: Kdf = Kdf.SCRYPT,
+                 cipherMode: CipherMode = CipherMode.CBC, scatter: bool = False):
+        """
+        Args:
+            secret (str, optional): secret password for encryption. Defaults to ''.
+            depth (int, optional): number of least significant bits of each channel holding data. Defaults to 1.
+            codec (Codec, optional): codec compressing payload before encryption. Defaults to Codec.NONE.
+            autoCodec (bool, optional): skip compression when payload is incompressible. Defaults to False.
+            kdf (Kdf, optional): key derivation function deriving encryption key from the secret. Defaults to Kdf.SCRYPT.
+            cipherMode (CipherMode, optional): block cipher mode of encryption. Defaults to CipherMode.CBC.
+            scatter (bool, optional): scatter payload over channels in order of permutation derived from the key.
+                Defaults to False.
+        """
+        self.secret = secret
+        self.depth = depth
+        self.codec = codec
+        self.autoCodec = autoCodec
+        self.kdf = kdf
+        self.cipherMode = cipherMode
+        self.scatter = scatter
+        self._pixels = None
+        self._layout = None
+        self._encrypted = bytearray()
+        self._writer = BitWriter(np.empty(0, dtype=np.uint8))
+        self._encryptService = EncryptService.get_instance()
+        self._compressService = CompressService.get_instance()
+        self._keyService = KeyService.get_instance()
+
+
+    def embed(self, payload: PayloadInput, cover: ImageInput) -> Image.Image:
+        """Embed payload into cover
+
+        Args:
+            payload (PayloadInput): data to embed, string is embedded as ContentType.STRING
+            cover (ImageInput): image to embed the payload into, it's left unchanged
+
+        Raises:
+            ValueError: when payload doesn't fit into cover
+
+        Returns:
+            pillow Image: image with embedded payload, with alpha and metadata of the cover (alpha left out of its
+                layout is put back)
+        """
+        cover = _open_image(cover)
+        pixels = self.embed_array(payload, cover)
+        # the pixel buffer is reused by the next call, the image gets its own copy
+        return preserve_source(self._layout.to_image(pixels.copy(), cover.size), cover, self._layout.mode)
+
+
+    def embed_array(self, payload: PayloadInput, cover: ImageInput) -> np.ndarray:
+        """Embed payload into cover, returning pixels without copying them
+
+        Args:
+            payload (PayloadInput): data to embed, string is embedded as ContentType.STRING
+            cover (ImageInput): image to embed the payload into, it's left unchanged
+
+        Raises:
+            ValueError: when payload doesn't fit into cover
+
+        Returns:
+            np.ndarray: array (height, width, bands) or (height, width) with embedded payload, reused (overwritten) by
+                the next call
+        """
+        data, contentType = _payload_bytes(payload)
+        pixels = self._load_pixels(cover)
+
+        codec = Codec.NONE
+        if self.codec != Codec.NONE:
+            compressed, compressedSize, codec = self._compressService.compress_stream(
+                io.BytesIO(data), len(data), self.codec, self.autoCodec, pixels.size * self.depth // 8)
+            data = compressed.read(compressedSize)
+
+        key, keyDerivation = self.secret, b''
+        if self.kdf != Kdf.NONE:
+            key, keyDerivation = self._keyService.new_key(self.secret, self.kdf)
+
+        encryptedSize = self._encryptService.encrypted_size(len(data), self.cipherMode.value)
+        scatter = os.urandom(SALT_LENGTH) if self.scatter else b''
+        header = MessageHeader(encryptedSize, contentType, self.depth, codec, keyDerivation, self.cipherMode, scatter=scatter)
+        if header.channels() > pixels.size:
+            raise ValueError(f'payload needs {header.channels()} channels, image has only {pixels.size}')
+
+        if len(self._encrypted) < encryptedSize:
+            self._encrypted = bytearray(encryptedSize)
+        encrypted = self._encryptService.encrypt_into(data, self._encrypted, key, self.cipherMode.value)
+
+        self._writer.reset(pixels.reshape(-1))
+        self._writer.write(header.to_bytes())
+        if header.scatter:
+            permutation = ScatterPermutation(scatter_seed(key, header.scatter), pixels.size - len(header) * 8)
+            writer = ScatterWriter(pixels.reshape(-1), header.depth, permutation, len(header) * 8)
+        else:
+            writer = self._writer
+            writer.set_depth(header.depth)
+        writer.write(encrypted)
+        writer.write(header.digest(zlib.crc32(encrypted)))
+        return pixels
+
+
+    def embed_bytes(self, payload: PayloadInput, cover: ImageInput, imageFormat: str = 'PNG', compressLevel: int = None) -> bytes:
+        """Embed payload into cover and encode the result
+
+        Args:
+            payload (PayloadInput): data to embed, string is embedded as ContentType.STRING
+            cover (ImageInput): image to embed the payload into, it's left unchanged
+            imageFormat (str, optional): lossless format of the result (PNG, WEBP, TIFF, BMP). Defaults to 'PNG'.
+            compressLevel (int, optional): compression level from 0 (fastest) to 9 (smallest) of PNG and WebP.
+                Defaults to None (PNG default).
+
+        Raises:
+            ValueError: when payload doesn't fit into cover or the format is lossy
+
+        Returns:
+            bytes: encoded image with embedded payload
+        """
+        imageFormat = image_format('', imageFormat)
+        output = io.BytesIO()
+        image = self.embed(payload, cover)
+        encode_image(image, output, imageFormat, compressLevel, image.info)
+        return output.getvalue()
+
+
+    def _load_pixels(self, cover: ImageInput) -> np.ndarray:
+        """Copy pixels of cover in its layout into the reused pixel buffer
+
+        Args:
+            cover (ImageInput): image
+
+        Returns:
+            np.ndarray: array (height, width, bands) or (height, width)
+        """
+        source, self._layout = _cover_pixels(cover)
+        if self._pixels is None or self._pixels.shape != source.shape or self._pixels.dtype != source.dtype:
+            self._pixels = np.empty(source.shape, dtype=source.dtype)
+        np.copyto(self._pixels, source)
+        return self._pixels
+
+
+class Extractor:
+    """Extracts payloads from images in memory. Buffer of extracted bits is kept between calls.
+
+        extractor = Extractor('5340mllJKlkdfs90')
+        payload, contentType = extractor.extract(stegoImage)
+    """
+
+    def __init__(self, secret: str = ''):
+        """
+        Args:
+            secret (str, optional): secret password for decryption. Defaults to ''.
+        """
+        self.secret = secret
+        self._bits = np.empty(0, dtype=np.uint8)
+        self._encryptService = EncryptService.get_instance()
+        self._compressService = CompressService.get_instance()
+        self._keyService = KeyService.get_instance()
+
+
+    def extract(self, image: ImageInput) -> tuple[bytes, ContentType]:
+        """Extract payload from image
+
+        Args:
+            image (ImageInput): image with embedded payload
+
+        Raises:
+            ValueError: when image doesn't contain embedded payload of the size in its header, when it holds
+                a shard, a container or a message spread over frames (see `EmbedService`), when the payload
+                doesn't match its digest, when the secret is wrong (detected only for payloads with key derivation
+                record), when GCM authentication fails
+
+        Returns:
+            tuple[bytes, ContentType]: payload, its content type
+        """
+        channels = _channels(image)
+        header = MessageHeader.read(lambda size: extract_bytes(channels, size))
+        if header.channels() > len(channels):
+            raise ValueError(f'payload needs {header.channels()} channels, image has only {len(channels)}')
+        _validate_payload(header)
+
+        key = self._keyService.record_key(self.secret, header.keyDerivation) if header.keyDerivation else self.secret
+        numberOfBits = header.stored_size() * 8
+        if header.scatter:
+            permutation = ScatterPermutation(scatter_seed(key, header.scatter), len(channels) - len(header) * 8)
+            bits = gather_bits(channels, numberOfBits, 0, header.depth, permutation, len(header) * 8)
+        else:
+            if len(self._bits) < numberOfBits:
+                self._bits = np.empty(numberOfBits, dtype=np.uint8)
+            bits = extract_bits(channels, numberOfBits, header.payload_offset(), header.depth, self._bits)
+        encrypted = memoryview(np.packbits(bits, bitorder='little'))
+        if header.digest(zlib.crc32(encrypted[:header.size])) != encrypted[header.size:]:
+            raise ValueError('embedded payload is corrupted, its digest doesn\'t match')
+        data = self._encryptService.decrypt_into(encrypted[:header.size], key, header.cipherMode.value)
+
+        if header.codec == Codec.NONE:
+            return bytes(data), header.contentType
+
+        output = io.BytesIO()
+        with self._compressService.decompress_into(output, header.codec) as decompressor:
+            decompressor.write(data)
+        return output.getvalue(), header.contentType
+
+
+    def extract_string(self, image: ImageInput) -> str:
+        """Extract payload from image and decode it as a string
+
+        Args:
+            image (ImageInput): image with embedded payload
+
+        Returns:
+            str: embedded string
+        """
+        data, _ = self.extract(image)
+        return data.decode('utf-8')
+
+
+def _validate_payload(header: MessageHeader) -> None:
+    """Validate that embedded data are whole payload in the image, other layouts are read by `EmbedService`
+
+    Args:
+        header (MessageHeader): header of embedded data
+
+    Raises:
+        ValueError: when the data are shard of payload split across more images, container of files or spread
+            over frames of multi-frame image
+    """
+    if header.shard is not None:
+        _, index, count = header.shard
+        raise ValueError(f'image holds shard {index + 1} of {count}, extract all shards of the set together')
+    if header.layout != MessageHeader.PLAIN_LAYOUT:
+        raise ValueError('image holds container of files, extract it by EmbedService')
+    if header.frames:
+        raise ValueError(f'embedded message is spread over {len(header.frames)} frames, extract it by EmbedService')
+
+
+def _payload_bytes(payload: PayloadInput) -> tuple[bytes, ContentType]:
+    """Convert payload into bytes-like object
+
+    Args:
+        payload (PayloadInput): payload
+
+    Returns:
+        tuple[bytes, ContentType]: bytes-like object, content type
+    """
+    if isinstance(payload, str):
+        return payload.encode('utf-8'), ContentType.STRING
+    if isinstance(payload, (bytes, bytearray, memoryview)):
+        return payload, ContentType.FILE
+    return payload.read(), ContentType.FILE
+
+
+def _open_image(image: ImageInput) -> Image.Image:
+    """Open image of any accepted type except array
+
+    Args:
+        image (ImageInput): image
+
+    Returns:
+        pillow Image: image
+    """
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(image))
+    return Image.open(image)
+
+
+def _cover_pixels(image: ImageInput) -> tuple[np.ndarray, CoverLayout]:
+    """Pixels of image in its cover layout, arrays in the layout are returned without copying
+
+    Args:
+        image (ImageInput): image
+
+    Returns:
+        tuple[np.ndarray, CoverLayout]: array (height, width, bands) or (height, width), layout
+    """
+    pillowImage = _open_image(image)
+    layout = CoverLayout.of(pillowImage)
+    if isinstance(image, np.ndarray) and pillowImage.mode == layout.mode:
+        return image, layout
+    return np.asarray(layout.convert(pillowImage)), layout
+
+
+def _channels(image: ImageInput) -> np.ndarray:
+    """Flat channel values of image in its cover layout, arrays are viewed without copying
+
+    Args:
+        image (ImageInput): image
+
+    Returns:
+        np.ndarray: flat array of channel values (R, G, B, R, G, B, ...)
+    """
+    return np.ascontiguousarray(_cover_pixels(image)[0]).reshape(-1)
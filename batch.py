@@ -0,0 +1,126 @@
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import TextIO
+from service.EmbedService import EmbedService
+from service.EncryptService import EncryptService
+
+# Manifest is a JSON lines file, one job per line with keys named after command line options:
+#   {"operation": "embed", "input_file": "cover.png", "output_file": "out.png", "file_content": "secret.pdf", "password": "..."}
+#   {"operation": "embed", "input_file": "cover.png", "output_file": "out.png", "string_content": "hello", "password": "..."}
+#   {"operation": "embed", "input_file": "cover.png", "output_file": "out.png", "file_content": ["a.pdf", "b.pdf"], "password": "..."}
+#   {"operation": "extract", "input_file": "out.png", "output_file": "secret.pdf", "password": "..."}
+
+PENDING_JOBS_PER_WORKER = 4 # number of jobs submitted ahead, bounds memory used by a long manifest
+
+log = logging.getLogger('Batch')
+
+
+def run_batch(manifestPath: str, poolSize: int, settings: dict, chunkSize: int, report: TextIO) -> dict:
+    """Run jobs of manifest in a pool of worker processes. Every worker configures its services once and reuses
+    them for all its jobs. Failure of a job is reported and doesn't stop the other jobs.
+
+    Args:
+        manifestPath (str): path to the manifest, - reads it from standard input
+        poolSize (int): number of worker processes
+        settings (dict): attributes of `EmbedService` set in every worker
+        chunkSize (int): number of bytes encrypted and decrypted at once
+        report (TextIO): stream to write result of every job to, one JSON object per line
+
+    Returns:
+        dict: summary - number of jobs, failed jobs, seconds, jobs per second, MB per second
+    """
+    start = time.perf_counter()
+    jobs = failed = processedBytes = 0
+    manifest = sys.stdin if manifestPath == '-' else open(manifestPath)
+
+    with manifest, ProcessPoolExecutor(poolSize, initializer=configure_services, initargs=(settings, chunkSize)) as executor:
+        pending = set()
+        for lineNumber, line in enumerate(manifest, 1):
+            if not line.strip():
+                continue
+            pending.add(executor.submit(_run_job, lineNumber, line))
+
+            if len(pending) >= poolSize * PENDING_JOBS_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for result in (task.result() for task in done):
+                    jobs, failed, processedBytes = jobs + 1, failed + (not result['ok']), processedBytes + result['bytes']
+                    report.write(json.dumps(result) + '\n')
+
+        for result in (task.result() for task in wait(pending).done):
+            jobs, failed, processedBytes = jobs + 1, failed + (not result['ok']), processedBytes + result['bytes']
+            report.write(json.dumps(result) + '\n')
+    report.flush()
+
+    seconds = time.perf_counter() - start
+    summary = {
+        'jobs': jobs,
+        'failed': failed,
+        'seconds': seconds,
+        'jobs_per_s': jobs / seconds,
+        'mb_per_s': processedBytes / 1000 / 1000 / seconds,
+    }
+    log.info(f'📦 {jobs} jobs ({failed} failed) in {seconds:.2f} s - {summary["jobs_per_s"]:.1f} jobs/s, {summary["mb_per_s"]:.2f} MB/s')
+    return summary
+
+
+def configure_services(settings: dict, chunkSize: int) -> None:
+    """Configure services of worker process (of batch or server)
+
+    Args:
+        settings (dict): attributes of `EmbedService`
+        chunkSize (int): number of bytes encrypted and decrypted at once
+    """
+    embedService = EmbedService.get_instance()
+    for name, value in settings.items():
+        setattr(embedService, name, value)
+    EncryptService.get_instance().set_chunk_size(chunkSize)
+
+
+def _run_job(lineNumber: int, line: str) -> dict:
+    """Run job described by line of manifest, executed in worker process
+
+    Args:
+        lineNumber (int): number of the line in manifest
+        line (str): JSON object describing the job
+
+    Returns:
+        dict: result - line number, operation, input file, success, error, seconds and number of processed bytes
+    """
+    start = time.perf_counter()
+    result = {'line': lineNumber, 'operation': None, 'input_file': None, 'ok': False, 'error': None, 'bytes': 0}
+    embedService = EmbedService.get_instance()
+
+    try:
+        job = json.loads(line)
+        operation = job.get('operation', 'embed')
+        result.update(operation=operation, input_file=job.get('input_file'))
+        password = job.get('password', '')
+
+        if operation == 'embed' and job.get('string_content') is not None:
+            result['ok'] = embedService.embed_string(job['string_content'], job['input_file'], job['output_file'], password)
+            result['bytes'] = len(job['string_content'].encode('utf-8'))
+        elif operation == 'embed' and isinstance(job.get('file_content'), list):
+            result['ok'] = embedService.embed_files(job['file_content'], job['input_file'], job['output_file'], password)
+            result['bytes'] = sum(os.path.getsize(path) for path in job['file_content'])
+        elif operation == 'embed' and job.get('file_content') is not None:
+            result['ok'] = embedService.embed_file(job['file_content'], job['input_file'], job['output_file'], password)
+            result['bytes'] = os.path.getsize(job['file_content'])
+        elif operation == 'extract':
+            embedService.get_embedded_message(job['input_file'], job.get('output_file', ''), password)
+            result['ok'] = True
+            if job.get('output_file') and os.path.exists(job['output_file']):
+                result['bytes'] = os.path.getsize(job['output_file'])
+        else:
+            raise ValueError(f'job must be an embed with file_content or string_content, or an extract, not {operation}')
+
+        if not result['ok']:
+            result['error'], result['bytes'] = 'content doesn\'t fit into input image', 0
+    except Exception as exception:
+        result['error'] = f'{type(exception).__name__}: {exception}'
+
+    result['seconds'] = time.perf_counter() - start
+    return result
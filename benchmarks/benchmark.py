@@ -0,0 +1,292 @@
+"""Benchmarks of embedding, extraction and encryption hot paths.
+
+Generates synthetic covers and payloads, times `EmbedService.embed_string`, `embed_file`, `get_embedded_message`
+and `EncryptService.encrypt_file`, `decrypt_file` separately, each case in a fresh process so that its peak
+memory can be measured. Results are written as JSON and optionally compared with a stored baseline.
+
+    python benchmarks/benchmark.py --output results.json --baseline baseline.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+
+MEGA = 1000 * 1000
+UNITS = {'K': 1024, 'M': 1024 * 1024, 'G': 1024 * 1024 * 1024}
+DEFAULT_COVERS = '1,10' # megapixels
+DEFAULT_PAYLOADS = '1K,1M'
+FULL_COVERS = '1,10,50,100'
+FULL_PAYLOADS = '1K,1M,10M,100M'
+PASSWORD = 'benchmark'
+
+log = logging.getLogger('Benchmark')
+
+
+def parse_size(size: str) -> int:
+    """Parse size with optional K, M or G suffix
+
+    Args:
+        size (str): size, e.g. 1K, 10M
+
+    Returns:
+        int: size in bytes
+    """
+    size = size.strip().upper()
+    if size[-1] in UNITS:
+        return int(float(size[:-1]) * UNITS[size[-1]])
+    return int(size)
+
+
+def create_cover(directory: str, megapixels: float) -> str:
+    """Create synthetic noise cover image (with 4:3 aspect ratio) unless it already exists
+
+    Args:
+        directory (str): directory to store the cover into
+        megapixels (float): number of pixels in millions
+
+    Returns:
+        str: path to the cover
+    """
+    path = os.path.join(directory, f'cover_{megapixels}mp.png')
+    if not os.path.exists(path):
+        width = int((megapixels * MEGA * 4 / 3) ** 0.5)
+        height = int(megapixels * MEGA) // width
+        pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+        Image.fromarray(pixels, 'RGB').save(path, compress_level=1)
+    return path
+
+
+def create_payload(directory: str, size: int) -> str:
+    """Create synthetic payload file of printable characters unless it already exists. Printable characters
+    make the same payload usable for `embed_string`.
+
+    Args:
+        directory (str): directory to store the payload into
+        size (int): payload size in bytes
+
+    Returns:
+        str: path to the payload
+    """
+    path = os.path.join(directory, f'payload_{size}.bin')
+    if not os.path.exists(path):
+        characters = np.random.default_rng(1).integers(ord('a'), ord('z') + 1, size, dtype=np.uint8)
+        with open(path, 'wb') as payload:
+            payload.write(characters.tobytes())
+    return path
+
+
+def fits(coverPath: str, payloadSize: int, depth: int) -> bool:
+    """Check whether payload fits into the cover
+
+    Args:
+        coverPath (str): path to the cover
+        payloadSize (int): payload size in bytes
+        depth (int): number of bits embedded into one channel
+
+    Returns:
+        bool: True if payload fits
+    """
+    from service.EmbedService import EmbedService
+    from bitplane import CoverLayout
+    from ContentType import ContentType
+    embedService = EmbedService.get_instance()
+    embedService.depth = depth
+    cover = Image.open(coverPath)
+    return embedService._validate_size(CoverLayout.of(cover).number_of_channels(cover.size), payloadSize, ContentType.FILE)
+
+
+def run_case(operation: str, coverPath: str, payloadPath: str, stegoPath: str, depth: int, repeat: int) -> dict:
+    """Run one benchmark case, executed in a fresh process
+
+    Args:
+        operation (str): name of benchmarked operation
+        coverPath (str): path to the cover, None for encryption operations
+        payloadPath (str): path to the payload
+        stegoPath (str): path to the image with embedded payload (output of embedding, input of extraction)
+        depth (int): number of bits embedded into one channel
+        repeat (int): number of repetitions, the fastest is reported
+
+    Returns:
+        dict: measured values
+    """
+    logging.disable(logging.CRITICAL)
+    from service.EmbedService import EmbedService
+    from service.EncryptService import EncryptService
+    embedService = EmbedService.get_instance()
+    embedService.depth = depth
+    encryptService = EncryptService.get_instance()
+    encryptedPath, decryptedPath, extractedPath = stegoPath + '.encrypted', stegoPath + '.decrypted', stegoPath + '.extracted'
+
+    if operation == 'embed_string':
+        with open(payloadPath, 'r') as payload:
+            plainText = payload.read()
+        task = lambda: embedService.embed_string(plainText, coverPath, stegoPath + '.string.png', PASSWORD)
+    elif operation == 'embed_file':
+        task = lambda: embedService.embed_file(payloadPath, coverPath, stegoPath, PASSWORD)
+    elif operation == 'get_embedded_message':
+        task = lambda: embedService.get_embedded_message(stegoPath, extractedPath, PASSWORD)
+    elif operation == 'encrypt_file':
+        task = lambda: encryptService.encrypt_file(payloadPath, encryptedPath, PASSWORD)
+    elif operation == 'decrypt_file':
+        task = lambda: encryptService.decrypt_file(encryptedPath, decryptedPath, PASSWORD)
+    else:
+        raise ValueError(f'unknown operation {operation}')
+
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        task()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    return {
+        'seconds': seconds,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, # kilobytes on Linux
+    }
+
+
+def run_benchmarks(coverSizes: list[float], payloadSizes: list[int], depth: int, repeat: int, directory: str) -> list[dict]:
+    """Run all benchmark cases
+
+    Args:
+        coverSizes (list[float]): cover sizes in megapixels
+        payloadSizes (list[int]): payload sizes in bytes
+        depth (int): number of bits embedded into one channel
+        repeat (int): number of repetitions of each case
+        directory (str): directory for generated files
+
+    Returns:
+        list[dict]: results
+    """
+    cases = []
+    for payloadSize in payloadSizes:
+        payloadPath = create_payload(directory, payloadSize)
+        stegoPath = os.path.join(directory, f'crypto_{payloadSize}')
+        cases += [(operation, None, payloadPath, payloadSize, stegoPath) for operation in ['encrypt_file', 'decrypt_file']]
+
+        for megapixels in coverSizes:
+            coverPath = create_cover(directory, megapixels)
+            if not fits(coverPath, payloadSize, depth):
+                log.info(f'payload of {payloadSize} B doesn\'t fit into {megapixels} MP cover, skipped')
+                continue
+            stegoPath = os.path.join(directory, f'stego_{megapixels}mp_{payloadSize}.png')
+            cases += [(operation, coverPath, payloadPath, payloadSize, stegoPath)
+                      for operation in ['embed_string', 'embed_file', 'get_embedded_message']]
+
+    results = []
+    for operation, coverPath, payloadPath, payloadSize, stegoPath in cases:
+        with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as executor:
+            measured = executor.submit(run_case, operation, coverPath, payloadPath, stegoPath, depth, repeat).result()
+
+        pixels = Image.open(coverPath).width * Image.open(coverPath).height if coverPath else 0
+        result = {
+            'name': operation,
+            'pixels': pixels,
+            'payload_bytes': payloadSize,
+            'depth': depth,
+            **measured,
+            'mb_per_s': payloadSize / MEGA / measured['seconds'],
+            'pixels_per_s': pixels / measured['seconds'],
+        }
+        results.append(result)
+        log.info(f'{operation:22} {pixels / MEGA:6.1f} MP {payloadSize:>11} B  {measured["seconds"]:8.3f} s  '
+                 f'{result["mb_per_s"]:9.2f} MB/s  {result["pixels_per_s"] / MEGA:8.2f} MP/s  {measured["peak_rss_mb"]:8.1f} MB')
+    return results
+
+
+def case_key(result: dict) -> tuple:
+    return result['name'], result['pixels'], result['payload_bytes'], result['depth']
+
+
+def compare(results: list[dict], baseline: list[dict], threshold: float) -> list[dict]:
+    """Compare results with baseline
+
+    Args:
+        results (list[dict]): current results
+        baseline (list[dict]): baseline results
+        threshold (float): allowed relative slowdown, e.g. 0.1 for 10 %
+
+    Returns:
+        list[dict]: regressed results with `baseline_seconds` and `slowdown` added
+    """
+    baselineByKey = {case_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        reference = baselineByKey.get(case_key(result))
+        if reference is None:
+            continue
+        slowdown = result['seconds'] / reference['seconds'] - 1
+        if slowdown > threshold:
+            regressions.append({**result, 'baseline_seconds': reference['seconds'], 'slowdown': slowdown})
+    return regressions
+
+
+def environment() -> dict:
+    """Versions of interpreter and libraries the results were measured with
+
+    Returns:
+        dict: environment description
+    """
+    import PIL
+    import Crypto
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'pillow': PIL.__version__,
+        'pycryptodome': Crypto.__version__,
+        'numpy': np.__version__,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Steganography benchmarks')
+    parser.add_argument('--covers', type=str, default=DEFAULT_COVERS, help='Comma separated cover sizes in megapixels.')
+    parser.add_argument('--payloads', type=str, default=DEFAULT_PAYLOADS, help='Comma separated payload sizes (with K, M, G suffix).')
+    parser.add_argument('--full', action='store_true', help=f'Use covers {FULL_COVERS} MP and payloads {FULL_PAYLOADS}.')
+    parser.add_argument('-d', '--depth', type=int, default=1, choices=range(1, 5), help='Number of bits embedded into one channel.')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of repetitions of each case, the fastest is reported.')
+    parser.add_argument('--work-dir', type=str, help='Directory for generated covers and payloads (reused between runs).')
+    parser.add_argument('-o', '--output', type=str, help='File to write JSON results to.')
+    parser.add_argument('--baseline', type=str, help='JSON results to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.1, help='Allowed relative slowdown against baseline.')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(message)s', stream=sys.stderr)
+    log.setLevel(logging.INFO)
+    coverSizes = [float(size) for size in (FULL_COVERS if args.full else args.covers).split(',')]
+    payloadSizes = [parse_size(size) for size in (FULL_PAYLOADS if args.full else args.payloads).split(',')]
+
+    directory = args.work_dir or tempfile.mkdtemp(prefix='steganography-benchmark-')
+    os.makedirs(directory, exist_ok=True)
+    results = run_benchmarks(coverSizes, payloadSizes, args.depth, args.repeat, directory)
+
+    report = {'environment': environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            regressions = compare(results, json.load(baselineFile)['results'], args.threshold)
+        for regression in regressions:
+            log.error(f'🚨 regression {regression["name"]} {regression["pixels"] / MEGA:.1f} MP {regression["payload_bytes"]} B: '
+                      f'{regression["seconds"]:.3f} s vs {regression["baseline_seconds"]:.3f} s (+{regression["slowdown"]:.0%})')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
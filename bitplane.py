@@ -0,0 +1,521 @@
+import io
+import numpy as np
+from typing import BinaryIO
+from PIL import Image
+
+# Bits are addressed by position = channel index * depth + bit plane, where depth is the number of least
+# significant bits of each channel holding data. With depth 1 position is the channel index. Channels are the
+# samples of the image in its cover layout (R, G, B, A, R, G, B, A, ... or L, L, ...), 8 or 16 bits each.
+
+BIT_SHIFTS = np.arange(8, dtype=np.uint8) # shifts extracting bits of a byte starting from the least significant bit
+COVER_MODES = ('L', 'LA', 'RGB', 'RGBA', 'I;16') # modes whose channels hold data as they are, others are converted to RGB(A)
+OPAQUE_ALPHA = 16 # alpha holds data only if it's at least this in every pixel - 2 ** max depth, see CoverLayout
+
+
+def bytes_to_bits(data: bytes) -> np.ndarray:
+    """Convert bytes into array of bits, each byte starting from the least significant bit.
+
+    Args:
+        data (bytes): data to convert
+
+    Returns:
+        np.ndarray: uint8 array of bits (0 or 1), 8 bits per input byte
+    """
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder='little')
+
+
+def embed_bits(channels: np.ndarray, bits: np.ndarray, offset: int = 0, depth: int = 1) -> None:
+    """Embed bits into the least significant bits of channels in place, bit plane by bit plane.
+
+    Args:
+        channels (np.ndarray): flat uint8 or uint16 array of channel values (R, G, B, R, G, B, ...)
+        bits (np.ndarray): bits to embed
+        offset (int, optional): position of the first bit. Defaults to 0.
+        depth (int, optional): number of bits embedded into one channel. Defaults to 1.
+
+    Raises:
+        ValueError: when bits don't fit into channels
+    """
+    end = offset + len(bits)
+    if end > len(channels) * depth:
+        raise ValueError(f'{len(bits)} bits don\'t fit into {len(channels) * depth - offset} bit positions')
+
+    for plane in range(depth):
+        first = (plane - offset) % depth
+        planeBits = bits[first::depth]
+        start = (offset + first) // depth
+        target = channels[start:start + len(planeBits)]
+        target &= ~channels.dtype.type(1 << plane)
+        target |= planeBits << plane if plane else planeBits
+
+
+def extract_bits(channels: np.ndarray, count: int, offset: int = 0, depth: int = 1, out: np.ndarray = None) -> np.ndarray:
+    """Extract bits from the least significant bits of channels.
+
+    Args:
+        channels (np.ndarray): flat uint8 or uint16 array of channel values
+        count (int): number of bits to extract
+        offset (int, optional): position of the first bit. Defaults to 0.
+        depth (int, optional): number of bits embedded into one channel. Defaults to 1.
+        out (np.ndarray, optional): uint8 array of at least `count` items to extract the bits into. Defaults to None.
+
+    Raises:
+        ValueError: when channels don't contain enough bits
+
+    Returns:
+        np.ndarray: extracted bits
+    """
+    end = offset + count
+    if end > len(channels) * depth:
+        raise ValueError(f'{count} bits can\'t be extracted from {len(channels) * depth - offset} bit positions')
+
+    if depth == 1 and channels.dtype == np.uint8:
+        return np.bitwise_and(channels[offset:end], 1, out=None if out is None else out[:count])
+
+    bits = np.empty(count, dtype=np.uint8) if out is None else out[:count]
+    for plane in range(depth):
+        first = (plane - offset) % depth
+        planeBits = bits[first::depth]
+        start = (offset + first) // depth
+        np.right_shift(channels[start:start + len(planeBits)], plane, out=planeBits)
+        planeBits &= 1
+    return bits
+
+
+def extract_bytes(channels: np.ndarray, size: int, offset: int = 0, depth: int = 1) -> bytes:
+    """Extract bytes from the least significant bits of channels. Bulk counterpart of reading
+    `hidden_bits_generator` bit by bit.
+
+    Args:
+        channels (np.ndarray): flat uint8 or uint16 array of channel values
+        size (int): number of bytes to extract
+        offset (int, optional): position of the first bit. Defaults to 0.
+        depth (int, optional): number of bits embedded into one channel. Defaults to 1.
+
+    Raises:
+        ValueError: when channels don't contain enough bits
+
+    Returns:
+        bytes: extracted bytes
+    """
+    return np.packbits(extract_bits(channels, size * 8, offset, depth), bitorder='little').tobytes()
+
+
+class BitWriter:
+    """Writes bytes into the least significant bits of channels, chunk after chunk. Bits of each chunk
+    are unpacked into a reused buffer.
+    """
+
+    def __init__(self, channels: np.ndarray, offset: int = 0, depth: int = 1):
+        """
+        Args:
+            channels (np.ndarray): flat array of channel values to write into
+            offset (int, optional): position of the first bit to write. Defaults to 0.
+            depth (int, optional): number of bits written into one channel. Defaults to 1.
+        """
+        self._bits = np.empty((0, 8), dtype=np.uint8)
+        self.reset(channels, offset, depth)
+
+
+    def reset(self, channels: np.ndarray, offset: int = 0, depth: int = 1) -> None:
+        """Start writing into other channels, the unpacking buffer is kept.
+
+        Args:
+            channels (np.ndarray): flat array of channel values to write into
+            offset (int, optional): position of the first bit to write. Defaults to 0.
+            depth (int, optional): number of bits written into one channel. Defaults to 1.
+        """
+        self.channels = channels
+        self.offset = offset
+        self.depth = depth
+
+
+    def write(self, data: bytes) -> int:
+        """Write data into channels following previously written data.
+
+        Args:
+            data (bytes): data to write
+
+        Raises:
+            ValueError: when data don't fit into channels
+
+        Returns:
+            int: number of written bytes
+        """
+        self.write_bits(self.unpack(data))
+        return len(data)
+
+
+    def write_bits(self, bits: np.ndarray) -> None:
+        """Write bits into channels following previously written bits.
+
+        Args:
+            bits (np.ndarray): bits to write
+
+        Raises:
+            ValueError: when bits don't fit into channels
+        """
+        embed_bits(self.channels, bits, self.offset, self.depth)
+        self.offset += len(bits)
+
+
+    def set_depth(self, depth: int) -> None:
+        """Change number of bits written into one channel, following data start at the next whole channel.
+
+        Args:
+            depth (int): number of bits written into one channel
+        """
+        self.offset = -(-self.offset // self.depth) * depth
+        self.depth = depth
+
+
+    def unpack(self, data: bytes) -> np.ndarray:
+        """Unpack data into bits stored in the reused buffer
+
+        Args:
+            data (bytes): data to unpack
+
+        Returns:
+            np.ndarray: bits, valid until the next call
+        """
+        size = len(data)
+        if size > len(self._bits):
+            self._bits = np.empty((size, 8), dtype=np.uint8)
+
+        bits = self._bits[:size]
+        np.right_shift(np.frombuffer(data, dtype=np.uint8)[:, None], BIT_SHIFTS, out=bits)
+        bits &= 1
+        return bits.reshape(-1)
+
+
+class StripWriter(BitWriter):
+    """Writes bytes into the least significant bits of image channels strip by strip. Only one strip of rows
+    is held as an array, modified strips are pasted back into the image in place, rows following the data
+    are never touched.
+    """
+
+    def __init__(self, image: Image.Image, layout: 'CoverLayout', stripRows: int):
+        """
+        Args:
+            image (pillow Image): image in mode of the layout to write into
+            layout (CoverLayout): layout of the image
+            stripRows (int): number of rows in a strip
+        """
+        super().__init__(np.empty(0, dtype=layout.dtype))
+        self.image = image
+        self.stripRows = stripRows
+        self.layout = layout
+        self.top = 0 # first row of the current strip
+
+
+    def write_bits(self, bits: np.ndarray) -> None:
+        """Write bits into channels following previously written bits, loading strips as needed.
+
+        Args:
+            bits (np.ndarray): bits to write
+
+        Raises:
+            ValueError: when bits don't fit into image
+        """
+        written = 0
+
+        while written < len(bits):
+            if self.offset >= len(self.channels) * self.depth:
+                self.flush()
+                self.channels = read_strip(self.image, self.top, self.stripRows, self.layout)
+
+            count = min(len(bits) - written, len(self.channels) * self.depth - self.offset)
+            embed_bits(self.channels, bits[written:written + count], self.offset, self.depth)
+            self.offset += count
+            written += count
+
+
+    def flush(self) -> None:
+        """Paste the current strip back into the image and move to the next one."""
+        if len(self.channels) == 0:
+            return
+
+        rows = len(self.channels) // self.layout.number_of_channels((self.image.width, 1))
+        self.image.paste(self.layout.to_image(self.channels, (self.image.width, rows)), (0, self.top))
+        self.top += rows
+        self.offset -= len(self.channels) * self.depth
+        self.channels = np.empty(0, dtype=self.layout.dtype)
+
+
+class BitReader(io.RawIOBase):
+    """Binary stream reading bytes from the least significant bits of channels."""
+
+    def __init__(self, channels: np.ndarray, size: int, offset: int = 0, depth: int = 1):
+        """
+        Args:
+            channels (np.ndarray): flat array of channel values to read from
+            size (int): number of bytes in the stream
+            offset (int, optional): position of the first bit to read. Defaults to 0.
+            depth (int, optional): number of bits read from one channel. Defaults to 1.
+        """
+        super().__init__()
+        self.channels = channels
+        self.offset = offset
+        self.depth = depth
+        self.remaining = size
+
+
+    def readable(self) -> bool:
+        return True
+
+
+    def readinto(self, buffer) -> int:
+        """Read bytes into buffer.
+
+        Args:
+            buffer (bytearray | memoryview): buffer to fill
+
+        Returns:
+            int: number of read bytes, 0 at the end of the stream
+        """
+        size = min(len(buffer), self.remaining, (len(self.channels) * self.depth - self.offset) // 8)
+        buffer[:size] = extract_bytes(self.channels, size, self.offset, self.depth)
+        self.offset += size * 8
+        self.remaining -= size
+        return size
+
+
+class StripReader(BitReader):
+    """Binary stream reading bytes from the least significant bits of image channels strip by strip,
+    only one strip of rows is held as an array.
+    """
+
+    def __init__(self, image: Image.Image, layout: 'CoverLayout', stripRows: int, size: int, offset: int = 0, depth: int = 1):
+        """
+        Args:
+            image (pillow Image): image to read from
+            layout (CoverLayout): layout of the image
+            stripRows (int): number of rows in a strip, multiple of 8 so that no byte spans two strips
+            size (int): number of bytes in the stream
+            offset (int, optional): position of the first bit to read, multiple of 8. Defaults to 0.
+            depth (int, optional): number of bits read from one channel. Defaults to 1.
+        """
+        super().__init__(np.empty(0, dtype=layout.dtype), size, offset, depth)
+        self.image = image
+        self.layout = layout
+        self.stripRows = stripRows
+        self.top = 0 # first row of the next strip
+
+
+    def readinto(self, buffer) -> int:
+        """Read bytes into buffer, loading the next strip when the current one is exhausted.
+
+        Args:
+            buffer (bytearray | memoryview): buffer to fill
+
+        Returns:
+            int: number of read bytes, 0 at the end of the stream
+        """
+        while self.remaining and self.offset >= len(self.channels) * self.depth:
+            self.offset -= len(self.channels) * self.depth
+            self.channels = read_strip(self.image, self.top, self.stripRows, self.layout)
+            self.top += self.stripRows
+        return super().readinto(buffer)
+
+
+class CoverLayout:
+    """Mode of channels holding data. L, LA, RGB, RGBA and I;16 (16-bit grayscale) images hold data in their own
+    channels, images of other modes are converted to RGB (RGBA when they have alpha). Alpha holds data only when
+    it's opaque-safe - at least `OPAQUE_ALPHA` in every pixel. Such alpha stays so whatever is embedded into its
+    low bits, so image with embedded data has the same layout, no transparent pixel shows up and no visible one
+    disappears. Otherwise alpha is left out (and put back into image with embedded data).
+    """
+
+    def __init__(self, mode: str):
+        """
+        Args:
+            mode (str): pillow mode of channels holding data, one of `COVER_MODES`
+        """
+        self.mode = mode
+        self.bands = Image.getmodebands(mode)
+        self.dtype = np.dtype(np.uint16 if mode == 'I;16' else np.uint8)
+
+
+    @classmethod
+    def of(cls, image: Image.Image) -> 'CoverLayout':
+        """Layout of image, alpha is checked by decoding the whole image
+
+        Args:
+            image (pillow Image): cover or image with embedded data
+
+        Returns:
+            CoverLayout: layout
+        """
+        layouts = cls.candidates(image)
+        if len(layouts) > 1 and image.getextrema()[-1][0] < OPAQUE_ALPHA:
+            return layouts[1]
+        return layouts[0]
+
+
+    @classmethod
+    def candidates(cls, image: Image.Image) -> list['CoverLayout']:
+        """Possible layouts of image known without decoding it - with alpha and without it for images having alpha
+
+        Args:
+            image (pillow Image): cover or image with embedded data
+
+        Returns:
+            list[CoverLayout]: layouts, the one with alpha first
+        """
+        mode = image.mode if image.mode in COVER_MODES else 'RGBA' if 'A' in image.getbands() else 'RGB'
+        return [cls(mode), cls(mode[:-1])] if mode.endswith('A') else [cls(mode)]
+
+
+    def number_of_channels(self, imageSize: tuple[int, int]) -> int:
+        """Number of channels holding data
+
+        Args:
+            imageSize (tuple[int, int]): width and height of the image
+
+        Returns:
+            int: number of channels
+        """
+        width, height = imageSize
+        return width * height * self.bands
+
+
+    def convert(self, image: Image.Image) -> Image.Image:
+        """Convert image to mode of the layout, image of that mode is returned as it is (conversion would copy it).
+
+        Args:
+            image (pillow Image): image
+
+        Returns:
+            pillow Image: image in mode of the layout
+        """
+        return image if image.mode == self.mode else image.convert(self.mode)
+
+
+    def to_image(self, channels: np.ndarray, imageSize: tuple[int, int]) -> Image.Image:
+        """Create image of channel values
+
+        Args:
+            channels (np.ndarray): channel values of the whole image
+            imageSize (tuple[int, int]): width and height of the image
+
+        Returns:
+            pillow Image: image in mode of the layout
+        """
+        width, height = imageSize
+        return Image.fromarray(channels.reshape((height, width) if self.bands == 1 else (height, width, self.bands)))
+
+
+def to_rgb(image: Image.Image) -> Image.Image:
+    """Convert image to RGB, RGB image is returned as it is (conversion would copy it).
+
+    Args:
+        image (pillow Image): image
+
+    Returns:
+        pillow Image: RGB image
+    """
+    return image if image.mode == 'RGB' else image.convert('RGB')
+
+
+def read_strip(image: Image.Image, top: int, stripRows: int, layout: CoverLayout) -> np.ndarray:
+    """Read channel values of a strip of rows, converting only this strip to mode of the layout.
+
+    Args:
+        image (pillow Image): image to read from
+        top (int): first row of the strip
+        stripRows (int): number of rows in the strip
+        layout (CoverLayout): layout of the image
+
+    Raises:
+        ValueError: when the strip starts below the image
+
+    Returns:
+        np.ndarray: flat array of channel values (R, G, B, R, G, B, ...)
+    """
+    if top >= image.height:
+        raise ValueError(f'image has only {image.height} rows, data don\'t fit into it')
+
+    strip = image.crop((0, top, image.width, min(top + stripRows, image.height)))
+    return np.array(layout.convert(strip)).reshape(-1)
+
+
+def decode_rows(image: Image.Image, rows: int) -> Image.Image:
+    """Decode only the first rows of image that isn't loaded yet, where its tiles allow it - PNG that isn't
+    interlaced, uncompressed TIFF and BMP. Images of other formats (WebP, JPEG, compressed TIFF) and frames of APNG
+    following the first one (blended over the previous ones) are decoded as a whole. The image is left loaded
+    with the first rows only, so it mustn't be read any more.
+
+    Args:
+        image (pillow Image): opened image, not loaded yet
+        rows (int): number of rows to decode
+
+    Returns:
+        pillow Image: image of the first rows
+    """
+    rows = min(rows, image.height)
+    tiles = []
+    for decoder, (left, top, right, bottom), offset, args in image.tile:
+        if top >= rows:
+            continue
+        if decoder == 'zip' and top == 0 and image.tell() == 0 and not image.info.get('interlace'):
+            tiles.append((decoder, (left, top, right, min(bottom, rows)), offset, args))
+        elif decoder == 'raw' and isinstance(args, tuple) and len(args) == 3 and args[2] == 1:
+            tiles.append((decoder, (left, top, right, min(bottom, rows)), offset, args))
+        elif decoder == 'raw' and isinstance(args, tuple) and len(args) == 3 and args[2] == -1 and args[1]:
+            # bottom-up rows, the first rows are at the end of the tile
+            tiles.append((decoder, (left, top, right, min(bottom, rows)), offset + (bottom - min(bottom, rows)) * args[1], args))
+        else:
+            tiles = None
+            break
+
+    if tiles is not None:
+        image.tile = tiles
+    return image.crop((0, 0, image.width, rows))
+
+
+class RowDecoder:
+    """Rows of encoded image decoded on demand - only the rows up to the last requested one are decoded where format
+    of the image allows it (see `decode_rows`). The image is opened again to decode more rows, the opened image
+    given by caller is never decoded by the decoder (it stays readable), but it's read as it is once it's loaded
+    (e.g. to check its alpha).
+    """
+
+    def __init__(self, inputImage: BinaryIO, image: Image.Image = None, frame: int = 0, minRows: int = 1):
+        """
+        Args:
+            inputImage (BinaryIO): encoded image or path to it
+            image (pillow Image, optional): the image already opened (at the frame). Defaults to None (it's opened).
+            frame (int, optional): index of the frame of multi-frame image. Defaults to 0.
+            minRows (int, optional): min number of rows decoded at once. Defaults to 1.
+        """
+        self.inputImage = inputImage
+        self.frame = frame
+        self.minRows = minRows
+        self.image = self._open() if image is None else image
+        self.rows = None # the first decoded rows
+        self.decodedRows = 0 # number of rows decoded by the decoder so far, rows decoded again are counted again
+
+
+    def read(self, top: int, bottom: int) -> Image.Image:
+        """Read rows, decoding the first rows up to `bottom` unless they are decoded already
+
+        Args:
+            top (int): first row
+            bottom (int): row following the last one
+
+        Returns:
+            pillow Image: image of the rows
+        """
+        if not getattr(self.image, 'tile', None): # loaded image, e.g. cached cover
+            self.rows = self.image
+        elif self.rows is None or self.rows.height < bottom:
+            self.rows = decode_rows(self._open(), max(bottom, self.minRows))
+            self.decodedRows += self.rows.height
+        return self.rows.crop((0, top, self.rows.width, bottom))
+
+
+    def _open(self) -> Image.Image:
+        image = Image.open(self.inputImage)
+        if self.frame:
+            image.seek(self.frame)
+        return image
@@ -0,0 +1,330 @@
+import io
+import struct
+import zlib
+from typing import BinaryIO, Callable
+
+# Chunk-indexed container (payload layout 2) - files are concatenated and split into chunks of `chunkSize` plain
+# bytes, every chunk is compressed on its own, so that any byte range is decompressed from the chunks holding it:
+#   index size (4) | chunk size (4) | number of files (4) | files | number of chunks (4) | chunks | chunk data
+#   file  = name length (2), name (utf-8), size (8)
+#   chunk = offset in chunk data (8), stored length (4), CRC32 of plain chunk (4)
+
+INDEX_SIZE_FORMAT = '>I'
+COUNT_FORMAT = '>I'
+NAME_LENGTH_FORMAT = '>H'
+FILE_SIZE_FORMAT = '>Q'
+CHUNK_FORMAT = '>QII'
+
+
+class ContainerIndex:
+    """Index of chunk-indexed container - files and chunks holding their concatenated content"""
+
+    def __init__(self, chunkSize: int, files: list[tuple[str, int]], chunks: list[tuple[int, int, int]]):
+        """
+        Args:
+            chunkSize (int): number of plain bytes in a chunk (the last chunk may be shorter)
+            files (list[tuple[str, int]]): names and sizes of files
+            chunks (list[tuple[int, int, int]]): offsets (in chunk data), stored lengths and CRC32 of plain chunks
+        """
+        self.chunkSize = chunkSize
+        self.files = files
+        self.chunks = chunks
+
+
+    def to_bytes(self) -> bytes:
+        """Serialize index including its size
+
+        Returns:
+            bytes: index
+        """
+        index = struct.pack(COUNT_FORMAT, self.chunkSize) + struct.pack(COUNT_FORMAT, len(self.files))
+        for name, size in self.files:
+            encodedName = name.encode('utf-8')
+            index += struct.pack(NAME_LENGTH_FORMAT, len(encodedName)) + encodedName + struct.pack(FILE_SIZE_FORMAT, size)
+        index += struct.pack(COUNT_FORMAT, len(self.chunks))
+        index += b''.join(struct.pack(CHUNK_FORMAT, *chunk) for chunk in self.chunks)
+        return struct.pack(INDEX_SIZE_FORMAT, len(index)) + index
+
+
+    def __len__(self) -> int:
+        """Size of serialized index - position of chunk data in container"""
+        return struct.calcsize(INDEX_SIZE_FORMAT) + 3 * struct.calcsize(COUNT_FORMAT) \
+            + sum(struct.calcsize(NAME_LENGTH_FORMAT) + len(name.encode('utf-8')) + struct.calcsize(FILE_SIZE_FORMAT) for name, _ in self.files) \
+            + len(self.chunks) * struct.calcsize(CHUNK_FORMAT)
+
+
+    def size(self) -> int:
+        """Number of plain bytes of all files"""
+        return sum(size for _, size in self.files)
+
+
+    def file_offsets(self) -> list[tuple[str, int, int]]:
+        """Names, offsets and sizes of files in concatenated content, offsets are positions for range extraction
+
+        Returns:
+            list[tuple[str, int, int]]: name, offset, size of every file
+        """
+        offsets, offset = [], 0
+        for name, size in self.files:
+            offsets.append((name, offset, size))
+            offset += size
+        return offsets
+
+
+    def chunk_span(self, start: int, end: int) -> range:
+        """Indices of chunks holding plain bytes from `start` to `end`
+
+        Args:
+            start (int): position of the first byte
+            end (int): position following the last byte
+
+        Returns:
+            range: chunk indices
+        """
+        if start >= end:
+            return range(0)
+        return range(start // self.chunkSize, -(-end // self.chunkSize))
+
+
+    @classmethod
+    def read(cls, readPlain: Callable[[int, int], bytes]) -> 'ContainerIndex':
+        """Read index from the beginning of container
+
+        Args:
+            readPlain (Callable[[int, int], bytes]): returns plain bytes of container at position, called with
+                position and number of bytes
+
+        Raises:
+            ValueError: when index is in wrong format
+
+        Returns:
+            ContainerIndex: index
+        """
+        sizeLength = struct.calcsize(INDEX_SIZE_FORMAT)
+        indexSize, = struct.unpack(INDEX_SIZE_FORMAT, readPlain(0, sizeLength))
+        index = memoryview(readPlain(sizeLength, indexSize))
+        if len(index) != indexSize:
+            raise ValueError('bad format container index is shorter than its size')
+
+        position = 0
+        def unpack(format: str) -> tuple:
+            nonlocal position
+            values = struct.unpack_from(format, index, position)
+            position += struct.calcsize(format)
+            return values
+
+        try:
+            chunkSize, numberOfFiles = unpack(COUNT_FORMAT)[0], unpack(COUNT_FORMAT)[0]
+            files = []
+            for _ in range(numberOfFiles):
+                nameLength, = unpack(NAME_LENGTH_FORMAT)
+                name = bytes(index[position:position + nameLength]).decode('utf-8')
+                position += nameLength
+                files.append((name, unpack(FILE_SIZE_FORMAT)[0]))
+            numberOfChunks, = unpack(COUNT_FORMAT)
+            chunks = [unpack(CHUNK_FORMAT) for _ in range(numberOfChunks)]
+        except (struct.error, UnicodeDecodeError) as exception:
+            raise ValueError(f'bad format container index: {exception}') from None
+        return cls(chunkSize, files, chunks)
+
+
+def pack_container(files: list[tuple[str, BinaryIO, int]], chunkSize: int, compressChunk: Callable[[bytes], bytes],
+                   limit: int = None) -> tuple[BinaryIO, int]:
+    """Pack files into chunk-indexed container. Container is kept in memory, because its size has to be known
+    before it's embedded, `limit` bounds it.
+
+    Args:
+        files (list[tuple[str, BinaryIO, int]]): names, streams and sizes of files
+        chunkSize (int): number of plain bytes in a chunk
+        compressChunk (Callable[[bytes], bytes]): compresses a chunk
+        limit (int, optional): max size of container. Defaults to None (unlimited).
+
+    Raises:
+        RuntimeError: when a stream ends before its size
+        ValueError: when container exceeds `limit`
+
+    Returns:
+        tuple[BinaryIO, int]: stream of container, its size
+    """
+    totalSize = sum(size for _, _, size in files)
+    numberOfChunks = -(-totalSize // chunkSize)
+    index = ContainerIndex(chunkSize, [(name, size) for name, _, size in files], [(0, 0, 0)] * numberOfChunks)
+
+    # chunk data are written after space reserved for the index, the index is written when they are known
+    output = io.BytesIO()
+    output.write(bytes(len(index)))
+    chunks = []
+    for chunk in _read_chunks(files, chunkSize):
+        compressed = compressChunk(chunk)
+        chunks.append((output.tell() - len(index), len(compressed), zlib.crc32(chunk)))
+        output.write(compressed)
+        if limit is not None and output.tell() > limit:
+            raise ValueError(f'container exceeds {limit} bytes')
+
+    index.chunks = chunks
+    output.seek(0)
+    output.write(index.to_bytes())
+    output.seek(0)
+    return output, output.getbuffer().nbytes
+
+
+def unpack_chunks(index: ContainerIndex, span: range, data: bytes, decompressChunk: Callable[[bytes], bytes]) -> bytes:
+    """Decompress and verify consecutive chunks of container
+
+    Args:
+        index (ContainerIndex): index of the container
+        span (range): indices of the chunks
+        data (bytes): chunk data of the chunks, starting at offset of the first one
+        decompressChunk (Callable[[bytes], bytes]): decompresses a chunk
+
+    Raises:
+        ValueError: when a chunk can't be decompressed or doesn't match its checksum
+
+    Returns:
+        bytes: plain content of the chunks
+    """
+    data = memoryview(data)
+    base = index.chunks[span.start][0] if span else 0
+    plainChunks = []
+    for number in span:
+        offset, length, checksum = index.chunks[number]
+        try:
+            chunk = decompressChunk(data[offset - base:offset - base + length])
+        except ValueError:
+            chunk = None
+        if chunk is None or zlib.crc32(chunk) != checksum:
+            raise ValueError(f'chunk {number} of container is corrupted')
+        plainChunks.append(chunk)
+    return b''.join(plainChunks)
+
+
+def _read_chunks(files: list[tuple[str, BinaryIO, int]], chunkSize: int):
+    """Read concatenated content of files chunk by chunk
+
+    Args:
+        files (list[tuple[str, BinaryIO, int]]): names, streams and sizes of files
+        chunkSize (int): number of bytes in a chunk
+
+    Raises:
+        RuntimeError: when a stream ends before its size
+
+    Yields:
+        Iterator[bytes]: chunks, the last one may be shorter
+    """
+    chunk = bytearray()
+    for name, stream, size in files:
+        remaining = size
+        while remaining > 0:
+            data = stream.read(min(remaining, chunkSize - len(chunk)))
+            if not data:
+                raise RuntimeError(f'file {name} ended {remaining} bytes before expected size {size}')
+            remaining -= len(data)
+            chunk += data
+            if len(chunk) == chunkSize:
+                yield bytes(chunk)
+                chunk.clear()
+    if chunk:
+        yield bytes(chunk)
+
+
+class ContainerWriter:
+    """Writable stream unpacking container written into it sequentially - reads its index, decompresses and
+    verifies chunks and writes content of files to their outputs. Checks that container is complete when
+    leaving the context.
+    """
+
+    def __init__(self, openOutput: Callable[[str], BinaryIO], decompressChunk: Callable[[bytes], bytes]):
+        """
+        Args:
+            openOutput (Callable[[str], BinaryIO]): returns stream to write content of file of given name to,
+                it's called for every file when its content begins
+            decompressChunk (Callable[[bytes], bytes]): decompresses a chunk
+        """
+        self.openOutput = openOutput
+        self.decompressChunk = decompressChunk
+        self.index = None
+        self._buffer = bytearray()
+        self._position = 0 # position of the buffer in container
+        self._chunk = 0 # index of the next chunk
+        self._file = -1 # index of the file being written
+        self._fileRemaining = 0 # number of bytes of the file not written yet
+        self._output = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exceptionType, *args) -> None:
+        if exceptionType is None:
+            self.close()
+
+
+    def write(self, data: bytes) -> int:
+        """Consume bytes of container
+
+        Args:
+            data (bytes): next bytes of container
+
+        Raises:
+            ValueError: when container is in wrong format or a chunk doesn't match its checksum
+
+        Returns:
+            int: number of consumed bytes
+        """
+        self._buffer += data
+        if self.index is None:
+            self._read_index()
+
+        while self.index is not None and self._chunk < len(self.index.chunks):
+            offset, length, _ = self.index.chunks[self._chunk]
+            start = len(self.index) + offset - self._position
+            if len(self._buffer) < start + length:
+                break
+            chunk = unpack_chunks(self.index, range(self._chunk, self._chunk + 1), self._buffer[start:start + length], self.decompressChunk)
+            self._write_content(chunk)
+            del self._buffer[:start + length]
+            self._position += start + length
+            self._chunk += 1
+        return len(data)
+
+
+    def close(self) -> None:
+        """Check that all chunks were written
+
+        Raises:
+            RuntimeError: when container is incomplete
+        """
+        if self.index is None or self._chunk < len(self.index.chunks):
+            raise RuntimeError('bad format container is incomplete')
+        self._write_content(b'') # open outputs of remaining (empty) files
+
+
+    def _read_index(self) -> None:
+        """Parse index when the buffer holds it"""
+        sizeLength = struct.calcsize(INDEX_SIZE_FORMAT)
+        if len(self._buffer) < sizeLength:
+            return
+        indexSize, = struct.unpack_from(INDEX_SIZE_FORMAT, self._buffer)
+        if len(self._buffer) >= sizeLength + indexSize:
+            self.index = ContainerIndex.read(lambda position, size: bytes(self._buffer[position:position + size]))
+
+
+    def _write_content(self, content: bytes) -> None:
+        """Split content across files
+
+        Args:
+            content (bytes): next plain bytes of concatenated files
+        """
+        content = memoryview(content)
+        while True:
+            while self._fileRemaining == 0 and self._file + 1 < len(self.index.files):
+                self._file += 1
+                name, self._fileRemaining = self.index.files[self._file]
+                self._output = self.openOutput(name)
+            if not content or self._fileRemaining == 0:
+                return
+            length = min(len(content), self._fileRemaining)
+            self._output.write(content[:length])
+            content = content[length:]
+            self._fileRemaining -= length
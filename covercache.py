@@ -0,0 +1,243 @@
+import base64
+import hashlib
+import json
+import logging
+import numbers
+import os
+import numpy as np
+from PIL import Image
+from bitplane import CoverLayout
+from frames import frame_count
+from metrics import Metrics
+
+# Cover cache keeps decoded covers on disk, so that embedding into the same covers again skips decoding them.
+# Entry of a cover is named after SHA-256 of its file content:
+#   <digest>.npy  - channels of the cover converted to mode with alpha (if it has any), loaded memory-mapped, so
+#                   that processes embedding into the same cover share its pages
+#   <digest>.json - mode of the layout, format and metadata of the cover
+# Reference of a path (named after SHA-256 of the path) holds size, modification time and digest of the file,
+# the file isn't read to be hashed again until its size or modification time changes. Entries are evicted
+# in least recently used order (modification time of .npy is touched by every hit) to keep them within budget.
+# Multi-frame covers aren't cached, their frames are decoded one at a time (see frames.py). Hits, misses and
+# evictions of a lookup are counted by metrics of the job as calls of stages `cover_cache_hits`,
+# `cover_cache_misses` and `cover_cache_evictions`.
+
+REFERENCE_SUFFIX = '.ref'
+ARRAY_SUFFIX = '.npy'
+INFO_SUFFIX = '.json'
+HASH_BLOCK_SIZE = 1024 * 1024 # number of bytes of cover hashed at once
+
+log = logging.getLogger('CoverCache')
+
+
+class CoverCache:
+    """On-disk cache of decoded covers with least recently used eviction and hit and miss counters (of the process)"""
+
+    def __init__(self, directory: str, budget: int):
+        """
+        Args:
+            directory (str): directory of the cache, shared by processes
+            budget (int): max number of bytes of cached covers
+        """
+        self.directory = directory
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def open(self, pathToImage: str, metrics: Metrics = None) -> tuple[Image.Image, CoverLayout]:
+        """Open cover and find its layout, cached cover is not decoded. Cover missing in cache is decoded and stored.
+
+        Args:
+            pathToImage (str): path to the cover
+            metrics (Metrics, optional): metrics counting hits, misses and evictions of the lookup. Defaults to None.
+
+        Returns:
+            tuple[pillow Image, CoverLayout]: decoded cover (in mode with alpha if it has any), its layout
+        """
+        counters = self.stats()
+        try:
+            return self._open(pathToImage)
+        finally:
+            if metrics is not None:
+                for name, value in self.stats().items():
+                    if value > counters[name]:
+                        metrics.count(f'cover_cache_{name}', value - counters[name])
+
+
+    def stats(self) -> dict:
+        """Counters of the cache in this process
+
+        Returns:
+            dict: number of hits, misses and evicted entries
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+    def _open(self, pathToImage: str) -> tuple[Image.Image, CoverLayout]:
+        """Open cover from the cache, see `open`"""
+        digest = self._digest(pathToImage)
+        arrayPath, infoPath = self._entry_paths(digest)
+        try:
+            with open(infoPath) as infoFile:
+                info = json.load(infoFile)
+            array = np.load(arrayPath, mmap_mode='r')
+        except (OSError, ValueError):
+            return self._store(pathToImage, digest)
+
+        os.utime(arrayPath)
+        self.hits += 1
+        log.debug('cover %s cached (%d hits, %d misses)', pathToImage, self.hits, self.misses)
+        image = Image.fromarray(array)
+        image.format = info['format']
+        image.info.update(_decode_metadata(info['metadata']))
+        return image, CoverLayout(info['layout'])
+
+
+    def _store(self, pathToImage: str, digest: str) -> tuple[Image.Image, CoverLayout]:
+        """Decode cover and store it into the cache, unless it exceeds the budget on its own or it has more frames
+
+        Args:
+            pathToImage (str): path to the cover
+            digest (str): digest of the cover file
+
+        Returns:
+            tuple[pillow Image, CoverLayout]: decoded cover, its layout
+        """
+        self.misses += 1
+        image = Image.open(pathToImage)
+        layout = CoverLayout.of(image)
+        if frame_count(image) > 1:
+            return image, layout
+        cover = CoverLayout.candidates(image)[0].convert(image)
+        array = np.asarray(cover)
+        log.debug('cover %s decoded (%d hits, %d misses)', pathToImage, self.hits, self.misses)
+        if array.nbytes > self.budget:
+            return image, layout
+
+        # entry is written under temporary names and renamed, so that other processes never read a part of it
+        arrayPath, infoPath = self._entry_paths(digest)
+        info = {'layout': layout.mode, 'format': image.format, 'metadata': _encode_metadata(cover.info)}
+        os.makedirs(self.directory, exist_ok=True)
+        temporaryPath = f'{arrayPath}.{os.getpid()}.tmp'
+        with open(temporaryPath, 'w') as infoFile:
+            json.dump(info, infoFile)
+        os.replace(temporaryPath, infoPath)
+        with open(temporaryPath, 'wb') as arrayFile:
+            np.save(arrayFile, array)
+        os.replace(temporaryPath, arrayPath)
+
+        self._evict(arrayPath)
+        return image, layout
+
+
+    def _evict(self, keptPath: str) -> None:
+        """Remove least recently used entries until the cache fits into the budget
+
+        Args:
+            keptPath (str): path to .npy of entry that is never removed (the one just stored)
+        """
+        entries = []
+        with os.scandir(self.directory) as files:
+            for file in files:
+                if file.name.endswith(ARRAY_SUFFIX):
+                    try:
+                        stat = file.stat()
+                    except FileNotFoundError: # evicted by another process
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, file.path))
+
+        size = sum(entrySize for _, entrySize, _ in entries)
+        for _, entrySize, path in sorted(entries):
+            if size <= self.budget:
+                break
+            if path == keptPath:
+                continue
+            for entryPath in (path, path[:-len(ARRAY_SUFFIX)] + INFO_SUFFIX):
+                try:
+                    os.remove(entryPath)
+                except FileNotFoundError:
+                    pass
+            size -= entrySize
+            self.evictions += 1
+            log.debug('cover cache entry %s evicted', path)
+
+
+    def _digest(self, pathToImage: str) -> str:
+        """Digest of cover file content, taken from reference of the path when the file didn't change since
+
+        Args:
+            pathToImage (str): path to the cover
+
+        Returns:
+            str: hexadecimal SHA-256 of the file
+        """
+        stat = os.stat(pathToImage)
+        key = [stat.st_size, stat.st_mtime_ns]
+        referencePath = os.path.join(self.directory, hashlib.sha256(os.path.abspath(pathToImage).encode('utf-8')).hexdigest() + REFERENCE_SUFFIX)
+        try:
+            with open(referencePath) as referenceFile:
+                reference = json.load(referenceFile)
+            if reference['key'] == key:
+                return reference['digest']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        fileHash = hashlib.sha256()
+        with open(pathToImage, 'rb') as imageFile:
+            while block := imageFile.read(HASH_BLOCK_SIZE):
+                fileHash.update(block)
+        digest = fileHash.hexdigest()
+
+        os.makedirs(self.directory, exist_ok=True)
+        temporaryPath = f'{referencePath}.{os.getpid()}.tmp'
+        with open(temporaryPath, 'w') as referenceFile:
+            json.dump({'key': key, 'digest': digest}, referenceFile)
+        os.replace(temporaryPath, referencePath)
+        return digest
+
+
+    def _entry_paths(self, digest: str) -> tuple[str, str]:
+        return os.path.join(self.directory, digest + ARRAY_SUFFIX), os.path.join(self.directory, digest + INFO_SUFFIX)
+
+
+def _encode_metadata(info: dict) -> dict:
+    """Metadata of image info serializable to JSON - bytes (ICC profile, EXIF) are encoded in base64, numbers
+    (e.g. DPI) and strings (e.g. PNG text chunks) are stored as they are, other values are left out
+
+    Args:
+        info (dict): info of image
+
+    Returns:
+        dict: metadata, bytes under `{'base64': ...}`
+    """
+    metadata = {}
+    for key, value in info.items():
+        if isinstance(value, bytes):
+            metadata[key] = {'base64': base64.b64encode(value).decode('ascii')}
+        elif isinstance(value, (str, numbers.Real)):
+            metadata[key] = _number(value)
+        elif isinstance(value, tuple) and all(isinstance(item, numbers.Real) for item in value):
+            metadata[key] = [_number(item) for item in value]
+    return metadata
+
+
+def _number(value):
+    """Number as int or float (e.g. rational of TIFF resolution), other values as they are"""
+    if isinstance(value, numbers.Integral) or not isinstance(value, numbers.Real):
+        return value
+    return float(value)
+
+
+def _decode_metadata(metadata: dict) -> dict:
+    """Image info of metadata, see `_encode_metadata`
+
+    Args:
+        metadata (dict): metadata
+
+    Returns:
+        dict: info of image
+    """
+    return {key: base64.b64decode(value['base64']) if isinstance(value, dict) else tuple(value) if isinstance(value, list) else value
+            for key, value in metadata.items()}
@@ -0,0 +1,175 @@
+import itertools
+import os
+from typing import BinaryIO, Iterable
+from PIL import Image, PngImagePlugin, TiffImagePlugin
+
+# Embedded data live in the least significant bits, so images with embedded data are encoded only in lossless
+# formats, which hold their mode as it is. Compression level trades encoding speed against file size of PNG and
+# WebP, TIFF and BMP are written uncompressed (fastest, biggest). Frames of multi-frame image are written as animated
+# PNG or multi-page TIFF.
+
+LOSSLESS_FORMATS = ('PNG', 'WEBP', 'TIFF', 'BMP')
+FORMAT_MODES = { # modes every format stores and decodes unchanged, others would be converted
+    'PNG': ('L', 'LA', 'RGB', 'RGBA', 'I;16'),
+    'WEBP': ('RGB', 'RGBA'),
+    'TIFF': ('L', 'LA', 'RGB', 'RGBA', 'I;16'),
+    'BMP': ('L', 'RGB'),
+}
+EXTENSIONS = {'PNG': '.png', 'WEBP': '.webp', 'TIFF': '.tiff', 'BMP': '.bmp'}
+DEFAULT_FORMAT = 'PNG' # format of output file without extension
+DEFAULT_LEVEL = 6 # compression level of Pillow's PNG encoder
+MAX_LEVEL = 9
+METADATA_KEYS = ('icc_profile', 'exif', 'dpi') # metadata of input image copied to output image
+
+
+def image_format(path: str, imageFormat: str = None) -> str:
+    """Lossless format of output image
+
+    Args:
+        path (str): path to the output file, its extension gives the format
+        imageFormat (str, optional): format overriding the extension. Defaults to None.
+
+    Raises:
+        ValueError: when the format is lossy (embedded data would be destroyed) or unknown
+
+    Returns:
+        str: Pillow format name
+    """
+    if imageFormat is None:
+        extension = os.path.splitext(path)[1].lower()
+        imageFormat = Image.registered_extensions().get(extension) if extension else DEFAULT_FORMAT
+        if imageFormat is None:
+            raise ValueError(f'unknown image format of {path}')
+
+    imageFormat = imageFormat.upper()
+    if imageFormat not in LOSSLESS_FORMATS:
+        raise ValueError(f'{imageFormat} would destroy embedded data, use one of lossless formats {", ".join(LOSSLESS_FORMATS)}')
+    return imageFormat
+
+
+def image_metadata(image: Image.Image) -> dict:
+    """Metadata of input image to preserve in output image - ICC profile, EXIF, DPI and PNG text chunks
+
+    Args:
+        image (pillow Image): input image
+
+    Returns:
+        dict: metadata, text chunks under 'text' key
+    """
+    metadata = {key: image.info[key] for key in METADATA_KEYS if image.info.get(key)}
+    if image.format == 'PNG':
+        text = {key: value for key, value in image.info.items() if isinstance(value, str)}
+        if text:
+            metadata['text'] = text
+    return metadata
+
+
+def preserve_source(outputImage: Image.Image, inputImage: Image.Image, layoutMode: str) -> Image.Image:
+    """Give image with embedded data metadata of the input image and its alpha channel, if the layout leaves
+    alpha out. Alpha of the layout holds data, or it's dropped from RGB output of legacy engine, so that the data
+    are read in the same layout.
+
+    Args:
+        outputImage (pillow Image): image with embedded data, changed in place
+        inputImage (pillow Image): input image
+        layoutMode (str): mode of layout of the input image
+
+    Returns:
+        pillow Image: image with embedded data
+    """
+    if 'A' in inputImage.getbands() and not layoutMode.endswith('A'):
+        outputImage.putalpha(inputImage.getchannel('A'))
+    outputImage.info.update(image_metadata(inputImage))
+    return outputImage
+
+
+def encode_image(image: Image.Image, output: BinaryIO, imageFormat: str, level: int = None, metadata: dict = None) -> None:
+    """Encode image losslessly
+
+    Args:
+        image (pillow Image): image to encode
+        output (BinaryIO): stream to write encoded image to
+        imageFormat (str): lossless format, see `image_format`
+        level (int, optional): compression level from 0 (fastest) to 9 (smallest) of PNG and WebP. Defaults to None
+            (`DEFAULT_LEVEL`).
+        metadata (dict, optional): metadata to store, see `image_metadata`. Defaults to None.
+
+    Raises:
+        ValueError: when the format can't hold mode of the image
+    """
+    _validate_mode(image, imageFormat)
+    image.save(output, imageFormat, **_save_options(imageFormat, DEFAULT_LEVEL if level is None else level, metadata or {}))
+
+
+def encode_frames(frames: Iterable[Image.Image], output: BinaryIO, imageFormat: str, level: int = None) -> None:
+    """Encode frames of multi-frame image losslessly. Pages of TIFF are encoded one at a time, as the frames come.
+    Frames of APNG are collected first, Pillow encodes them together (every frame against the previous one).
+
+    Args:
+        frames (Iterable[pillow Image]): frames, metadata (see `image_metadata`) and duration of every frame are in
+            its info, metadata of APNG and its number of loops are taken from the first frame
+        output (BinaryIO): readable and seekable stream to write encoded image to (pages of TIFF are linked in it)
+        imageFormat (str): PNG or TIFF
+        level (int, optional): compression level from 0 (fastest) to 9 (smallest) of PNG. Defaults to None
+            (`DEFAULT_LEVEL`).
+
+    Raises:
+        ValueError: when the format can't hold mode of the first frame
+    """
+    level = DEFAULT_LEVEL if level is None else level
+    frames = iter(frames)
+    first = next(frames)
+    _validate_mode(first, imageFormat)
+    if imageFormat == 'TIFF':
+        with TiffImagePlugin.AppendingTiffWriter(output, new=True) as tiff:
+            for frame in itertools.chain([first], frames):
+                frame.save(tiff, imageFormat, **_save_options(imageFormat, level, frame.info))
+                tiff.newFrame()
+        return
+
+    following = [frame if frame.mode == first.mode else frame.convert(first.mode) for frame in frames]
+    if getattr(first, 'n_frames', 1) > 1: # opened image (embedded in place) would be saved with its own frames
+        first = first.copy()
+    first.save(output, imageFormat, save_all=True, append_images=following, loop=first.info.get('loop', 0),
+               **_save_options(imageFormat, level, first.info))
+
+
+def _validate_mode(image: Image.Image, imageFormat: str) -> None:
+    """Validate that format holds mode of image losslessly
+
+    Args:
+        image (pillow Image): image to encode
+        imageFormat (str): lossless format
+
+    Raises:
+        ValueError: when the format can't hold mode of the image
+    """
+    if image.mode not in FORMAT_MODES[imageFormat]:
+        formats = [name for name, modes in FORMAT_MODES.items() if image.mode in modes]
+        raise ValueError(f'{imageFormat} can\'t hold {image.mode} image losslessly, use {" or ".join(formats)}')
+
+
+def _save_options(imageFormat: str, level: int, metadata: dict) -> dict:
+    """Options of Pillow encoder
+
+    Args:
+        imageFormat (str): lossless format
+        level (int): compression level from 0 to 9
+        metadata (dict): metadata to store
+
+    Returns:
+        dict: keyword arguments of `Image.save`
+    """
+    options = {key: value for key, value in metadata.items() if key in METADATA_KEYS}
+    if imageFormat == 'PNG':
+        options['compress_level'] = level
+        if 'text' in metadata:
+            options['pnginfo'] = PngImagePlugin.PngInfo()
+            for key, value in metadata['text'].items():
+                options['pnginfo'].add_text(key, value)
+    elif imageFormat == 'WEBP':
+        # levels follow lossless presets of cwebp -z, exact keeps RGB values of transparent pixels holding data
+        options.update(lossless=True, exact=True, quality=level * 100 // MAX_LEVEL, method=level * 6 // MAX_LEVEL)
+    elif imageFormat == 'TIFF':
+        options['compression'] = 'raw'
+    return options
@@ -0,0 +1,346 @@
+import io
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Callable, Iterable, Iterator
+import numpy as np
+from PIL import Image
+from bitplane import extract_bytes, read_strip, BitWriter, CoverLayout
+from encoder import image_metadata
+
+# Payload too big for the first frame of multi-frame cover (animated PNG, multi-page TIFF) continues in the following
+# frames. Frames are filled in order - the first one holds the header and the first bytes, every following one
+# holds its bytes `depth` bits per channel from its first channel. FRAMES field of the header lists the number of
+# bytes held by every frame, so that offsets of all frames are known upfront - frames are embedded and extracted
+# one at a time (only one of them is decoded at once), or by a pool of worker processes. Every frame has its own
+# layout, pages of TIFF may differ in size and mode. Frames following the data are copied unchanged.
+
+FRAME_FORMATS = ('PNG', 'TIFF') # output formats keeping all frames of multi-frame cover
+PARALLEL_FORMATS = ('TIFF',) # formats whose frames are decoded on their own, APNG frame is drawn over the previous ones
+FRAME_KEYS = ('duration', 'loop') # info of frames copied to frames of output image
+PENDING_FRAMES_PER_WORKER = 2 # number of frames submitted ahead, bounds memory held by decoded frames
+
+
+class FrameCursor:
+    """Frames of multi-frame image visited in any order. Pillow decodes frame of APNG over the previous ones and
+    can't seek back once a frame is decoded, the image is opened again to seek back.
+    """
+
+    def __init__(self, inputImage: BinaryIO, image: Image.Image = None):
+        """
+        Args:
+            inputImage (BinaryIO): encoded image or path to it
+            image (pillow Image, optional): the image already opened. Defaults to None (it's opened).
+        """
+        self.inputImage = inputImage
+        self.image = Image.open(inputImage) if image is None else image
+
+
+    def seek(self, index: int) -> Image.Image:
+        """Seek frame
+
+        Args:
+            index (int): index of the frame
+
+        Returns:
+            pillow Image: the image at the frame
+        """
+        if index < self.image.tell():
+            self.image = Image.open(self.inputImage)
+        self.image.seek(index)
+        return self.image
+
+
+def frame_count(image: Image.Image) -> int:
+    """Number of frames of image, 1 for single-frame formats
+
+    Args:
+        image (pillow Image): image
+
+    Returns:
+        int: number of frames
+    """
+    return getattr(image, 'n_frames', 1)
+
+
+def following_frame_channels(pathToImage: str, count: int) -> list[int]:
+    """Number of channels holding data of frames following the first one, alpha of frames having it is checked
+    by decoding them
+
+    Args:
+        pathToImage (str): path to multi-frame image
+        count (int): max number of frames
+
+    Returns:
+        list[int]: number of channels of every frame
+    """
+    image = Image.open(pathToImage)
+    channels = []
+    for index in range(1, min(frame_count(image), count + 1)):
+        image.seek(index)
+        channels.append(CoverLayout.of(image).number_of_channels(image.size))
+    return channels
+
+
+def listed_frame_channels(image: Image.Image, count: int) -> list[int]:
+    """Number of channels of frames following the first one known without decoding them, alpha isn't counted
+    (it's checked by decoding, see `following_frame_channels`). Pages of TIFF have their own size and mode, seeking
+    them reads only their directories. Frames of other formats (APNG) have size and mode of the image, they aren't
+    seeked (seeking APNG decodes the previous frames).
+
+    Args:
+        image (pillow Image): opened multi-frame image, it's left at another frame
+        count (int): max number of frames
+
+    Returns:
+        list[int]: number of channels of every frame
+    """
+    channels = []
+    for index in range(1, min(frame_count(image), count + 1)):
+        if image.format == 'TIFF':
+            image.seek(index)
+        channels.append(CoverLayout.candidates(image)[-1].number_of_channels(image.size))
+    return channels
+
+
+def split_in_order(size: int, capacities: list[int]) -> list[int]:
+    """Split data over frames filling them in order, so that the fewest frames hold them
+
+    Args:
+        size (int): number of bytes to split, at most sum of capacities
+        capacities (list[int]): number of bytes fitting into every frame
+
+    Returns:
+        list[int]: number of bytes of every frame holding data
+    """
+    sizes = []
+    for capacity in capacities:
+        if size <= 0:
+            break
+        sizes.append(min(size, capacity))
+        size -= sizes[-1]
+    return sizes
+
+
+def split_stream(chunks: Iterable[bytes], sizes: list[int]) -> Iterator[bytes]:
+    """Regroup chunks of data into parts held by frames
+
+    Args:
+        chunks (Iterable[bytes]): data
+        sizes (list[int]): number of bytes of every part, their sum is the size of the data
+
+    Yields:
+        Iterator[bytes]: parts
+    """
+    sizes = iter(sizes)
+    size = next(sizes, None)
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        while size is not None and len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+            size = next(sizes, None)
+
+
+def frame_spans(sizes: list[int], position: int, size: int) -> Iterator[tuple[int, int, int]]:
+    """Parts of data range held by frames
+
+    Args:
+        sizes (list[int]): number of bytes held by every frame
+        position (int): position of the first byte of the range
+        size (int): number of bytes of the range
+
+    Yields:
+        Iterator[tuple[int, int, int]]: index of frame, position of the part in the frame, number of its bytes
+    """
+    start = 0
+    for index, frameSize in enumerate(sizes):
+        end = start + frameSize
+        if size > 0 and position < end:
+            length = min(end - position, size)
+            yield index, position - start, length
+            position += length
+            size -= length
+        start = end
+
+
+def embed_frame(frame: Image.Image, layout: CoverLayout, data: bytes, depth: int, header: bytes = b'') -> Image.Image:
+    """Embed data into frame, following the header in the first frame
+
+    Args:
+        frame (pillow Image): frame of cover
+        layout (CoverLayout): layout of the frame
+        data (bytes): data held by the frame
+        depth (int): number of bits embedded into one channel
+        header (bytes, optional): header embedded 1 bit per channel before the data. Defaults to b''.
+
+    Raises:
+        ValueError: when data don't fit into the frame
+
+    Returns:
+        pillow Image: frame with embedded data
+    """
+    pixels = np.array(layout.convert(frame))
+    writer = BitWriter(pixels.reshape(-1))
+    writer.write(header)
+    writer.set_depth(depth)
+    writer.write(data)
+    outputFrame = layout.to_image(pixels, frame.size)
+    if 'A' in frame.getbands() and not layout.mode.endswith('A'):
+        outputFrame.putalpha(frame.getchannel('A'))
+    outputFrame.info.update(frame_info(frame))
+    return outputFrame
+
+
+def copy_frame(frame: Image.Image) -> Image.Image:
+    """Copy frame not holding data
+
+    Args:
+        frame (pillow Image): frame of cover
+
+    Returns:
+        pillow Image: copy of the frame
+    """
+    outputFrame = frame.copy()
+    outputFrame.info = frame_info(frame)
+    if 'transparency' in frame.info: # palette frame is converted to mode of the first frame of APNG
+        outputFrame.info['transparency'] = frame.info['transparency']
+    return outputFrame
+
+
+def frame_info(frame: Image.Image) -> dict:
+    """Info of output frame - metadata (see `image_metadata`) and timing of the frame. Blending and disposal of APNG
+    are left out, Pillow decodes whole frames, which are stored as they are.
+
+    Args:
+        frame (pillow Image): frame of input image
+
+    Returns:
+        dict: info
+    """
+    return {**image_metadata(frame), **{key: frame.info[key] for key in FRAME_KEYS if key in frame.info}}
+
+
+def extract_frame(frame: Image.Image, layout: CoverLayout, size: int, depth: int, offset: int = 0) -> bytes:
+    """Extract data held by frame, decoding only the rows holding them
+
+    Args:
+        frame (pillow Image): frame of image
+        layout (CoverLayout): layout of the frame
+        size (int): number of bytes held by the frame
+        depth (int): number of bits embedded into one channel
+        offset (int, optional): position of the first bit (following the header in the first frame). Defaults to 0.
+
+    Raises:
+        ValueError: when the data can't fit into the frame (header is corrupted)
+
+    Returns:
+        bytes: data
+    """
+    numberOfChannels = -(-(offset + size * 8) // depth)
+    if numberOfChannels > layout.number_of_channels(frame.size):
+        raise ValueError(f'{size} bytes of embedded data can\'t fit into frame of {layout.number_of_channels(frame.size)} channels, '
+                         'header of embedded data is corrupted')
+    channels = read_strip(frame, 0, -(-numberOfChannels // layout.number_of_channels((frame.width, 1))), layout)
+    return extract_bytes(channels, size, offset, depth)
+
+
+def map_frames(function: Callable, tasks: Iterable[tuple], workers: int) -> Iterator:
+    """Process frames in a pool of worker processes, results are yielded in order of the tasks. Only a few tasks
+    are submitted ahead, so that frames don't pile up in memory.
+
+    Args:
+        function (Callable): function processing a frame, called with arguments of a task
+        tasks (Iterable[tuple]): arguments of every frame
+        workers (int): number of worker processes
+
+    Yields:
+        Iterator: results
+    """
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        try:
+            for task in tasks:
+                pending.append(executor.submit(function, *task))
+                if len(pending) >= workers * PENDING_FRAMES_PER_WORKER:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def embed_frame_file(pathToImage: str, index: int, data: bytes, depth: int, header: bytes = b'') -> Image.Image:
+    """Embed data into frame of image file, executed in worker process
+
+    Args:
+        pathToImage (str): path to the cover
+        index (int): index of the frame
+        data (bytes): data held by the frame, None for frame following the data (it's copied)
+        depth (int): number of bits embedded into one channel
+        header (bytes, optional): header embedded into the first frame. Defaults to b''.
+
+    Returns:
+        pillow Image: frame with embedded data
+    """
+    frame = Image.open(pathToImage)
+    frame.seek(index)
+    if data is None:
+        return copy_frame(frame)
+    return embed_frame(frame, CoverLayout.of(frame), data, depth, header)
+
+
+def extract_frame_file(pathToImage: str, index: int, size: int, depth: int, offset: int = 0) -> bytes:
+    """Extract data held by frame of image file, executed in worker process
+
+    Args:
+        pathToImage (str): path to the image
+        index (int): index of the frame
+        size (int): number of bytes held by the frame
+        depth (int): number of bits embedded into one channel
+        offset (int, optional): position of the first bit. Defaults to 0.
+
+    Returns:
+        bytes: data
+    """
+    frame = Image.open(pathToImage)
+    frame.seek(index)
+    return extract_frame(frame, CoverLayout.of(frame), size, depth, offset)
+
+
+class FrameReader(io.RawIOBase):
+    """Binary stream of data held by frames, a frame is extracted when its data are read."""
+
+    def __init__(self, parts: Iterator[bytes]):
+        """
+        Args:
+            parts (Iterator[bytes]): data of every frame
+        """
+        super().__init__()
+        self.parts = parts
+        self.part = memoryview(b'')
+
+
+    def readable(self) -> bool:
+        return True
+
+
+    def readinto(self, buffer) -> int:
+        """Read bytes into buffer, at most to the end of data of the current frame.
+
+        Args:
+            buffer (bytearray | memoryview): buffer to fill
+
+        Returns:
+            int: number of read bytes, 0 at the end of the stream
+        """
+        while not self.part:
+            part = next(self.parts, None)
+            if part is None:
+                return 0
+            self.part = memoryview(part)
+        size = min(len(buffer), len(self.part))
+        buffer[:size] = self.part[:size]
+        self.part = self.part[size:]
+        return size
@@ -5,6 +5,7 @@ from ContentType import ContentType
 
 DATA_SIZE_BYTES = 4
 MESSAGE_CONTENT_SIZE = 1 # how many bytes is used to encode ContentType enum value
+HEADER_SIZE = DATA_SIZE_BYTES + MESSAGE_CONTENT_SIZE
 
 log = logging.getLogger('Generator')
 
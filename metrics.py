@@ -0,0 +1,246 @@
+import io
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import BinaryIO, Iterable, Iterator, TextIO
+
+# Stages of a job are timed exclusively - time spent in a nested stage (e.g. `write` inside `encode`) is
+# charged to the nested stage only, so that stage times add up to the job time.
+
+
+class Cancelled(Exception):
+    """Raised when progress callback cancels a job"""
+
+
+class Metrics:
+    """Records time, number of calls, bytes and pixels processed per stage of a job. Subclasses emit
+    the records when the job ends.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._stack = [] # names of active stages, the innermost last
+        self._started = 0 # when the innermost active stage started or resumed
+
+
+    @contextmanager
+    def stage(self, name: str, bytes: int = 0, pixels: int = 0):
+        """Time the block as a stage, pausing the enclosing stage
+
+        Args:
+            name (str): stage name
+            bytes (int, optional): number of bytes processed by the block. Defaults to 0.
+            pixels (int, optional): number of pixels processed by the block. Defaults to 0.
+        """
+        now = time.perf_counter()
+        if self._stack:
+            self._record(self._stack[-1], now - self._started)
+        self._stack.append(name)
+        self._started = now
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self._record(self._stack.pop(), now - self._started, 1, bytes, pixels)
+            self._started = now
+
+
+    def add(self, name: str, bytes: int = 0, pixels: int = 0) -> None:
+        """Count bytes and pixels processed by a stage without timing it
+
+        Args:
+            name (str): stage name
+            bytes (int, optional): number of bytes. Defaults to 0.
+            pixels (int, optional): number of pixels. Defaults to 0.
+        """
+        self._record(name, 0, 0, bytes, pixels)
+
+
+    def count(self, name: str, calls: int = 1) -> None:
+        """Count events as calls of a stage without timing it, e.g. hits of cover cache
+
+        Args:
+            name (str): stage name
+            calls (int, optional): number of events. Defaults to 1.
+        """
+        self._record(name, 0, calls)
+
+
+    def timed(self, name: str, items: Iterable[bytes]) -> Iterator[bytes]:
+        """Time producing of each item as a stage, e.g. encryption of chunks
+
+        Args:
+            name (str): stage name
+            items (Iterable[bytes]): items to produce
+
+        Yields:
+            Iterator[bytes]: produced items
+        """
+        iterator = iter(items)
+        while True:
+            with self.stage(name):
+                item = next(iterator, None)
+            if item is None:
+                return
+            self.add(name, len(item))
+            yield item
+
+
+    def emit(self, operation: str) -> None:
+        """Emit stages of the finished job and start a new one
+
+        Args:
+            operation (str): name of the job's operation, e.g. embed
+        """
+        self._write(operation, self.stages)
+        self.stages = {}
+
+
+    def _write(self, operation: str, stages: dict[str, dict]) -> None:
+        """Write stages of a job, no-op by default
+
+        Args:
+            operation (str): name of the job's operation
+            stages (dict[str, dict]): seconds, calls, bytes and pixels of each stage
+        """
+
+
+    def _record(self, name: str, seconds: float, calls: int = 0, bytes: int = 0, pixels: int = 0) -> None:
+        record = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0, 'bytes': 0, 'pixels': 0})
+        record['seconds'] += seconds
+        record['calls'] += calls
+        record['bytes'] += bytes
+        record['pixels'] += pixels
+
+
+class NullMetrics(Metrics):
+    """Metrics doing nothing, default of services"""
+
+    def stage(self, name: str, bytes: int = 0, pixels: int = 0):
+        return nullcontext()
+
+
+    def add(self, name: str, bytes: int = 0, pixels: int = 0) -> None:
+        pass
+
+
+    def count(self, name: str, calls: int = 1) -> None:
+        pass
+
+
+    def timed(self, name: str, items: Iterable[bytes]) -> Iterable[bytes]:
+        return items
+
+
+class JsonMetrics(Metrics):
+    """Writes one JSON object per job (operation, total seconds, stages) as a line of output stream."""
+
+    def __init__(self, outputStream: TextIO = None):
+        """
+        Args:
+            outputStream (TextIO, optional): stream to write lines to. Defaults to None (standard error).
+        """
+        super().__init__()
+        self.outputStream = outputStream
+
+
+    def _write(self, operation: str, stages: dict[str, dict]) -> None:
+        record = {
+            'operation': operation,
+            'seconds': sum(stage['seconds'] for stage in stages.values()),
+            'stages': stages,
+        }
+        outputStream = self.outputStream or sys.stderr
+        outputStream.write(json.dumps(record) + '\n')
+        outputStream.flush()
+
+
+class PrometheusMetrics(Metrics):
+    """Accumulates stages of all jobs into counters written in Prometheus text format to a file (for node
+    exporter's textfile collector). File is replaced atomically after every job.
+    """
+
+    PREFIX = 'steganography'
+    COUNTERS = {
+        'seconds': 'Time spent in stage.',
+        'calls': 'Number of times stage ran.',
+        'bytes': 'Bytes processed by stage.',
+        'pixels': 'Pixels processed by stage.',
+    }
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): path to the .prom file
+        """
+        super().__init__()
+        self.path = path
+        self.totals = {} # (operation, stage) -> counters
+        self.jobs = {} # operation -> number of jobs
+
+
+    def _write(self, operation: str, stages: dict[str, dict]) -> None:
+        self.jobs[operation] = self.jobs.get(operation, 0) + 1
+        for name, stage in stages.items():
+            totals = self.totals.setdefault((operation, name), dict.fromkeys(self.COUNTERS, 0))
+            for counter in self.COUNTERS:
+                totals[counter] += stage[counter]
+
+        lines = [f'# HELP {self.PREFIX}_jobs_total Number of finished jobs.', f'# TYPE {self.PREFIX}_jobs_total counter']
+        lines += [f'{self.PREFIX}_jobs_total{{operation="{operation}"}} {jobs}' for operation, jobs in self.jobs.items()]
+        for counter, description in self.COUNTERS.items():
+            metric = f'{self.PREFIX}_stage_{counter}_total'
+            lines += [f'# HELP {metric} {description}', f'# TYPE {metric} counter']
+            lines += [f'{metric}{{operation="{operation}",stage="{name}"}} {totals[counter]}'
+                      for (operation, name), totals in self.totals.items()]
+
+        temporaryPath = self.path + '.tmp'
+        with open(temporaryPath, 'w') as output:
+            output.write('\n'.join(lines) + '\n')
+        os.replace(temporaryPath, self.path)
+
+
+class TimedStream:
+    """Wraps binary stream, reads and writes are timed as a stage of metrics. Hides file descriptor of the
+    stream, so that writers (e.g. Pillow encoders) go through `write`.
+    """
+
+    def __init__(self, stream: BinaryIO, metrics: Metrics, name: str):
+        """
+        Args:
+            stream (BinaryIO): wrapped stream
+            metrics (Metrics): metrics to record the stage into
+            name (str): stage name
+        """
+        self.stream = stream
+        self.metrics = metrics
+        self.stageName = name
+
+
+    def __getattr__(self, attribute: str):
+        return getattr(self.stream, attribute)
+
+
+    def fileno(self) -> int:
+        raise io.UnsupportedOperation('fileno')
+
+
+    def read(self, size: int = -1) -> bytes:
+        with self.metrics.stage(self.stageName):
+            data = self.stream.read(size)
+        self.metrics.add(self.stageName, len(data))
+        return data
+
+
+    def readinto(self, buffer) -> int:
+        with self.metrics.stage(self.stageName):
+            size = self.stream.readinto(buffer)
+        self.metrics.add(self.stageName, size or 0)
+        return size
+
+
+    def write(self, data: bytes) -> int:
+        with self.metrics.stage(self.stageName, len(data)):
+            return self.stream.write(data)
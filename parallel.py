@@ -0,0 +1,143 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from bitplane import bytes_to_bits, embed_bits, extract_bytes
+
+BAND_ROWS_ALIGNMENT = 8 # number of rows in a band is multiple of this
+
+
+class SharedArray:
+    """Flat array living in shared memory, so that worker processes can access it without pickling.
+    Creator of the memory unlinks it on close.
+    """
+
+    def __init__(self, size: int, name: str = None, dtype: str = 'uint8'):
+        """
+        Args:
+            size (int): number of items
+            name (str, optional): name of existing shared memory to attach to. Defaults to None (create new).
+            dtype (str, optional): type of items. Defaults to 'uint8'.
+        """
+        self.owner = name is None
+        self.memory = SharedMemory(name=name, create=self.owner, size=max(size * np.dtype(dtype).itemsize, 1))
+        self.array = np.ndarray((size,), dtype=dtype, buffer=self.memory.buf)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def close(self) -> None:
+        """Release shared memory"""
+        del self.array
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def split_bands(rowChannels: int, numberOfBits: int, workers: int, depth: int = 1) -> list[tuple[int, int]]:
+    """Split bits of payload into bands of rows, one band per task. Bands span multiple of 8 rows, so that
+    each band starts at a whole payload byte.
+
+    Args:
+        rowChannels (int): number of channels in a row of the image
+        numberOfBits (int): number of bits of payload
+        workers (int): number of worker processes
+        depth (int, optional): number of bits embedded into one channel. Defaults to 1.
+
+    Returns:
+        list[tuple[int, int]]: (first bit, end bit) of payload in every band
+    """
+    rowBits = rowChannels * depth
+    rows = -(-numberOfBits // rowBits)
+    bandRows = -(-rows // workers)
+    bandRows = -(-bandRows // BAND_ROWS_ALIGNMENT) * BAND_ROWS_ALIGNMENT
+    bandBits = bandRows * rowBits
+
+    return [(start, min(start + bandBits, numberOfBits)) for start in range(0, numberOfBits, bandBits)]
+
+
+def embed_bands(channels: SharedArray, payload: SharedArray, rowChannels: int, workers: int, offset: int = 0, depth: int = 1) -> None:
+    """Embed payload into channels, bands of rows are embedded in parallel.
+
+    Args:
+        channels (SharedArray): flat channel values of the image (R, G, B, R, G, B, ...)
+        payload (SharedArray): bytes to embed
+        rowChannels (int): number of channels in a row of the image
+        workers (int): number of worker processes
+        offset (int, optional): position of the first bit of payload, multiple of 8. Defaults to 0.
+        depth (int, optional): number of bits embedded into one channel. Defaults to 1.
+    """
+    bands = split_bands(rowChannels, len(payload.array) * 8, workers, depth)
+    with ProcessPoolExecutor(workers) as executor:
+        tasks = [executor.submit(_embed_band, channels.memory.name, len(channels.array), channels.array.dtype.str, payload.memory.name,
+                                 len(payload.array), start, end, offset, depth) for start, end in bands]
+        for task in tasks:
+            task.result()
+
+
+def extract_bands(channels: SharedArray, size: int, rowChannels: int, workers: int, offset: int = 0, depth: int = 1) -> bytes:
+    """Extract `size` bytes of payload, bands of rows are extracted in parallel.
+
+    Args:
+        channels (SharedArray): flat channel values of the image (R, G, B, R, G, B, ...)
+        size (int): number of bytes to extract
+        rowChannels (int): number of channels in a row of the image
+        workers (int): number of worker processes
+        offset (int, optional): position of the first bit of payload, multiple of 8. Defaults to 0.
+        depth (int, optional): number of bits embedded into one channel. Defaults to 1.
+
+    Returns:
+        bytes: extracted bytes
+    """
+    bands = split_bands(rowChannels, size * 8, workers, depth)
+    with SharedArray(size) as payload, ProcessPoolExecutor(workers) as executor:
+        tasks = [executor.submit(_extract_band, channels.memory.name, len(channels.array), channels.array.dtype.str, payload.memory.name,
+                                 size, start, end, offset, depth) for start, end in bands]
+        for task in tasks:
+            task.result()
+        return payload.array.tobytes()
+
+
+def _embed_band(channelsName: str, numberOfChannels: int, dtype: str, payloadName: str, payloadSize: int, start: int, end: int,
+                offset: int, depth: int) -> None:
+    """Worker embedding bits [start, end) of payload.
+
+    Args:
+        channelsName (str): name of shared memory with channels
+        numberOfChannels (int): number of channels
+        dtype (str): type of channel values
+        payloadName (str): name of shared memory with payload
+        payloadSize (int): payload size in bytes
+        start (int): first bit of the band, multiple of 8
+        end (int): end bit of the band
+        offset (int): position of the first bit of payload
+        depth (int): number of bits embedded into one channel
+    """
+    with SharedArray(numberOfChannels, channelsName, dtype) as channels, SharedArray(payloadSize, payloadName) as payload:
+        bits = bytes_to_bits(payload.array[start // 8:-(-end // 8)])[:end - start]
+        embed_bits(channels.array, bits, offset + start, depth)
+
+
+def _extract_band(channelsName: str, numberOfChannels: int, dtype: str, payloadName: str, payloadSize: int, start: int, end: int,
+                  offset: int, depth: int) -> None:
+    """Worker extracting bits [start, end) of payload into payload bytes [start / 8, end / 8).
+
+    Args:
+        channelsName (str): name of shared memory with channels
+        numberOfChannels (int): number of channels
+        dtype (str): type of channel values
+        payloadName (str): name of shared memory to store payload into
+        payloadSize (int): payload size in bytes
+        start (int): first bit of the band, multiple of 8
+        end (int): end bit of the band, multiple of 8
+        offset (int): position of the first bit of payload
+        depth (int): number of bits embedded into one channel
+    """
+    with SharedArray(numberOfChannels, channelsName, dtype) as channels, SharedArray(payloadSize, payloadName) as payload:
+        extracted = extract_bytes(channels.array, (end - start) // 8, offset + start, depth)
+        payload.array[start // 8:end // 8] = np.frombuffer(extracted, dtype=np.uint8)
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterator, TextIO
+from PIL import Image
+from batch import configure_services
+from ContentType import ContentType
+from frames import listed_frame_channels
+from MessageHeader import MessageHeader
+from sharding import IMAGE_EXTENSIONS
+from service.EmbedService import EmbedService
+
+# Scan sweeps directory tree for images holding embedded data, reading only their headers. Report is a JSON lines
+# file, one image per line in order of completion:
+#   {"path": "a/b.png", "detected": true, "version": 1, "size": 1234, "content_type": "FILE", "capacity": 56789, "error": null}
+# Capacity is the number of data bytes fitting into the image (with depth of the detected header, `depth` setting
+# otherwise), spread over all frames of multi-frame image - frames following the first one are counted by their
+# size and mode without decoding them (their alpha is left out). Report written to a file is also the checkpoint
+# of the scan - images it lists are skipped when the scan is run again, so an interrupted scan resumes where it
+# stopped.
+
+IMAGES_PER_TASK = 64 # number of images scanned by a worker at once, amortizes passing them between processes
+PENDING_TASKS_PER_WORKER = 4 # number of tasks submitted ahead, bounds memory used by a huge directory tree
+
+log = logging.getLogger('Scan')
+
+
+def run_scan(directory: str, poolSize: int, settings: dict, chunkSize: int, reportPath: str = None, report: TextIO = None) -> dict:
+    """Scan images of directory tree in a pool of worker processes. Failure of an image (e.g. truncated file)
+    is reported and doesn't stop the scan.
+
+    Args:
+        directory (str): root of the directory tree
+        poolSize (int): number of worker processes
+        settings (dict): attributes of `EmbedService` set in every worker
+        chunkSize (int): number of bytes encrypted and decrypted at once
+        reportPath (str, optional): file the report is appended to, images it already lists are skipped.
+            Defaults to None (`report` stream).
+        report (TextIO, optional): stream to write the report to when there is no `reportPath`. Defaults to None.
+
+    Returns:
+        dict: summary - number of scanned images, detected images, failed images, skipped images, seconds,
+            images per second
+    """
+    start = time.perf_counter()
+    scanned = set()
+    if reportPath:
+        scanned = _read_checkpoint(reportPath)
+        report = open(reportPath, 'a')
+    summary = {'images': 0, 'detected': 0, 'failed': 0, 'skipped': 0}
+
+    def write_results(tasks) -> None:
+        for results in (task.result() for task in tasks):
+            for result in results:
+                summary['images'] += 1
+                summary['detected'] += result['detected']
+                summary['failed'] += result['error'] is not None
+                report.write(json.dumps(result) + '\n')
+        report.flush()
+
+    with report if reportPath else nullcontext(), \
+         ProcessPoolExecutor(poolSize, initializer=configure_services, initargs=(settings, chunkSize)) as executor:
+        pending, paths = set(), []
+        for path in list_images_recursively(directory):
+            if path in scanned:
+                summary['skipped'] += 1
+                continue
+            paths.append(path)
+            if len(paths) < IMAGES_PER_TASK:
+                continue
+            pending.add(executor.submit(_scan_images, paths))
+            paths = []
+
+            if len(pending) >= poolSize * PENDING_TASKS_PER_WORKER:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write_results(done)
+
+        if paths:
+            pending.add(executor.submit(_scan_images, paths))
+        write_results(wait(pending).done)
+
+    seconds = time.perf_counter() - start
+    summary.update(seconds=seconds, images_per_s=summary['images'] / seconds)
+    log.info(f'🔍 {summary["images"]} images scanned ({summary["detected"]} hold embedded data, {summary["failed"]} failed, '
+             f'{summary["skipped"]} skipped) in {seconds:.2f} s - {summary["images_per_s"]:.1f} images/s')
+    return summary
+
+
+def list_images_recursively(directory: str) -> Iterator[str]:
+    """List images of directory tree in order of names, lazily so that a huge tree isn't listed in memory
+
+    Args:
+        directory (str): root of the directory tree
+
+    Yields:
+        Iterator[str]: paths to the images
+    """
+    for root, directories, names in os.walk(directory):
+        directories.sort()
+        for name in sorted(names):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def scan_image(path: str) -> dict:
+    """Detect embedded data of image by its header
+
+    Args:
+        path (str): path to the image
+
+    Returns:
+        dict: result - path, detection, header version, data size, content type, capacity and error
+    """
+    result = {'path': path, 'detected': False, 'version': None, 'size': None, 'content_type': None, 'capacity': None, 'error': None}
+    embedService = EmbedService.get_instance()
+    try:
+        image = Image.open(path)
+        header, numberOfChannels = embedService.probe_header(path, image)
+        if header is not None:
+            result.update(detected=True, version=header.version, size=header.size, content_type=header.contentType.name)
+        capacityHeader = header or MessageHeader(0, ContentType.FILE, embedService.depth)
+        frameChannels = [] if capacityHeader.scatter else listed_frame_channels(image, MessageHeader.MAX_FRAMES - 1)
+        if frameChannels:
+            capacityHeader.frames = [0] * (len(frameChannels) + 1)
+        result['capacity'] = max(embedService.data_capacity(numberOfChannels, capacityHeader), 0) + \
+            sum(channels * capacityHeader.depth // 8 for channels in frameChannels)
+    except Exception as exception:
+        result['error'] = f'{type(exception).__name__}: {exception}'
+    return result
+
+
+def _read_checkpoint(reportPath: str) -> set[str]:
+    """Read paths of images listed by report of interrupted scan. Line cut off by the interruption is removed,
+    so that the report stays valid JSON lines file when results are appended.
+
+    Args:
+        reportPath (str): path to the report, it needn't exist
+
+    Returns:
+        set[str]: paths to the scanned images
+    """
+    if not os.path.exists(reportPath):
+        return set()
+    with open(reportPath, 'rb+') as report:
+        content = report.read()
+        complete = content.rfind(b'\n') + 1
+        if complete < len(content):
+            report.truncate(complete)
+    return {json.loads(line)['path'] for line in content[:complete].splitlines() if line.strip()}
+
+
+def _scan_images(paths: list[str]) -> list[dict]:
+    """Scan images, executed in worker process
+
+    Args:
+        paths (list[str]): paths to the images
+
+    Returns:
+        list[dict]: results, see `scan_image`
+    """
+    return [scan_image(path) for path in paths]
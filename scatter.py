@@ -0,0 +1,212 @@
+import hashlib
+import hmac
+import numpy as np
+from bitplane import BitReader, BitWriter
+
+# Scattered data are spread over channels following the header in the order of a keyed pseudo-random permutation
+# of their indices: bit at position p goes to plane p % depth of channel `base + permutation[p // depth]`. The
+# permutation is a Feistel network over the smallest even power of 2 covering the channels, values falling out of
+# them are encrypted again (cycle walking). Any range of the permutation is computed on its own in O(length) time
+# and memory, so small payloads need only the first indices and nothing is shuffled.
+
+SALT_LENGTH = 8 # number of bytes of random salt stored in the header, every embedding gets different permutation
+BATCH_SLOTS = 1024 * 1024 # number of channels whose permuted indices are held at once
+ROUNDS = 4
+MULTIPLIER = np.uint64(0x9E3779B97F4A7C15) # odd constant of the round function (golden ratio, as in splitmix64)
+
+
+class ScatterPermutation:
+    """Keyed pseudo-random permutation of integers from 0 to `size`"""
+
+    def __init__(self, seed: bytes, size: int):
+        """
+        Args:
+            seed (bytes): secret seed, see `scatter_seed`
+            size (int): number of permuted integers
+        """
+        self.size = size
+        self.halfBits = max(-(-(size - 1).bit_length() // 2), 1)
+        self.mask = np.uint64((1 << self.halfBits) - 1)
+        digest = hashlib.sha256(seed).digest()
+        self.roundKeys = [np.uint64(int.from_bytes(digest[8 * i:8 * i + 8], 'little')) for i in range(ROUNDS)]
+
+
+    def indices(self, start: int, stop: int) -> np.ndarray:
+        """Permuted integers at positions from `start` to `stop`
+
+        Args:
+            start (int): first position
+            stop (int): position following the last one
+
+        Returns:
+            np.ndarray: int64 array of permuted integers
+        """
+        values = self._encrypt(np.arange(start, stop, dtype=np.uint64))
+        outside = np.flatnonzero(values >= self.size)
+        while len(outside):
+            values[outside] = self._encrypt(values[outside])
+            outside = outside[values[outside] >= self.size]
+        return values.astype(np.int64)
+
+
+    def _encrypt(self, values: np.ndarray) -> np.ndarray:
+        """Feistel network permuting integers of 2 * `halfBits` bits
+
+        Args:
+            values (np.ndarray): uint64 array of integers
+
+        Returns:
+            np.ndarray: uint64 array of permuted integers
+        """
+        shift = np.uint64(self.halfBits)
+        left, right = values >> shift, values & self.mask
+        for roundKey in self.roundKeys:
+            left, right = right, left ^ self._round(right, roundKey)
+        return (left << shift) | right
+
+
+    def _round(self, values: np.ndarray, roundKey: np.uint64) -> np.ndarray:
+        mixed = (values ^ roundKey) * MULTIPLIER
+        mixed ^= mixed >> np.uint64(29)
+        mixed *= MULTIPLIER
+        mixed ^= mixed >> np.uint64(32)
+        return mixed & self.mask
+
+
+def scatter_seed(key: str | bytes, salt: bytes) -> bytes:
+    """Seed of permutation derived from encryption key (or password) and salt of the header
+
+    Args:
+        key (str | bytes): derived key, password for messages without key derivation
+        salt (bytes): salt stored in the header
+
+    Returns:
+        bytes: seed
+    """
+    key = key.encode('utf-8') if isinstance(key, str) else bytes(key)
+    return hmac.new(key, b'scatter' + salt, hashlib.sha256).digest()
+
+
+def scatter_bits(channels: np.ndarray, bits: np.ndarray, offset: int, depth: int, permutation: ScatterPermutation, base: int) -> None:
+    """Embed bits into permuted channels in place, bit plane by bit plane.
+
+    Args:
+        channels (np.ndarray): flat array of channel values
+        bits (np.ndarray): bits to embed
+        offset (int): position of the first bit
+        depth (int): number of bits embedded into one channel
+        permutation (ScatterPermutation): permutation of channels following `base`
+        base (int): index of the first permuted channel
+
+    Raises:
+        ValueError: when bits don't fit into channels
+    """
+    if offset + len(bits) > permutation.size * depth:
+        raise ValueError(f'{len(bits)} bits don\'t fit into {permutation.size * depth - offset} bit positions')
+
+    firstSlot = offset // depth
+    slots = base + permutation.indices(firstSlot, -(-(offset + len(bits)) // depth))
+    for plane in range(depth):
+        first = (plane - offset) % depth
+        planeBits = bits[first::depth]
+        start = (offset + first) // depth - firstSlot
+        target = slots[start:start + len(planeBits)]
+        values = channels[target] & ~channels.dtype.type(1 << plane)
+        channels[target] = values | (planeBits << plane if plane else planeBits)
+
+
+def gather_bits(channels: np.ndarray, count: int, offset: int, depth: int, permutation: ScatterPermutation, base: int) -> np.ndarray:
+    """Extract bits from permuted channels.
+
+    Args:
+        channels (np.ndarray): flat array of channel values
+        count (int): number of bits to extract
+        offset (int): position of the first bit
+        depth (int): number of bits embedded into one channel
+        permutation (ScatterPermutation): permutation of channels following `base`
+        base (int): index of the first permuted channel
+
+    Raises:
+        ValueError: when channels don't contain enough bits
+
+    Returns:
+        np.ndarray: extracted bits
+    """
+    if offset + count > permutation.size * depth:
+        raise ValueError(f'{count} bits can\'t be extracted from {permutation.size * depth - offset} bit positions')
+
+    firstSlot = offset // depth
+    slots = base + permutation.indices(firstSlot, -(-(offset + count) // depth))
+    bits = np.empty(count, dtype=np.uint8)
+    for plane in range(depth):
+        first = (plane - offset) % depth
+        planeBits = bits[first::depth]
+        start = (offset + first) // depth - firstSlot
+        np.right_shift(channels[slots[start:start + len(planeBits)]], plane, out=planeBits)
+        planeBits &= 1
+    return bits
+
+
+class ScatterWriter(BitWriter):
+    """Writes bytes into the least significant bits of permuted channels, chunk after chunk."""
+
+    def __init__(self, channels: np.ndarray, depth: int, permutation: ScatterPermutation, base: int):
+        """
+        Args:
+            channels (np.ndarray): flat array of channel values to write into
+            depth (int): number of bits written into one channel
+            permutation (ScatterPermutation): permutation of channels following `base`
+            base (int): index of the first permuted channel
+        """
+        super().__init__(channels, 0, depth)
+        self.permutation = permutation
+        self.base = base
+
+
+    def write_bits(self, bits: np.ndarray) -> None:
+        """Write bits into permuted channels following previously written bits, `BATCH_SLOTS` channels at a time.
+
+        Args:
+            bits (np.ndarray): bits to write
+
+        Raises:
+            ValueError: when bits don't fit into channels
+        """
+        batchBits = BATCH_SLOTS * self.depth
+        for start in range(0, len(bits), batchBits):
+            scatter_bits(self.channels, bits[start:start + batchBits], self.offset + start, self.depth, self.permutation, self.base)
+        self.offset += len(bits)
+
+
+class ScatterReader(BitReader):
+    """Binary stream reading bytes from the least significant bits of permuted channels."""
+
+    def __init__(self, channels: np.ndarray, size: int, depth: int, permutation: ScatterPermutation, base: int):
+        """
+        Args:
+            channels (np.ndarray): flat array of channel values to read from
+            size (int): number of bytes in the stream
+            depth (int): number of bits read from one channel
+            permutation (ScatterPermutation): permutation of channels following `base`
+            base (int): index of the first permuted channel
+        """
+        super().__init__(channels, size, 0, depth)
+        self.permutation = permutation
+        self.base = base
+
+
+    def readinto(self, buffer) -> int:
+        """Read bytes into buffer, at most `BATCH_SLOTS` channels at a time.
+
+        Args:
+            buffer (bytearray | memoryview): buffer to fill
+
+        Returns:
+            int: number of read bytes, 0 at the end of the stream
+        """
+        size = min(len(buffer), self.remaining, BATCH_SLOTS * self.depth // 8)
+        bits = gather_bits(self.channels, size * 8, self.offset, self.depth, self.permutation, self.base)
+        buffer[:size] = np.packbits(bits, bitorder='little').tobytes()
+        self.offset += size * 8
+        self.remaining -= size
+        return size
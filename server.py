@@ -0,0 +1,269 @@
+import asyncio
+import io
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from batch import configure_services
+from ContentType import ContentType
+from encoder import encode_image, image_format
+from service.EmbedService import EmbedService
+
+# HTTP/1.1 over Unix socket or localhost TCP, image and payload bytes travel in request and response bodies:
+#   POST /embed    body = image followed by payload, headers X-Image-Length (size of the image part), X-Password,
+#                  X-Content-Type (file or string, defaults to file), X-Image-Format (defaults to PNG)
+#                  -> 200 image with embedded payload, 422 when payload doesn't fit into image
+#   POST /extract  body = image, header X-Password -> 200 payload with X-Content-Type header
+#   GET /health    -> 200 JSON with number of workers and pending jobs
+#   GET /latency   -> 200 JSON with count, p50 and p99 latency (seconds) of recent jobs per operation
+# When all workers are busy and `queueDepth` jobs wait, requests are rejected with 503 and Retry-After header.
+
+MAX_BODY_SIZE = 512 * 1024 * 1024 # max size of request body in bytes
+LATENCY_SAMPLES = 1000 # number of recent jobs per operation percentiles are computed from
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 411: 'Length Required', 413: 'Payload Too Large',
+           422: 'Unprocessable Entity', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+log = logging.getLogger('Server')
+
+
+class Server:
+    """Keeps configured services warm in a pool of worker processes and runs embed and extract jobs of HTTP
+    requests in it. Event loop only parses requests and waits for the pool, so it stays responsive.
+    """
+
+    def __init__(self, settings: dict, chunkSize: int, workers: int, queueDepth: int):
+        """
+        Args:
+            settings (dict): attributes of `EmbedService` set in every worker
+            chunkSize (int): number of bytes encrypted and decrypted at once
+            workers (int): number of worker processes
+            queueDepth (int): max number of jobs waiting for a worker
+        """
+        self.workers = workers
+        self.queueDepth = queueDepth
+        self.pending = 0 # jobs submitted to the pool and not finished yet
+        self.latencies = {'embed': deque(maxlen=LATENCY_SAMPLES), 'extract': deque(maxlen=LATENCY_SAMPLES)}
+        self.executor = ProcessPoolExecutor(workers, initializer=configure_services, initargs=(settings, chunkSize))
+
+
+    def serve(self, socketPath: str = None, port: int = None) -> None:
+        """Serve requests until interrupted
+
+        Args:
+            socketPath (str, optional): path to Unix socket to listen on. Defaults to None.
+            port (int, optional): localhost TCP port to listen on, used when socket path isn't set. Defaults to None.
+        """
+        try:
+            asyncio.run(self._serve(socketPath, port))
+        except KeyboardInterrupt:
+            log.info('🛑 server stopped')
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+
+    async def _serve(self, socketPath: str, port: int) -> None:
+        # start workers upfront, so that the first requests don't pay for it
+        await asyncio.gather(*(asyncio.get_running_loop().run_in_executor(self.executor, _ping) for _ in range(self.workers)))
+
+        if socketPath:
+            server = await asyncio.start_unix_server(self._handle_connection, socketPath)
+        else:
+            server = await asyncio.start_server(self._handle_connection, '127.0.0.1', port)
+        log.info(f'🚀 serving on {socketPath or f"127.0.0.1:{port}"} with {self.workers} workers')
+
+        async with server:
+            await server.serve_forever()
+
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Handle requests of a (keep-alive) connection
+
+        Args:
+            reader (asyncio.StreamReader): connection input
+            writer (asyncio.StreamWriter): connection output
+        """
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+
+                if isinstance(body, int): # request was rejected while reading, body holds status
+                    status, responseHeaders, responseBody = body, {}, b''
+                else:
+                    status, responseHeaders, responseBody = await self._route(method, path, headers, body)
+
+                keepAlive = headers.get('connection', '').lower() != 'close' and status not in (400, 411, 413)
+                self._write_response(writer, status, responseHeaders, responseBody, keepAlive)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> tuple:
+        """Read HTTP request
+
+        Args:
+            reader (asyncio.StreamReader): connection input
+
+        Returns:
+            tuple: method, path, headers (lower case names), body (or status code when the request is rejected),
+                None when connection is closed
+        """
+        requestLine = await reader.readline()
+        if not requestLine.strip():
+            return None
+
+        try:
+            method, path, _ = requestLine.decode('latin-1').split()
+        except ValueError:
+            return '', '', {}, 400
+
+        headers = {}
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if method != 'POST':
+            return method, path, headers, b''
+        if 'content-length' not in headers:
+            return method, path, headers, 411
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            return method, path, headers, 400
+        if length > MAX_BODY_SIZE:
+            return method, path, headers, 413
+        return method, path, headers, await reader.readexactly(length)
+
+
+    async def _route(self, method: str, path: str, headers: dict, body: bytes) -> tuple[int, dict, bytes]:
+        """Dispatch request to its handler
+
+        Args:
+            method (str): HTTP method
+            path (str): request path
+            headers (dict): request headers
+            body (bytes): request body
+
+        Returns:
+            tuple[int, dict, bytes]: status, response headers, response body
+        """
+        if method == 'GET' and path == '/health':
+            return self._json(200, {'status': 'ok', 'workers': self.workers, 'pending': self.pending, 'queue_depth': self.queueDepth})
+        if method == 'GET' and path == '/latency':
+            return self._json(200, {operation: self._percentiles(samples) for operation, samples in self.latencies.items()})
+        if method != 'POST' or path not in ('/embed', '/extract'):
+            return 404, {}, b''
+
+        if self.pending >= self.workers + self.queueDepth:
+            return 503, {'Retry-After': '1'}, b''
+
+        operation = path[1:]
+        secret = headers.get('x-password', '')
+        try:
+            if operation == 'embed':
+                imageLength = int(headers['x-image-length'])
+                contentType = ContentType[headers.get('x-content-type', 'file').upper()]
+                arguments = (_embed, body[:imageLength], body[imageLength:], contentType, secret, headers.get('x-image-format', 'PNG'))
+            else:
+                arguments = (_extract, body, secret)
+        except (KeyError, ValueError) as exception:
+            return 400, {}, f'{type(exception).__name__}: {exception}'.encode()
+
+        start = time.perf_counter()
+        self.pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, *arguments)
+        except (KeyError, ValueError, RuntimeError, OSError) as exception: # bad format of input, unknown image format
+            return 400, {}, f'{type(exception).__name__}: {exception}'.encode()
+        except Exception as exception:
+            log.error(f'🚨 {operation} failed: {exception}')
+            return 500, {}, b''
+        finally:
+            self.pending -= 1
+            self.latencies[operation].append(time.perf_counter() - start)
+
+        if operation == 'embed':
+            if result is None:
+                return 422, {}, b'content doesn\'t fit into input image'
+            return 200, {'Content-Type': 'application/octet-stream'}, result
+
+        data, contentType = result
+        return 200, {'Content-Type': 'application/octet-stream', 'X-Content-Type': contentType.name.lower()}, data
+
+
+    def _write_response(self, writer: asyncio.StreamWriter, status: int, headers: dict, body: bytes, keepAlive: bool) -> None:
+        head = [f'HTTP/1.1 {status} {REASONS[status]}', f'Content-Length: {len(body)}',
+                f'Connection: {"keep-alive" if keepAlive else "close"}']
+        head += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        writer.write(body)
+
+
+    def _json(self, status: int, content: dict) -> tuple[int, dict, bytes]:
+        return status, {'Content-Type': 'application/json'}, json.dumps(content).encode()
+
+
+    def _percentiles(self, samples: deque) -> dict:
+        """Compute percentiles of latency samples
+
+        Args:
+            samples (deque): latencies in seconds
+
+        Returns:
+            dict: number of samples, p50 and p99 in seconds (None without samples)
+        """
+        ordered = sorted(samples)
+        percentile = lambda p: ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else None
+        return {'count': len(ordered), 'p50': percentile(0.5), 'p99': percentile(0.99)}
+
+
+def _ping() -> None:
+    """Job doing nothing, starts worker process"""
+
+
+def _embed(image: bytes, payload: bytes, contentType: ContentType, secret: str, imageFormat: str) -> bytes:
+    """Embed payload into image, executed in worker process
+
+    Args:
+        image (bytes): encoded input image
+        payload (bytes): data to embed
+        contentType (ContentType): content type of the payload
+        secret (str): secret password for encryption
+        imageFormat (str): lossless format of the output image
+
+    Raises:
+        ValueError: when the format is lossy
+
+    Returns:
+        bytes: encoded output image, None when payload doesn't fit into the image
+    """
+    embedService = EmbedService.get_instance()
+    imageFormat = image_format('', imageFormat)
+    outputImage = embedService.embed_data(payload, io.BytesIO(image), secret, contentType)
+    if outputImage is None:
+        return None
+
+    output = io.BytesIO()
+    encode_image(outputImage, output, imageFormat, embedService.compressLevel, outputImage.info)
+    return output.getvalue()
+
+
+def _extract(image: bytes, secret: str) -> tuple[bytes, ContentType]:
+    """Extract payload from image, executed in worker process
+
+    Args:
+        image (bytes): encoded image with embedded payload
+        secret (str): secret password for decryption
+
+    Returns:
+        tuple[bytes, ContentType]: payload, its content type
+    """
+    return EmbedService.get_instance().extract_data(io.BytesIO(image), secret)
@@ -0,0 +1,234 @@
+import io
+import logging
+import lzma
+import zlib
+from contextlib import nullcontext
+from typing import BinaryIO
+from Codec import Codec
+
+
+class CompressService:
+    """Responsible for compressing data before encryption and decompressing them after decryption.
+    Singleton pattern.
+    """
+
+    CHUNK_SIZE = 1024 * 1024 # number of bytes compressed at once
+    TRIAL_SIZE = 64 * 1024 # number of bytes compressed to decide whether data are compressible
+    INCOMPRESSIBLE_RATIO = 0.95 # data compressed to more than this ratio of their size aren't compressed
+    ZLIB_LEVEL = 6
+
+    _instance = None
+    _log = logging.getLogger('CompressService')
+
+
+    @classmethod
+    def get_instance(cls):
+        """Create singleton instance
+
+        Returns:
+            CompressService: singleton instance
+        """
+        if cls._instance == None:
+            cls._instance = cls.__new__(cls)
+        return cls._instance
+
+
+    def __init__(self):
+        """Singleton has forbidden constructor
+
+        Raises:
+            RuntimeError: when this method is called, call `get_instance()` instead
+        """
+        raise RuntimeError('Call get_instance() instead')
+
+
+    def compress_stream(self, inputStream: BinaryIO, size: int, codec: Codec, auto: bool = False, limit: int = None) -> tuple[BinaryIO, int, Codec]:
+        """Compress `size` bytes of input stream chunk by chunk. Compressed data are kept in memory, because their
+        size has to be known before they are embedded, `limit` bounds them.
+
+        Args:
+            inputStream (BinaryIO): stream to read the data from, seekable if `auto` is set
+            size (int): number of bytes to compress
+            codec (Codec): compression codec
+            auto (bool, optional): skip compression when a trial chunk is incompressible. Defaults to False.
+            limit (int, optional): max size of compressed data. Defaults to None (unlimited).
+
+        Raises:
+            ValueError: when compressed data exceed `limit`
+
+        Returns:
+            tuple[BinaryIO, int, Codec]: stream of (compressed) data, its size, codec used
+        """
+        if codec == Codec.NONE:
+            return inputStream, size, codec
+
+        if auto and not self._is_compressible(inputStream, min(size, self.TRIAL_SIZE), codec):
+            self._log.info('data are incompressible, compression skipped')
+            return inputStream, size, Codec.NONE
+
+        compressor = self._create_compressor(codec)
+        output = io.BytesIO()
+        remaining = size
+
+        while remaining > 0:
+            chunk = inputStream.read(min(remaining, self.CHUNK_SIZE))
+            if not chunk:
+                raise RuntimeError(f'input stream ended {remaining} bytes before expected size {size}')
+            remaining -= len(chunk)
+
+            output.write(compressor.compress(chunk))
+            if limit is not None and output.tell() > limit:
+                raise ValueError(f'compressed data exceed {limit} bytes')
+
+        output.write(compressor.flush())
+        if limit is not None and output.tell() > limit:
+            raise ValueError(f'compressed data exceed {limit} bytes')
+
+        self._log.info('🗜️ %d bytes compressed to %d bytes using %s', size, output.tell(), codec)
+        output.seek(0)
+        return output, output.getbuffer().nbytes, codec
+
+
+    def decompress_into(self, outputStream: BinaryIO, codec: Codec):
+        """Create context manager with a stream decompressing data written into it to output stream
+
+        Args:
+            outputStream (BinaryIO): stream to write decompressed data to
+            codec (Codec): compression codec
+
+        Returns:
+            context manager: yields writable stream
+        """
+        if codec == Codec.NONE:
+            return nullcontext(outputStream)
+        return DecompressWriter(outputStream, codec)
+
+
+    def compress_chunk(self, data: bytes, codec: Codec) -> bytes:
+        """Compress chunk of data on its own, so that it can be decompressed without the preceding chunks
+
+        Args:
+            data (bytes): chunk of data
+            codec (Codec): compression codec
+
+        Returns:
+            bytes: compressed chunk
+        """
+        if codec == Codec.NONE:
+            return data
+        compressor = self._create_compressor(codec)
+        return compressor.compress(data) + compressor.flush()
+
+
+    def decompress_chunk(self, data: bytes, codec: Codec) -> bytes:
+        """Decompress chunk compressed by `compress_chunk`
+
+        Args:
+            data (bytes): compressed chunk
+            codec (Codec): compression codec
+
+        Raises:
+            ValueError: when compressed chunk is corrupted or incomplete
+
+        Returns:
+            bytes: chunk of data
+        """
+        output = io.BytesIO()
+        try:
+            with self.decompress_into(output, codec) as decompressor:
+                decompressor.write(data)
+        except (zlib.error, lzma.LZMAError, RuntimeError) as exception:
+            raise ValueError(f'bad format compressed chunk: {exception}') from None
+        return output.getvalue()
+
+
+    def is_compressible(self, trial: bytes, codec: Codec) -> bool:
+        """Compress trial chunk of data
+
+        Args:
+            trial (bytes): trial chunk
+            codec (Codec): compression codec
+
+        Returns:
+            bool: True if the trial chunk compresses well
+        """
+        return len(self.compress_chunk(trial, codec)) <= len(trial) * self.INCOMPRESSIBLE_RATIO
+
+
+    def _is_compressible(self, inputStream: BinaryIO, trialSize: int, codec: Codec) -> bool:
+        """Compress trial chunk of stream and rewind the stream back
+
+        Args:
+            inputStream (BinaryIO): seekable stream to read the trial chunk from
+            trialSize (int): size of the trial chunk
+            codec (Codec): compression codec
+
+        Returns:
+            bool: True if the trial chunk compresses well
+        """
+        trial = inputStream.read(trialSize)
+        inputStream.seek(-len(trial), io.SEEK_CUR)
+        return self.is_compressible(trial, codec)
+
+
+    def _create_compressor(self, codec: Codec):
+        """Create compressor object of codec
+
+        Args:
+            codec (Codec): compression codec
+
+        Returns:
+            compressor with `compress` and `flush` methods
+        """
+        if codec == Codec.ZLIB:
+            return zlib.compressobj(self.ZLIB_LEVEL)
+        return lzma.LZMACompressor()
+
+
+class DecompressWriter:
+    """Writable stream decompressing written data into output stream. Checks that compressed data are
+    complete when leaving the context.
+    """
+
+    def __init__(self, outputStream: BinaryIO, codec: Codec):
+        """
+        Args:
+            outputStream (BinaryIO): stream to write decompressed data to
+            codec (Codec): compression codec
+        """
+        self.outputStream = outputStream
+        self._decompressor = zlib.decompressobj() if codec == Codec.ZLIB else lzma.LZMADecompressor()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exceptionType, *args) -> None:
+        if exceptionType is None:
+            self.close()
+
+
+    def write(self, data: bytes) -> int:
+        """Decompress data and write them to output stream
+
+        Args:
+            data (bytes): compressed data
+
+        Returns:
+            int: number of consumed bytes
+        """
+        self.outputStream.write(self._decompressor.decompress(data))
+        return len(data)
+
+
+    def close(self) -> None:
+        """Write rest of decompressed data
+
+        Raises:
+            RuntimeError: when compressed data are incomplete
+        """
+        if hasattr(self._decompressor, 'flush'):
+            self.outputStream.write(self._decompressor.flush())
+        if not self._decompressor.eof:
+            raise RuntimeError('bad format compressed data are incomplete')
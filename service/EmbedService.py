@@ -1,18 +1,58 @@
+import io
 import logging
 import os
+import sys
+import zlib
+import numpy as np
 from PIL import Image
 from generators import *
-from typing import Generator
+from bitplane import extract_bytes, to_rgb, BitWriter, BitReader, CoverLayout, RowDecoder, StripWriter, StripReader
+from container import ContainerIndex, ContainerWriter, pack_container, unpack_chunks
+from encoder import encode_frames, encode_image, image_format, preserve_source
+from frames import (FRAME_FORMATS, PARALLEL_FORMATS, FrameCursor, FrameReader, copy_frame, embed_frame, embed_frame_file, extract_frame,
+                    extract_frame_file, frame_count, frame_info, frame_spans, following_frame_channels, map_frames, split_in_order, split_stream)
+from scatter import SALT_LENGTH, ScatterPermutation, ScatterReader, ScatterWriter, gather_bits, scatter_seed
+from MessageHeader import DigestReader, MessageHeader
+from parallel import SharedArray, embed_bands, extract_bands
+from typing import BinaryIO, Callable, Generator, Iterable, Iterator
+from CipherMode import CipherMode
+from Codec import Codec
+from Kdf import Kdf
+from metrics import Cancelled, Metrics, NullMetrics, TimedStream
+from service.CompressService import CompressService
 from service.EncryptService import EncryptService
+from service.KeyService import KeyService
 
 
 class EmbedService:
         
     BITS_IN_BYTES = 8
+    STDIO_PATH = '-' # path standing for standard input or output
+    PROBE_HEADER_BYTES = 128 # number of header bytes whose rows are decoded at once when reading header, see `_row_decoder`
+    
+    legacyEngine = False # embed pixel by pixel using generators instead of whole-array operations
+    workers = 1 # number of processes embedding and extracting row bands of the image in parallel
+    stripRows = None # if set (and workers is 1), image is processed in place in strips of this many rows
+    depth = 1 # number of least significant bits of each channel holding embedded data
+    codec = Codec.NONE # codec compressing payload before encryption
+    autoCodec = False # skip compression when a trial chunk of payload is incompressible
+    kdf = Kdf.SCRYPT # key derivation function deriving encryption key from password
+    cipherMode = CipherMode.CBC # block cipher mode of encryption, CTR and GCM data can be decrypted from any position
+    container = False # embed files as chunk-indexed container, any byte range of it can be extracted on its own
+    containerChunkSize = 1024 * 1024 # number of plain bytes in a chunk of container
+    scatter = False # scatter data over channels in order of permutation derived from the key, not from the first rows
+    imageFormat = None # lossless format of output images, None takes it from extension of output file
+    compressLevel = None # compression level (0 fastest - 9 smallest) of PNG and WebP output images, None is PNG default
+    update = False # replace data embedded into input image (reusing its header) instead of embedding into clean cover
+    coverCache = None # CoverCache of decoded covers, embedding into a cached cover skips decoding it
+    metrics: Metrics = NullMetrics() # records time, bytes and pixels of stages of every embedding and extraction
+    progress = None # called with (embedded bytes, total bytes) after every chunk, returning False cancels embedding
     
     _instance = None
     _log = logging.getLogger('EmbedService')
     _encryptService = EncryptService.get_instance()
+    _compressService = CompressService.get_instance()
+    _keyService = KeyService.get_instance()
     
     
     @classmethod
@@ -27,27 +67,56 @@ class EmbedService:
         return cls._instance
     
     
-    def embed_file(self, pathToFileToEmbed: str, pathToInputImage: str, pathToOutputImage: str, secret: str = '') -> None:
-        """Embed file into another file.
+    def embed_file(self, pathToFileToEmbed: str, pathToInputImage: str, pathToOutputImage: str, secret: str = '') -> bool:
+        """Embed file into another file. File is compressed (if `codec` is set), encrypted and embedded chunk by
+        chunk, nothing but the output image is written to disk.
 
         Args:
             pathToInputImage (str): path to the input file - message will be embedded into this file
             pathToOutputImage (str): path to the output file - file with embedded message inside
-            pathToFileToEmbed (str): path to the file that you want to embed/hide
+            pathToFileToEmbed (str): path to the file that you want to embed/hide, `STDIO_PATH` reads stdin
             secret (str, optional): secret password for encryption. Defaults to ''.
+
+        Returns:
+            bool: True if the file was embedded, False if it doesn't fit into the input image
         """
-        if not self._validate_size(pathToInputImage, pathToFileToEmbed=pathToFileToEmbed):
-            self._log.error('🚨 input image is to small, embedded content can\'t fit there')
-            return
+        if self.container:
+            return self.embed_files([pathToFileToEmbed], pathToInputImage, pathToOutputImage, secret)
+        
+        payload, payloadSize = self._open_payload(pathToFileToEmbed)
         
-        encryptedFileName = pathToFileToEmbed + '.encrypted'
-        self._encryptService.encrypt_file(pathToFileToEmbed, encryptedFileName, secret)
-        generator = file_generator(encryptedFileName)
-        self._embed_bytes(pathToInputImage, pathToOutputImage, generator)
-        os.remove(encryptedFileName) # remove encrypted file for fs
+        with payload:
+            return self._embed_into_file(payload, payloadSize, ContentType.FILE, pathToInputImage, pathToOutputImage, secret)
         
         
-    def embed_string(self, plainText: str, pathToInputImage: str, pathToOutputImage: str, secret: str = '') -> None:
+    def embed_files(self, pathsToFilesToEmbed: list[str], pathToInputImage: str, pathToOutputImage: str, secret: str = '') -> bool:
+        """Embed files into another file as chunk-indexed container. Files are split into chunks compressed
+        (if `codec` is set) on their own, so that any byte range of their concatenated content can be extracted
+        without decoding and decrypting the rest.
+
+        Args:
+            pathsToFilesToEmbed (list[str]): paths to the files that you want to embed/hide, `STDIO_PATH` reads stdin
+            pathToInputImage (str): path to the input file - files will be embedded into this file
+            pathToOutputImage (str): path to the output file - file with embedded files inside
+            secret (str, optional): secret password for encryption. Defaults to ''.
+
+        Returns:
+            bool: True if the files were embedded, False if they don't fit into the input image
+        """
+        files = []
+        try:
+            for path in pathsToFilesToEmbed:
+                name = 'stdin' if path == self.STDIO_PATH else os.path.basename(path)
+                files.append((name, *self._open_payload(path)))
+            
+            filesSize = sum(size for _, _, size in files)
+            return self._embed_into_file(None, filesSize, ContentType.FILE, pathToInputImage, pathToOutputImage, secret, files)
+        finally:
+            for _, payload, _ in files:
+                payload.close()
+        
+        
+    def embed_string(self, plainText: str, pathToInputImage: str, pathToOutputImage: str, secret: str = '') -> bool:
         """Embed string into another file.
 
         Args:
@@ -55,65 +124,796 @@ class EmbedService:
             pathToInputImage (str): path to the input file - message will be embedded into this file
             pathToOutputImage (str): path to the output file - file with embedded message inside
             secret (str, optional): secret password for encryption. Defaults to ''.
+
+        Returns:
+            bool: True if the string was embedded, False if it doesn't fit into the input image
+        """
+        plainText = bytes(plainText, 'utf-8')
+        return self._embed_into_file(io.BytesIO(plainText), len(plainText), ContentType.STRING, pathToInputImage, pathToOutputImage, secret)
+        
+    
+    def embed_data(self, data: bytes, inputImage: BinaryIO, secret: str = '', contentType: ContentType = ContentType.FILE) -> Image.Image:
+        """Embed data into image in memory, nothing is written to disk.
+
+        Args:
+            data (bytes): data to embed
+            inputImage (BinaryIO): encoded input image (or path to it) - data will be embedded into it
+            secret (str, optional): secret password for encryption. Defaults to ''.
+            contentType (ContentType, optional): content type of the data. Defaults to ContentType.FILE.
+
+        Raises:
+            Cancelled: when `progress` callback cancels embedding
+
+        Returns:
+            pillow Image: image with embedded data, None if data don't fit into the input image
+        """
+        try:
+            return self._embed_payload(io.BytesIO(data), len(data), contentType, inputImage, secret)
+        finally:
+            self.metrics.emit('embed')
+        
+    
+    def _embed_into_file(self, payload: BinaryIO, payloadSize: int, contentType: ContentType, pathToInputImage: str, pathToOutputImage: str, secret: str,
+                         files: list[tuple[str, BinaryIO, int]] = None) -> bool:
+        """Embed payload into input image and save it to output file.
+
+        Args:
+            payload (BinaryIO): seekable stream of the payload
+            payloadSize (int): payload size in bytes
+            contentType (ContentType): content type of the payload
+            pathToInputImage (str): path to the input file - message will be embedded into this file
+            pathToOutputImage (str): path to the output file - file with embedded message inside
+            secret (str): secret password for encryption
+            files (list[tuple[str, BinaryIO, int]], optional): names, seekable streams and sizes of files embedded
+                as container instead of the payload. Defaults to None.
+
+        Raises:
+            Cancelled: when `progress` callback cancels embedding
+            ValueError: when format of the output file is lossy
+
+        Returns:
+            bool: True if the payload was embedded, False if it doesn't fit into the input image
         """
-        if not self._validate_size(pathToInputImage, plainText=plainText):
+        try:
+            imageFormat = image_format(pathToOutputImage, self.imageFormat) # reject lossy format before embedding
+            outputImage = self._embed_payload(payload, payloadSize, contentType, pathToInputImage, secret, files, imageFormat in FRAME_FORMATS)
+            if outputImage is None:
+                return False
+            
+            if os.path.exists(pathToOutputImage) and os.path.samefile(pathToInputImage, pathToOutputImage):
+                # image updated in place is replaced only when the output is complete
+                root, extension = os.path.splitext(pathToOutputImage)
+                temporaryPath = f'{root}.{os.getpid()}.tmp{extension}'
+                self._save_image(outputImage, temporaryPath)
+                os.replace(temporaryPath, pathToOutputImage)
+            else:
+                self._save_image(outputImage, pathToOutputImage)
+            return True
+        finally:
+            self.metrics.emit('embed')
+        
+    
+    def _embed_payload(self, payload: BinaryIO, payloadSize: int, contentType: ContentType, inputImage: BinaryIO, secret: str,
+                       files: list[tuple[str, BinaryIO, int]] = None, frames: bool = False) -> Image.Image | Iterator[Image.Image]:
+        """Compress, encrypt and embed payload into input image.
+
+        Args:
+            payload (BinaryIO): seekable stream of the payload
+            payloadSize (int): payload size in bytes
+            contentType (ContentType): content type of the payload
+            inputImage (BinaryIO): encoded input image or path to it
+            secret (str): secret password for encryption
+            files (list[tuple[str, BinaryIO, int]], optional): names, seekable streams and sizes of files packed
+                into container instead of the payload. Defaults to None.
+            frames (bool, optional): keep all frames of multi-frame input image given by path, payload that doesn't
+                fit into the first frame is spread over the following ones (see frames.py). Defaults to False (only
+                the first frame is embedded into).
+
+        Raises:
+            Cancelled: when `progress` callback cancels embedding
+            ValueError: when `update` is set and input image holds no embedded message (or the password is wrong)
+
+        Returns:
+            pillow Image | Iterator[pillow Image]: image with embedded payload (its frames, embedded as they are
+                iterated, when `frames` is set and the input image has more of them), None if the payload doesn't
+                fit into the input image
+        """
+        if self.update:
+            return self._update_payload(payload, payloadSize, contentType, inputImage, secret, files, frames)
+        pathToInputImage = inputImage
+        inputImage, layout = self._open_cover(inputImage)
+        numberOfChannels = layout.number_of_channels(inputImage.size)
+        frames = frames and isinstance(pathToInputImage, str) and not self.legacyEngine and frame_count(inputImage) > 1
+        frameChannels = [] # channels of frames following the first one, scattered data stay in the first frame
+        if frames and not self.scatter:
+            with self.metrics.stage('decode'):
+                frameChannels = following_frame_channels(pathToInputImage, MessageHeader.MAX_FRAMES - 1)
+        
+        try:
+            with self.metrics.stage('compress', payloadSize):
+                payload, payloadSize, codec = self._compress_payload(payload, payloadSize, files, self._capacity(numberOfChannels + sum(frameChannels)))
+        except ValueError:
+            payloadSize, codec = None, self.codec
+        payloadLayout = MessageHeader.PLAIN_LAYOUT if files is None else MessageHeader.CONTAINER_LAYOUT
+        
+        keyDerivation = b''
+        if self.kdf != Kdf.NONE:
+            with self.metrics.stage('derive'):
+                secret, keyDerivation = self._keyService.new_key(secret, self.kdf)
+        
+        scatter = os.urandom(SALT_LENGTH) if self.scatter else b''
+        with self.metrics.stage('validate'):
+            fits = payloadSize is not None and self._validate_size(numberOfChannels, payloadSize, contentType, codec, keyDerivation, payloadLayout, scatter,
+                                                                   frameChannels)
+        if not fits:
             self._log.error('🚨 input image is to small, embedded content can\'t fit there')
-            return
+            return None
         
-        encryptedMessage = self._encryptService.encrypt_string(plainText, secret)
-        generator = bytes_generator(encryptedMessage, ContentType.STRING)
-        self._embed_bytes(pathToInputImage, pathToOutputImage, generator)
+        chunks = self.metrics.timed('encrypt', self._encryptService.encrypt_stream(payload, payloadSize, secret, self.cipherMode.value))
+        encryptedSize = self._encryptService.encrypted_size(payloadSize, self.cipherMode.value)
+        header = MessageHeader(encryptedSize, contentType, self.depth, codec, keyDerivation, self.cipherMode, payloadLayout, scatter=scatter,
+                               version=0 if self.legacyEngine else MessageHeader.VERSION)
+        if self.legacyEngine:
+            self._validate_legacy_header(header)
+            encryptedPayload = b''.join(bytes(chunk) for chunk in chunks)
+            generator = bytes_generator(encryptedPayload, contentType)
+            with self.metrics.stage('embed', header.size, inputImage.width * inputImage.height):
+                return self._preserve_source(self._embed_bytes(to_rgb(inputImage), generator), inputImage, layout)
+        if header.channels() > numberOfChannels:
+            header.frames = self._frame_sizes(header, numberOfChannels, frameChannels)
+            return self._embed_chunks_into_frames(pathToInputImage, inputImage, layout, chunks, header)
+        if header.scatter:
+            outputImage = self._preserve_source(self._embed_chunks_scattered(inputImage, layout, chunks, header, secret), inputImage, layout)
+        else:
+            outputImage = self._preserve_source(self._embed_chunks(inputImage, layout, chunks, header), inputImage, layout)
+        return self._following_frames(outputImage, pathToInputImage, inputImage) if frames else outputImage
         
     
-    def _validate_size(self, pathToInputImage: str, pathToFileToEmbed: str = None, plainText: str = None) -> bool:
-        """Validate if input image is big enough to fit in the embedded content.
+    def _update_payload(self, payload: BinaryIO, payloadSize: int, contentType: ContentType, inputImage: BinaryIO, secret: str,
+                        files: list[tuple[str, BinaryIO, int]] = None, frames: bool = False) -> Image.Image | Iterator[Image.Image]:
+        """Compress, encrypt and embed payload into image holding embedded message in place of the message, so that
+        the clean cover isn't needed. Key derivation record (the password is verified by it), cipher mode, depth and
+        scatter salt of its header are reused, the payload is encrypted with fresh IV (nonce). Only channels whose
+        embedded bits differ change - the header and the data, channels of the old data following the new ones are
+        overwritten with random bits (so that the old message can't be recovered), rows after both are untouched.
+        Channels of scattered old message are overwritten with random bits as a whole before the new one is scattered.
 
         Args:
-            pathToInputImage (str): path to the input image - message will be embedded into this file
-            pathToFileToEmbed (str, optional): path to the file to embed. Defaults to None.
-            plainText (str, optional): plain text to embed. Defaults to None.
+            payload (BinaryIO): seekable stream of the payload
+            payloadSize (int): payload size in bytes
+            contentType (ContentType): content type of the payload
+            inputImage (BinaryIO): encoded image holding embedded message or path to it
+            secret (str): secret password the message was encrypted with
+            files (list[tuple[str, BinaryIO, int]], optional): names, seekable streams and sizes of files packed
+                into container instead of the payload. Defaults to None.
+            frames (bool, optional): keep all frames of multi-frame image given by path, the message is updated
+                in the first one. Defaults to False.
+
+        Raises:
+            Cancelled: when `progress` callback cancels embedding
+            ValueError: when image holds no embedded message, only a shard of it, message spread over frames or
+                the password is wrong
 
         Returns:
-            bool: _description_
+            pillow Image | Iterator[pillow Image]: image with embedded payload (its frames when `frames` is set and
+                the image has more of them), None if the payload doesn't fit into the image
         """
-        numberOfBytesToEmbed = 0
+        pathToInputImage = inputImage
+        with self.metrics.stage('decode'):
+            inputImage = Image.open(inputImage)
+            rows = self._row_decoder(pathToInputImage, inputImage)
+            previous, layout = self._find_header(rows)
+        self._validate_whole_message(previous)
+        if previous.frames:
+            raise ValueError(f'embedded message is spread over {len(previous.frames)} frames, it can\'t be updated in place')
+        numberOfChannels = layout.number_of_channels(inputImage.size)
+        secret = self._message_key(previous, secret)
+        
+        try:
+            with self.metrics.stage('compress', payloadSize):
+                payload, payloadSize, codec = self._compress_payload(payload, payloadSize, files, self._capacity(numberOfChannels))
+        except ValueError:
+            self._log.error('🚨 input image is to small, embedded content can\'t fit there')
+            return None
+        payloadLayout = MessageHeader.PLAIN_LAYOUT if files is None else MessageHeader.CONTAINER_LAYOUT
         
-        # number of row bytes to embed
-        if plainText:
-            numberOfBytesToEmbed = len(plainText)
-        elif pathToFileToEmbed:
-            numberOfBytesToEmbed = os.path.getsize(pathToFileToEmbed)
+        encryptedSize = self._encryptService.encrypted_size(payloadSize, previous.cipherMode.value)
+        header = MessageHeader(encryptedSize, contentType, previous.depth, codec, previous.keyDerivation, previous.cipherMode, payloadLayout,
+                               scatter=previous.scatter)
+        if header.channels() > numberOfChannels:
+            self._log.error('🚨 input image is to small, embedded content can\'t fit there')
+            return None
+        
+        # stale bytes of the old data following the new ones, scattered old data are overwritten as a whole (the
+        # permutation depends on length of the header, which may differ by its fields)
+        padding = 0 if header.scatter else \
+            max(previous.payload_offset() + previous.stored_size() * 8 - header.payload_offset() - header.stored_size() * 8, 0) // 8
+        extent = max(previous.channels(), header.channels())
+        previousChannels = None if header.scatter else self._read_channels(rows, layout, extent)
+        
+        chunks = self.metrics.timed('encrypt', self._encryptService.encrypt_stream(payload, payloadSize, secret, previous.cipherMode.value))
+        if header.scatter:
+            outputImage = self._embed_chunks_scattered(inputImage, layout, chunks, header, secret, previous)
         else:
-            return False
+            outputImage = self._embed_chunks(inputImage, layout, chunks, header, padding)
+            changed = np.count_nonzero(np.asarray(outputImage).reshape(-1)[:extent] != previousChannels)
+            self._log.info('🔁 embedded message of %d bytes replaced by %d bytes - %d of %d channels changed (rows 0-%d)',
+                           previous.size, header.size, changed, extent, -(-extent // layout.number_of_channels((inputImage.width, 1))) - 1)
+        outputImage = self._preserve_source(outputImage, inputImage, layout)
+        if frames and isinstance(pathToInputImage, str) and frame_count(inputImage) > 1:
+            return self._following_frames(outputImage, pathToInputImage, inputImage)
+        return outputImage
+        
+    
+    def encrypt_payload(self, payload: BinaryIO, payloadSize: int, contentType: ContentType, limit: int, secret: str,
+                        files: list[tuple[str, BinaryIO, int]] = None) -> tuple[bytearray, MessageHeader]:
+        """Compress and encrypt payload into memory, so that it can be split into shards embedded into more images.
+
+        Args:
+            payload (BinaryIO): seekable stream of the payload
+            payloadSize (int): payload size in bytes
+            contentType (ContentType): content type of the payload
+            limit (int): max size of compressed payload - capacity of all images
+            secret (str): secret password for encryption
+            files (list[tuple[str, BinaryIO, int]], optional): names, seekable streams and sizes of files packed
+                into container instead of the payload. Defaults to None.
+
+        Returns:
+            tuple[bytearray, MessageHeader]: encrypted payload, its header; None if compressed payload exceeds `limit`
+        """
+        try:
+            with self.metrics.stage('compress', payloadSize):
+                payload, payloadSize, codec = self._compress_payload(payload, payloadSize, files, limit)
+        except ValueError:
+            return None
+        layout = MessageHeader.PLAIN_LAYOUT if files is None else MessageHeader.CONTAINER_LAYOUT
+        
+        keyDerivation = b''
+        if self.kdf != Kdf.NONE:
+            with self.metrics.stage('derive'):
+                secret, keyDerivation = self._keyService.new_key(secret, self.kdf)
+        
+        encryptedPayload = bytearray()
+        for chunk in self.metrics.timed('encrypt', self._encryptService.encrypt_stream(payload, payloadSize, secret, self.cipherMode.value)):
+            encryptedPayload += chunk
+        return encryptedPayload, MessageHeader(len(encryptedPayload), contentType, self.depth, codec, keyDerivation, self.cipherMode, layout)
+        
+    
+    def embed_shard(self, shard: bytes, header: MessageHeader, pathToInputImage: str, pathToOutputImage: str) -> None:
+        """Embed shard of encrypted payload into input image and save it to output file.
 
-        # number of bytes to embed after encryption
-        if numberOfBytesToEmbed % EncryptService.BLOCK_SIZE != 0:
-            numberOfBytesToEmbed = ((numberOfBytesToEmbed // EncryptService.BLOCK_SIZE) + 1) * EncryptService.BLOCK_SIZE
+        Args:
+            shard (bytes): part of encrypted payload
+            header (MessageHeader): header of the shard - size of the shard, set ID, index and count of shards
+            pathToInputImage (str): path to the input file - shard will be embedded into this file
+            pathToOutputImage (str): path to the output file - file with embedded shard inside
+
+        Raises:
+            ValueError: when the shard doesn't fit into the input image or format of the output file is lossy
+        """
+        image_format(pathToOutputImage, self.imageFormat) # reject lossy format before embedding
+        inputImage, layout = self._open_cover(pathToInputImage)
+        if self.data_capacity(layout.number_of_channels(inputImage.size), header) < len(shard):
+            raise ValueError(f'shard of {len(shard)} bytes doesn\'t fit into {pathToInputImage}')
+        self._save_image(self._preserve_source(self._embed_chunks(inputImage, layout, [shard], header), inputImage, layout), pathToOutputImage)
+        
+    
+    def _open_cover(self, inputImage: BinaryIO) -> tuple[Image.Image, CoverLayout]:
+        """Open input image and find its layout. Input image given by path is taken from `coverCache` if it's set,
+        so that cached cover isn't decoded again.
+
+        Args:
+            inputImage (BinaryIO): encoded input image or path to it
+
+        Returns:
+            tuple[pillow Image, CoverLayout]: input image, its layout
+        """
+        with self.metrics.stage('decode'):
+            if self.coverCache is not None and isinstance(inputImage, str):
+                return self.coverCache.open(inputImage, self.metrics)
+            inputImage = Image.open(inputImage)
+            return inputImage, CoverLayout.of(inputImage)
+        
+    
+    def data_capacity(self, numberOfChannels: int, header: MessageHeader) -> int:
+        """Number of data bytes that fit into image after the header
+
+        Args:
+            numberOfChannels (int): number of channels of the image holding data, see `CoverLayout`
+            header (MessageHeader): header of the data (its size doesn't matter)
 
-        # add bytes containing metadata
-        numberOfBytesToEmbed += EncryptService.INIT_VECTOR_LENGTH
-        numberOfBytesToEmbed += EncryptService.SIZE_LENGTH
-        numberOfBytesToEmbed += MESSAGE_CONTENT_SIZE
-        numberOfBytesToEmbed += MESSAGE_CONTENT_SIZE
+        Returns:
+            int: number of bytes, negative when not even the header fits
+        """
+        digestLength = header.stored_size() - header.size
+        return (numberOfChannels - len(header) * self.BITS_IN_BYTES) * header.depth // self.BITS_IN_BYTES - digestLength
         
-        width, height = Image.open(pathToInputImage).size
-        numberOfBytesOfInputImagePixels = width * height * 3 # 3 because of 3 color channels (R, G, B)
+    
+    def _compress_payload(self, payload: BinaryIO, payloadSize: int, files: list[tuple[str, BinaryIO, int]], limit: int) -> tuple[BinaryIO, int, Codec]:
+        """Compress payload (if `codec` is set) or pack files into container
+
+        Args:
+            payload (BinaryIO): seekable stream of the payload
+            payloadSize (int): payload size in bytes
+            files (list[tuple[str, BinaryIO, int]]): names, seekable streams and sizes of files packed into container
+                instead of the payload, None for the payload
+            limit (int): max size of compressed payload
+
+        Raises:
+            ValueError: when compressed payload exceeds `limit`
+
+        Returns:
+            tuple[BinaryIO, int, Codec]: stream of compressed payload, its size, codec
+        """
+        if files is None:
+            return self._compressService.compress_stream(payload, payloadSize, self.codec, self.autoCodec, limit)
+        return self._pack_container(files, limit)
+    
+    
+    def _validate_size(self, numberOfChannels: int, payloadSize: int, contentType: ContentType, codec: Codec = Codec.NONE,
+                       keyDerivation: bytes = b'', layout: int = MessageHeader.PLAIN_LAYOUT, scatter: bytes = b'',
+                       frameChannels: list[int] = ()) -> bool:
+        """Validate if input image is big enough to fit in the embedded content, in its first frame or spread over
+        its frames.
+
+        Args:
+            numberOfChannels (int): number of channels of the input image (its first frame) holding data, see `CoverLayout`
+            payloadSize (int): size of the (compressed) payload to embed in bytes
+            contentType (ContentType): content type of the payload
+            codec (Codec, optional): codec the payload was compressed with. Defaults to Codec.NONE.
+            keyDerivation (bytes, optional): key derivation record of the header. Defaults to b''.
+            layout (int, optional): layout of the payload. Defaults to MessageHeader.PLAIN_LAYOUT.
+            scatter (bytes, optional): salt of scatter permutation of the header. Defaults to b''.
+            frameChannels (list[int], optional): number of channels of frames following the first one the content
+                can be spread over. Defaults to () (single-frame image).
+
+        Returns:
+            bool: True if the content fits into the image
+        """
+        # number of bytes to embed after encryption and channels holding them with the header
+        numberOfBytesToEmbed = self._encryptService.encrypted_size(payloadSize, self.cipherMode.value)
+        header = MessageHeader(numberOfBytesToEmbed, contentType, self.depth, codec, keyDerivation, self.cipherMode, layout, scatter=scatter)
+        numberOfChannelsToEmbed = header.channels()
         
         # validation
-        numberOfBitsToEmbed = numberOfBytesToEmbed * self.BITS_IN_BYTES
-        self._log.info(f'number of bits to embed: {numberOfBitsToEmbed} to number of bytes of input image pixels {numberOfBytesOfInputImagePixels}')
-        return numberOfBytesOfInputImagePixels > numberOfBitsToEmbed # 1 bit is embedded into one byte of input image
+        self._log.info('number of channels to embed into: %d (%d bits per channel) to number of channels of input image %d',
+                       numberOfChannelsToEmbed, self.depth, numberOfChannels)
+        if numberOfChannels >= numberOfChannelsToEmbed:
+            return True
+        frameSizes = self._frame_sizes(header, numberOfChannels, frameChannels)
+        if frameSizes is not None:
+            self._log.info('content spread over %d of %d frames', len(frameSizes), len(frameChannels) + 1)
+        return frameSizes is not None
+    
+    
+    def _frame_sizes(self, header: MessageHeader, numberOfChannels: int, frameChannels: list[int]) -> list[int]:
+        """Split data and their digest over the fewest frames that hold them, see frames.py
+
+        Args:
+            header (MessageHeader): header of the data
+            numberOfChannels (int): number of channels of the first frame holding data
+            frameChannels (list[int]): number of channels of frames following the first one
+
+        Returns:
+            list[int]: number of bytes held by every frame, None if the data don't fit into the frames
+        """
+        frames = header.frames
+        try:
+            for count in range(2, len(frameChannels) + 2):
+                # sizes of frames are stored in the header, which gets longer with every frame
+                header.frames = [0] * count
+                firstCapacity = (numberOfChannels - len(header) * self.BITS_IN_BYTES) * header.depth // self.BITS_IN_BYTES
+                capacities = [firstCapacity] + [channels * header.depth // self.BITS_IN_BYTES for channels in frameChannels[:count - 1]]
+                if firstCapacity > 0 and sum(capacities) >= header.stored_size():
+                    return split_in_order(header.stored_size(), capacities)
+            return None
+        finally:
+            header.frames = frames
+    
+    
+    def _pack_container(self, files: list[tuple[str, BinaryIO, int]], limit: int) -> tuple[BinaryIO, int, Codec]:
+        """Pack files into chunk-indexed container, compressing every chunk on its own
+
+        Args:
+            files (list[tuple[str, BinaryIO, int]]): names, seekable streams and sizes of files
+            limit (int): max size of container
+
+        Raises:
+            ValueError: when container exceeds `limit`
+
+        Returns:
+            tuple[BinaryIO, int, Codec]: stream of container, its size, codec of chunks
+        """
+        codec = self.codec
+        if codec != Codec.NONE and self.autoCodec and files:
+            _, stream, size = files[0]
+            trial = stream.read(min(size, self._compressService.TRIAL_SIZE))
+            stream.seek(-len(trial), io.SEEK_CUR)
+            if not self._compressService.is_compressible(trial, codec):
+                self._log.info('data are incompressible, compression skipped')
+                codec = Codec.NONE
+        
+        container, size = pack_container(files, self.containerChunkSize, lambda chunk: self._compressService.compress_chunk(chunk, codec), limit)
+        self._log.info('📦 %d files packed into container of %d bytes', len(files), size)
+        return container, size, codec
+    
+    
+    def _capacity(self, numberOfChannels: int) -> int:
+        """Upper bound of number of bytes that fit into input image
+
+        Args:
+            numberOfChannels (int): number of channels of the input image holding data
+
+        Returns:
+            int: number of bytes
+        """
+        return numberOfChannels * self.depth // self.BITS_IN_BYTES
+    
+    
+    def _validate_legacy_header(self, header: MessageHeader) -> None:
+        """Validate that header can be embedded by legacy engine
+
+        Args:
+            header (MessageHeader): header of embedded data
+
+        Raises:
+            ValueError: when header has optional fields (depth, codec, key derivation, cipher mode)
+        """
+        if len(header) != HEADER_SIZE:
+            raise ValueError('legacy engine embeds only 1 bit per channel without compression and key derivation (kdf none) using CBC')
+        
+    
+    def _open_payload(self, pathToFileToEmbed: str) -> tuple[BinaryIO, int]:
+        """Open file to embed. Standard input is read into memory, because its size has to be known upfront.
+
+        Args:
+            pathToFileToEmbed (str): path to the file to embed, `STDIO_PATH` for standard input
+
+        Returns:
+            tuple[BinaryIO, int]: opened payload, payload size in bytes
+        """
+        if pathToFileToEmbed == self.STDIO_PATH:
+            data = sys.stdin.buffer.read()
+            return io.BytesIO(data), len(data)
+        
+        payload = open(pathToFileToEmbed, 'rb')
+        return payload, os.fstat(payload.fileno()).st_size
+    
+    
+    def _embed_chunks(self, inputImage: Image.Image, layout: CoverLayout, chunks: Iterable[bytes], header: MessageHeader,
+                      padding: int = 0) -> Image.Image:
+        """Embed data chunk by chunk with its header to the input image using whole-array operations. Produces
+        the same output as `_embed_bytes` for RGB images.
+
+        Args:
+            inputImage (pillow Image): input image
+            layout (CoverLayout): layout of the input image
+            chunks (Iterable[bytes]): data to embed
+            header (MessageHeader): header of the data, its size is total size of chunks
+            padding (int, optional): number of random bytes embedded after the data. Defaults to 0.
+
+        Returns:
+            pillow Image: image with embedded data in mode of the layout
+        """
+        if self.workers > 1:
+            with self.metrics.stage('decode', pixels=inputImage.width * inputImage.height):
+                inputImage = layout.convert(inputImage)
+            return self._embed_chunks_parallel(inputImage, layout, chunks, header, padding)
+        if self.stripRows:
+            return self._embed_chunks_in_strips(inputImage, layout, chunks, header, padding)
+        
+        with self.metrics.stage('decode', pixels=inputImage.width * inputImage.height):
+            pixels = np.array(layout.convert(inputImage))
+        
+        writer = BitWriter(pixels.reshape(-1))
+        writer.write(header.to_bytes())
+        writer.set_depth(header.depth)
+        self._write_chunks(writer, chunks, header, padding)
+        
+        return layout.to_image(pixels, inputImage.size)
+        
+    
+    def _embed_chunks_scattered(self, inputImage: Image.Image, layout: CoverLayout, chunks: Iterable[bytes], header: MessageHeader,
+                                secret: str | bytes, previous: MessageHeader = None) -> Image.Image:
+        """Embed header to the first channels of the input image and scatter data chunk by chunk over the following
+        channels. Channels are permuted over their whole range, so the image is processed at once (not in strips or
+        bands of rows).
+
+        Args:
+            inputImage (pillow Image): input image
+            layout (CoverLayout): layout of the input image
+            chunks (Iterable[bytes]): data to embed
+            header (MessageHeader): header of the data with salt of scatter permutation, its size is total size of chunks
+            secret (str | bytes): derived key (or password) seeding the permutation
+            previous (MessageHeader, optional): header of scattered message embedded into the input image, its header
+                and data are overwritten with random bits first. Defaults to None.
+
+        Returns:
+            pillow Image: image with embedded data in mode of the layout
+        """
+        with self.metrics.stage('decode', pixels=inputImage.width * inputImage.height):
+            pixels = np.array(layout.convert(inputImage))
+        channels = pixels.reshape(-1)
+        
+        if previous is not None:
+            BitWriter(channels).write(os.urandom(len(previous)))
+            ScatterWriter(channels, previous.depth, self._scatter_permutation(previous, secret, len(channels)),
+                          len(previous) * self.BITS_IN_BYTES).write(os.urandom(previous.stored_size()))
+        
+        BitWriter(channels).write(header.to_bytes())
+        writer = ScatterWriter(channels, header.depth, self._scatter_permutation(header, secret, len(channels)), len(header) * self.BITS_IN_BYTES)
+        self._write_chunks(writer, chunks, header)
+        
+        return layout.to_image(pixels, inputImage.size)
+        
+    
+    def _scatter_permutation(self, header: MessageHeader, secret: str | bytes, numberOfChannels: int) -> ScatterPermutation:
+        """Permutation of channels following the header, scattered data are embedded in its order
+
+        Args:
+            header (MessageHeader): header with salt of the permutation
+            secret (str | bytes): derived key, password for messages without key derivation record
+            numberOfChannels (int): number of channels of the image
+
+        Returns:
+            ScatterPermutation: permutation
+        """
+        return ScatterPermutation(scatter_seed(secret, header.scatter), numberOfChannels - len(header) * self.BITS_IN_BYTES)
+        
+    
+    def _write_chunks(self, writer: BitWriter, chunks: Iterable[bytes], header: MessageHeader, padding: int = 0) -> None:
+        """Write chunks followed by their digest (and random padding) into writer, reporting progress after every chunk.
+
+        Args:
+            writer (BitWriter): writer embedding the chunks
+            chunks (Iterable[bytes]): data to embed
+            header (MessageHeader): header of the data, its size is total size of chunks
+            padding (int, optional): number of random bytes written after the digest. Defaults to 0.
+
+        Raises:
+            Cancelled: when `progress` callback cancels embedding
+        """
+        written, checksum = 0, 0
+        for chunk in chunks:
+            with self.metrics.stage('pack', len(chunk)):
+                bits = writer.unpack(chunk)
+                checksum = zlib.crc32(chunk, checksum)
+            with self.metrics.stage('embed', len(chunk)):
+                writer.write_bits(bits)
+            written += len(chunk)
+            self._report_progress(written, header.size)
+        writer.write(header.digest(checksum) + os.urandom(padding))
         
     
-    def _embed_bytes(self, inputFilePath: str, outputFilePath: str, generator: Generator[int, int, None]) -> None:
-        """Embed bytes from generator to the input file
+    def _report_progress(self, embedded: int, size: int) -> None:
+        """Call `progress` callback
 
         Args:
-            inputFilePath (string): path to the input file
+            embedded (int): number of embedded bytes
+            size (int): total number of bytes to embed
+
+        Raises:
+            Cancelled: when the callback returns False
+        """
+        if self.progress is not None and self.progress(embedded, size) is False:
+            raise Cancelled(f'embedding cancelled after {embedded} of {size} bytes')
+        
+    
+    def _save_image(self, image: Image.Image | Iterator[Image.Image], outputFilePath: str) -> None:
+        """Encode image (or frames of multi-frame image) into output file losslessly, format is `imageFormat`
+        or given by extension of the file. Metadata of the image (see `_preserve_source`) are stored.
+
+        Args:
+            image (pillow Image | Iterator[pillow Image]): image to save, or its frames (see `_embed_payload`)
             outputFilePath (string): path to the output file
+
+        Raises:
+            ValueError: when the format is lossy
+        """
+        imageFormat = image_format(outputFilePath, self.imageFormat)
+        if not isinstance(image, Image.Image):
+            with self.metrics.stage('encode'), open(outputFilePath, 'w+b') as outputFile:
+                try:
+                    encode_frames(image, TimedStream(outputFile, self.metrics, 'write'), imageFormat, self.compressLevel)
+                except Exception:
+                    outputFile.close()
+                    os.remove(outputFilePath)
+                    raise
+            return
+        
+        with self.metrics.stage('encode', pixels=image.width * image.height), open(outputFilePath, 'wb') as outputFile:
+            try:
+                encode_image(image, TimedStream(outputFile, self.metrics, 'write'), imageFormat, self.compressLevel, image.info)
+            except Exception:
+                outputFile.close()
+                os.remove(outputFilePath)
+                raise
+        
+    
+    def _preserve_source(self, outputImage: Image.Image, inputImage: Image.Image, layout: CoverLayout) -> Image.Image:
+        """Give image with embedded data metadata and alpha of the input image, see `preserve_source`
+
+        Args:
+            outputImage (pillow Image): image with embedded data
+            inputImage (pillow Image): input image
+            layout (CoverLayout): layout of the input image
+
+        Returns:
+            pillow Image: image with embedded data
+        """
+        if outputImage is None:
+            return None
+        return preserve_source(outputImage, inputImage, layout.mode)
+        
+    
+    def _embed_chunks_in_strips(self, inputImage: Image.Image, layout: CoverLayout, chunks: Iterable[bytes], header: MessageHeader,
+                                padding: int = 0) -> Image.Image:
+        """Embed data with its header to the input image in place, strip of `stripRows` rows at a time. Apart from
+        the decoded image only one strip is held in memory, rows after the data are kept untouched.
+
+        Args:
+            inputImage (pillow Image): input image
+            layout (CoverLayout): layout of the input image
+            chunks (Iterable[bytes]): data to embed
+            header (MessageHeader): header of the data, its size is total size of chunks
+            padding (int, optional): number of random bytes embedded after the data. Defaults to 0.
+
+        Returns:
+            pillow Image: image with embedded data in mode of the layout
+        """
+        with self.metrics.stage('decode', pixels=inputImage.width * inputImage.height):
+            image = layout.convert(inputImage)
+        
+        writer = StripWriter(image, layout, self._aligned_strip_rows())
+        writer.write(header.to_bytes())
+        writer.set_depth(header.depth)
+        self._write_chunks(writer, chunks, header, padding)
+        with self.metrics.stage('embed'):
+            writer.flush()
+        
+        return image
+        
+    
+    def _aligned_strip_rows(self) -> int:
+        """Round `stripRows` up to multiple of 8, so that no embedded byte spans two strips
+
+        Returns:
+            int: number of rows in a strip
+        """
+        return -(-self.stripRows // self.BITS_IN_BYTES) * self.BITS_IN_BYTES
+        
+    
+    def _embed_chunks_parallel(self, inputImage: Image.Image, layout: CoverLayout, chunks: Iterable[bytes], header: MessageHeader,
+                               padding: int = 0) -> Image.Image:
+        """Embed data with its header to the input image, row bands are embedded by `workers` processes.
+        Pixels and data are shared with the processes through shared memory.
+
+        Args:
+            inputImage (pillow Image): input image in mode of the layout
+            layout (CoverLayout): layout of the input image
+            chunks (Iterable[bytes]): data to embed
+            header (MessageHeader): header of the data, its size is total size of chunks
+            padding (int, optional): number of random bytes embedded after the data. Defaults to 0.
+
+        Returns:
+            pillow Image: image with embedded data in mode of the layout
+        """
+        width, height = inputImage.size
+        
+        with SharedArray(layout.number_of_channels(inputImage.size), dtype=layout.dtype.str) as channels, \
+             SharedArray(header.stored_size() + padding) as payload:
+            with self.metrics.stage('decode', pixels=width * height):
+                channels.array[:] = np.asarray(inputImage).reshape(-1)
+            BitWriter(channels.array).write(header.to_bytes())
+            
+            position, checksum = 0, 0
+            for chunk in chunks:
+                payload.array[position:position + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+                checksum = zlib.crc32(chunk, checksum)
+                position += len(chunk)
+                self._report_progress(position, header.size)
+            payload.array[position:] = np.frombuffer(header.digest(checksum) + os.urandom(padding), dtype=np.uint8)
+            
+            # bits are unpacked by the workers, packing is a part of the embed stage
+            with self.metrics.stage('embed', header.size, width * height):
+                embed_bands(channels, payload, layout.number_of_channels((width, 1)), self.workers, header.payload_offset(), header.depth)
+            
+            # image of some modes would share memory of the array, it has to outlive the shared memory
+            return layout.to_image(channels.array.copy(), inputImage.size)
+        
+    
+    def _embed_chunks_into_frames(self, pathToInputImage: str, inputImage: Image.Image, layout: CoverLayout, chunks: Iterable[bytes],
+                                  header: MessageHeader) -> Iterator[Image.Image]:
+        """Embed data spread over frames (see `header.frames`) with its header to the input image, frame after frame
+        as they are iterated, so that only one frame is decoded at once. Frames are embedded by `workers` processes
+        when format of the image decodes them on their own (TIFF), offsets of all of them are known from the header.
+
+        Args:
+            pathToInputImage (str): path to the input image
+            inputImage (pillow Image): input image at its first frame
+            layout (CoverLayout): layout of the first frame
+            chunks (Iterable[bytes]): data to embed
+            header (MessageHeader): header of the data with sizes of frames, its size is total size of chunks
+
+        Yields:
+            Iterator[pillow Image]: frames with embedded data followed by the other frames of the input image
+        """
+        parts = split_stream(self._stored_chunks(chunks, header), header.frames)
+        frameHeaders = [header.to_bytes()] + [b''] * (frame_count(inputImage) - 1)
+        self._log.info('🎞️ %d bytes spread over %d of %d frames', header.stored_size(), len(header.frames), len(frameHeaders))
+        if self.workers > 1 and inputImage.format in PARALLEL_FORMATS:
+            tasks = ((pathToInputImage, index, next(parts, None), header.depth, frameHeader) for index, frameHeader in enumerate(frameHeaders))
+            yield from map_frames(embed_frame_file, tasks, self.workers)
+            return
+        
+        cursor = FrameCursor(pathToInputImage, inputImage)
+        for index, frameHeader in enumerate(frameHeaders):
+            data = next(parts, None)
+            with self.metrics.stage('decode'):
+                frame = cursor.seek(index)
+                frameLayout = layout if index == 0 else CoverLayout.of(frame)
+            if data is None:
+                outputFrame = copy_frame(frame)
+            else:
+                with self.metrics.stage('embed', len(data), frame.width * frame.height):
+                    outputFrame = embed_frame(frame, frameLayout, data, header.depth, frameHeader)
+            yield outputFrame
+        
+    
+    def _following_frames(self, outputImage: Image.Image, pathToInputImage: str, inputImage: Image.Image) -> Iterator[Image.Image]:
+        """Frames of image with data embedded into its first frame - the output image followed by copies of the other
+        frames of the input image, copied one at a time as they are iterated
+
+        Args:
+            outputImage (pillow Image): the first frame with embedded data
+            pathToInputImage (str): path to the input image
+            inputImage (pillow Image): input image at its first frame, its metadata are given to the output image
+
+        Yields:
+            Iterator[pillow Image]: frames
+        """
+        outputImage.info.update(frame_info(inputImage))
+        yield outputImage
+        cursor = FrameCursor(pathToInputImage) # output image may be the input image embedded in place (in strips)
+        for index in range(1, frame_count(inputImage)):
+            with self.metrics.stage('decode'):
+                frame = copy_frame(cursor.seek(index))
+            yield frame
+        
+    
+    def _stored_chunks(self, chunks: Iterable[bytes], header: MessageHeader) -> Iterator[bytes]:
+        """Chunks followed by their digest, reporting progress after every chunk
+
+        Args:
+            chunks (Iterable[bytes]): data to embed
+            header (MessageHeader): header of the data, its size is total size of chunks
+
+        Raises:
+            Cancelled: when `progress` callback cancels embedding
+
+        Yields:
+            Iterator[bytes]: chunks, then the digest
+        """
+        embedded, checksum = 0, 0
+        for chunk in chunks:
+            with self.metrics.stage('pack', len(chunk)):
+                checksum = zlib.crc32(chunk, checksum)
+            yield chunk
+            embedded += len(chunk)
+            self._report_progress(embedded, header.size)
+        yield header.digest(checksum)
+        
+    
+    def _embed_bytes(self, inputImage: Image.Image, generator: Generator[int, int, None]) -> Image.Image:
+        """Embed bytes from generator to the input image pixel by pixel (legacy engine)
+
+        Args:
+            inputImage (pillow Image): input image
             generator (Generator[int, int, None]): generates data to embed
+
+        Returns:
+            pillow Image: RGB image with embedded data
         """
-        inputImage = Image.open(inputFilePath)
         outputImage = Image.new('RGB', inputImage.size)
         
         width, height = inputImage.size
@@ -122,7 +922,7 @@ class EmbedService:
                 pixel = inputImage.getpixel((x, y))
                 outputImage.putpixel((x, y), self._embed_bites_into_pixel(pixel, generator))
                 
-        outputImage.save(outputFilePath,  quality=100, subsampling=0)
+        return outputImage
 
 
     def _embed_bites_into_pixel(self, pixel: tuple[int, int, int], generator: Generator[int, str, None]) -> (int, int, int):
@@ -160,70 +960,718 @@ class EmbedService:
             return number
         
         
-    def get_embedded_message(self, inputFilePath: str, outputFilePath: str = '', secret: str = '') -> None:
+    def get_embedded_message(self, inputFilePath: str, outputFilePath: str = '', secret: str = '') -> str:
         """Read embedded message from file and save it to file (if it's file) or display it (if it's string)
 
         Args:
             inputFilePath (string): path to the input file containing embedded message
-            outputFilePath (string): path to the output file if the message's content type is file
+            outputFilePath (string): path to the output file if the message's content type is file, `STDIO_PATH`
+                writes it to standard output
+
+        Raises:
+            ValueError: when the password is wrong (detected only for messages with key derivation record)
+
+        Returns:
+            str: the message if it's string, None otherwise (files of container are saved into `outputFilePath`
+                directory if there are more of them)
         """
-        inputImage = Image.open(inputFilePath)
-        hiddenBitsGenerator = hidden_bits_generator(inputImage)
-        messageSize, contentType = self._read_message_metadata(hiddenBitsGenerator)
+        try:
+            header, message, secret = self._open_message(inputFilePath, secret)
+            self._validate_whole_message(header)
+            return self._save_message(header, message, outputFilePath, secret)
+        finally:
+            self.metrics.emit('extract')
+            
+    
+    def save_message(self, header: MessageHeader, encryptedMessage: BinaryIO, outputFilePath: str = '', secret: str = '') -> str:
+        """Decrypt message and save it to file (if it's file) or display it (if it's string)
 
-        self._log.info(f' get embedded message - size: {messageSize}, contentType: {contentType}')
-        
-        if contentType == ContentType.STRING:
-            self._show_embedded_message(messageSize, secret, hiddenBitsGenerator)
-        elif contentType == ContentType.FILE:
-            self._save_embedded_file(outputFilePath, messageSize, secret, hiddenBitsGenerator)
+        Args:
+            header (MessageHeader): header of the message
+            encryptedMessage (BinaryIO): encrypted message extracted from image (or concatenated shards)
+            outputFilePath (string): path to the output file if the message's content type is file, `STDIO_PATH`
+                writes it to standard output
+            secret (str, optional): secret password for decryption. Defaults to ''.
+
+        Raises:
+            ValueError: when the password is wrong (detected only for messages with key derivation record)
+
+        Returns:
+            str: the message if it's string, None otherwise
+        """
+        return self._save_message(header, encryptedMessage, outputFilePath, self._message_key(header, secret))
+            
+    
+    def _save_message(self, header: MessageHeader, encryptedMessage: BinaryIO, outputFilePath: str, secret: str | bytes) -> str:
+        """Decrypt message and save it to file (if it's file) or display it (if it's string)
+
+        Args:
+            header (MessageHeader): header of the message
+            encryptedMessage (BinaryIO): encrypted message
+            outputFilePath (string): path to the output file if the message's content type is file
+            secret (str | bytes): derived key, password for messages without key derivation record
+
+        Returns:
+            str: the message if it's string, None otherwise
+        """
+        if header.layout == MessageHeader.CONTAINER_LAYOUT:
+            self._save_container(outputFilePath, encryptedMessage, secret, header)
+        elif header.contentType == ContentType.STRING:
+            return self._show_embedded_message(encryptedMessage, secret, header.codec, header.cipherMode)
+        elif header.contentType == ContentType.FILE:
+            self._save_embedded_file(outputFilePath, encryptedMessage, secret, header.codec, header.cipherMode)
         else:
-            self._log.error(f'unknown message content: {contentType}')
+            self._log.error('unknown message content: %s', header.contentType)
+            
+    
+    def read_header(self, inputImage: BinaryIO) -> MessageHeader:
+        """Read header of embedded message, decoding only the first rows of image
+
+        Args:
+            inputImage (BinaryIO): encoded image or path to it
+
+        Returns:
+            MessageHeader: header
+        """
+        with self.metrics.stage('decode'):
+            image = Image.open(inputImage)
+            return self._find_header(self._row_decoder(inputImage, image))[0]
+            
+    
+    def probe_header(self, pathToImage: str, image: Image.Image = None) -> tuple[MessageHeader, int]:
+        """Detect header of embedded message decoding only the first rows of image where its format allows it,
+        see `decode_rows`. Alpha of image having it is tried with and without data, so that the whole image is
+        decoded (to check its alpha) only when it holds no embedded message.
+
+        Args:
+            pathToImage (str): path to the image
+            image (pillow Image, optional): the image already opened, it isn't decoded. Defaults to None (it's opened).
+
+        Returns:
+            tuple[MessageHeader, int]: header, None when image holds no embedded message, number of channels of
+                image holding data
+        """
+        image = Image.open(pathToImage) if image is None else image
+        layouts = CoverLayout.candidates(image)
+        rows = self._row_decoder(pathToImage, image)
+        for layout in layouts:
+            try:
+                return self._read_header(rows, layout), layout.number_of_channels(image.size)
+            except ValueError:
+                continue
+
+        layout = CoverLayout.of(Image.open(pathToImage)) if len(layouts) > 1 else layouts[0]
+        return None, layout.number_of_channels(image.size)
+            
+    
+    def read_shard(self, inputImage: BinaryIO) -> tuple[MessageHeader, bytes]:
+        """Read header and encrypted data of embedded shard (or whole message)
+
+        Args:
+            inputImage (BinaryIO): encoded image or path to it
+
+        Returns:
+            tuple[MessageHeader, bytes]: header, encrypted data
+        """
+        header, message, _ = self._open_message(inputImage)
+        return header, message.read()
+            
+    
+    def extract_data(self, inputImage: BinaryIO, secret: str = '') -> tuple[bytes, ContentType]:
+        """Read embedded data from image in memory, nothing is written to disk.
+
+        Args:
+            inputImage (BinaryIO): encoded image (or path to it) containing embedded data
+            secret (str, optional): secret password for decryption. Defaults to ''.
+
+        Raises:
+            ValueError: when the password is wrong (detected only for messages with key derivation record)
+
+        Returns:
+            tuple[bytes, ContentType]: decrypted (and decompressed) data (concatenated files of container),
+                their content type
+        """
+        try:
+            header, message, secret = self._open_message(inputImage, secret)
+            self._validate_whole_message(header)
+            if header.layout == MessageHeader.CONTAINER_LAYOUT:
+                output = io.BytesIO()
+                self._unpack_container(message, secret, header, ContainerWriter(lambda name: output, self._chunk_decompressor(header.codec)))
+                return output.getvalue(), header.contentType
+            return self._decrypt_message(message, secret, header.codec, header.cipherMode), header.contentType
+        finally:
+            self.metrics.emit('extract')
             
+    
+    def extract_range(self, inputImage: BinaryIO, start: int, end: int, secret: str = '') -> bytes:
+        """Read bytes from `start` to `end` of embedded data, decoding and decrypting only the part of image
+        holding them. Range of container addresses concatenated content of its files, only chunks holding it are
+        decompressed. CTR and GCM data are decrypted from the range (GCM tag isn't verified), CBC data from one
+        block preceding it.
+
+        Args:
+            inputImage (BinaryIO): encoded image (or path to it) containing embedded data
+            start (int): position of the first byte of the range
+            end (int): position following the last byte of the range, it's clipped to size of the data
+            secret (str, optional): secret password for decryption. Defaults to ''.
+
+        Raises:
+            ValueError: when the data are compressed (and aren't container), the range is invalid, the password
+                is wrong or a chunk of container is corrupted
+
+        Returns:
+            bytes: decrypted data of the range
+        """
+        try:
+            header, readPlain = self._open_random_access(inputImage, secret)
+            if header.layout == MessageHeader.CONTAINER_LAYOUT:
+                return self._read_container_range(ContainerIndex.read(readPlain), readPlain, start, end, header.codec)
+            if header.codec != Codec.NONE:
+                raise ValueError(f'range of data compressed by {header.codec} can\'t be decrypted')
+            return readPlain(start, end - start)
+        finally:
+            self.metrics.emit('extract')
             
-    def _save_embedded_file(self, outputFilePath: str, fileSize: int, secret: str, generator: Generator[int, int, None]) -> None:
-        """Save and decrypt file that was embedded into image.
+    
+    def list_files(self, inputImage: BinaryIO, secret: str = '') -> list[tuple[str, int, int]]:
+        """List files of embedded container, reading only its index
 
         Args:
-            outputFilePath (str): path to the output file
-            messageSize (int): message size in bytes
+            inputImage (BinaryIO): encoded image (or path to it) containing embedded container
+            secret (str, optional): secret password for decryption. Defaults to ''.
+
+        Raises:
+            ValueError: when embedded data aren't container or the password is wrong
+
+        Returns:
+            list[tuple[str, int, int]]: name, offset (position in concatenated content) and size of every file
+        """
+        try:
+            header, readPlain = self._open_random_access(inputImage, secret)
+            if header.layout != MessageHeader.CONTAINER_LAYOUT:
+                raise ValueError('embedded data aren\'t chunk-indexed container')
+            return ContainerIndex.read(readPlain).file_offsets()
+        finally:
+            self.metrics.emit('extract')
+            
+    
+    def _open_random_access(self, inputImage: BinaryIO, secret: str) -> tuple[MessageHeader, Callable[[int, int], bytes]]:
+        """Read header of embedded message and create function decrypting its bytes at any position.
+
+        Args:
+            inputImage (BinaryIO): encoded image or path to it
             secret (str): secret password for decryption
-            generator (Generator[int, int, None]): hidden bits generator
+
+        Raises:
+            ValueError: when the password is wrong
+
+        Returns:
+            tuple[MessageHeader, Callable[[int, int], bytes]]: header, function returning decrypted bytes of message
+                (before decompression) called with position and number of bytes
         """
-        encryptedFileName = outputFilePath + '.encrypted'
-        encryptedFile = open(encryptedFileName, 'wb')
-        for _ in range(fileSize):
-            byte = 0
-            for i in range(self.BITS_IN_BYTES):
-                byte += (next(generator) << i)
-            byte = byte.to_bytes(1, 'big')
-            encryptedFile.write(byte)
-        encryptedFile.close()
+        source = inputImage
+        with self.metrics.stage('decode'):
+            inputImage = Image.open(inputImage)
+            rows = self._row_decoder(source, inputImage)
+            header, layout = self._find_header(rows)
+        self._validate_whole_message(header)
+        secret = self._message_key(header, secret)
+        if header.scatter:
+            return header, self._scattered_random_access(rows, layout, header, secret)
+        if header.frames and len(header.frames) > frame_count(inputImage):
+            raise ValueError(f'embedded message is spread over {len(header.frames)} frames, image has only {frame_count(inputImage)}')
+        frames = {0: (rows, layout)} # row decoders and layouts of frames, created when they are read first
+        
+        def read_encrypted(position: int, size: int) -> bytes:
+            data = b''
+            for index, framePosition, length in frame_spans(header.frames, position, size) if header.frames else [(0, position, size)]:
+                if index not in frames:
+                    with self.metrics.stage('decode'):
+                        frameRows = RowDecoder(source, frame=index)
+                        frames[index] = frameRows, CoverLayout.of(frameRows.image)
+                frameRows, frameLayout = frames[index]
+                # bit positions of encrypted bytes and channels holding them
+                firstBit = (header.payload_offset() if index == 0 else 0) + framePosition * self.BITS_IN_BYTES
+                firstChannel = firstBit // header.depth
+                lastChannel = -(-(firstBit + length * self.BITS_IN_BYTES) // header.depth)
+                with self.metrics.stage('decode'):
+                    channels = self._read_channels(frameRows, frameLayout, lastChannel, firstChannel)
+                with self.metrics.stage('extract', length):
+                    data += extract_bytes(channels, length, firstBit - firstChannel * header.depth, header.depth)
+            return data
+        
+        def read_plain(position: int, size: int) -> bytes:
+            with self.metrics.stage('decrypt'):
+                return self._encryptService.decrypt_range(read_encrypted, position, position + size, secret, header.cipherMode.value)
+        
+        return header, read_plain
+    
+    
+    def _scattered_random_access(self, rows: RowDecoder, layout: CoverLayout, header: MessageHeader,
+                                 secret: str | bytes) -> Callable[[int, int], bytes]:
+        """Create function decrypting bytes of scattered message at any position. The whole image is decoded
+        (once, when the first bytes are read), only permuted indices of the read bytes are computed.
+
+        Args:
+            rows (RowDecoder): rows of image containing scattered message
+            layout (CoverLayout): layout of the image
+            header (MessageHeader): header of the message
+            secret (str | bytes): derived key, password for messages without key derivation record
+
+        Returns:
+            Callable[[int, int], bytes]: function returning decrypted bytes of message called with position and
+                number of bytes
+        """
+        numberOfChannels = layout.number_of_channels(rows.image.size)
+        permutation = self._scatter_permutation(header, secret, numberOfChannels)
+        channels = None
+        
+        def read_encrypted(position: int, size: int) -> bytes:
+            nonlocal channels
+            if channels is None:
+                with self.metrics.stage('decode'):
+                    channels = self._read_channels(rows, layout, numberOfChannels)
+            with self.metrics.stage('extract', size):
+                bits = gather_bits(channels, size * self.BITS_IN_BYTES, position * self.BITS_IN_BYTES, header.depth, permutation,
+                                   len(header) * self.BITS_IN_BYTES)
+                return np.packbits(bits, bitorder='little').tobytes()
+        
+        def read_plain(position: int, size: int) -> bytes:
+            with self.metrics.stage('decrypt'):
+                return self._encryptService.decrypt_range(read_encrypted, position, position + size, secret, header.cipherMode.value)
+        
+        return read_plain
+    
+    
+    def _read_container_range(self, index: ContainerIndex, readPlain: Callable[[int, int], bytes], start: int, end: int, codec: Codec) -> bytes:
+        """Read bytes from `start` to `end` of concatenated content of container files
+
+        Args:
+            index (ContainerIndex): index of the container
+            readPlain (Callable[[int, int], bytes]): returns decrypted bytes of container at position
+            start (int): position of the first byte of the range
+            end (int): position following the last byte of the range, it's clipped to size of the content
+            codec (Codec): codec of chunks
+
+        Raises:
+            ValueError: when the range is invalid or a chunk is corrupted
+
+        Returns:
+            bytes: content of the range
+        """
+        end = min(end, index.size())
+        if not 0 <= start <= end:
+            raise ValueError(f'range {start}:{end} is out of content of {index.size()} bytes')
+        span = index.chunk_span(start, end)
+        if not span:
+            return b''
+        
+        firstOffset = index.chunks[span.start][0]
+        lastOffset, lastLength, _ = index.chunks[span.stop - 1]
+        data = readPlain(len(index) + firstOffset, lastOffset + lastLength - firstOffset)
+        with self.metrics.stage('decompress', len(data)):
+            content = unpack_chunks(index, span, data, self._chunk_decompressor(codec))
+        
+        contentStart = span.start * index.chunkSize
+        return content[start - contentStart:end - contentStart]
+            
+    
+    def _open_message(self, inputImage: BinaryIO, secret: str = None) -> tuple[MessageHeader, BinaryIO, str | bytes]:
+        """Read header of embedded message, derive its key and open stream of the encrypted message.
+
+        Args:
+            inputImage (BinaryIO): encoded image or path to it
+            secret (str, optional): secret password for decryption. Defaults to None (no key is derived, scattered
+                message can't be opened).
+
+        Raises:
+            ValueError: when image holds no embedded message, the password is wrong or it's missing for scattered
+                message (stream of the message raises it when the message doesn't match its digest)
+
+        Returns:
+            tuple[MessageHeader, BinaryIO, str | bytes]: header, stream of encrypted message, derived key (the
+                password if the message has no key derivation record, None without the password)
+        """
+        source = inputImage
+        with self.metrics.stage('decode'):
+            inputImage = Image.open(inputImage)
+        
+        if self.legacyEngine:
+            with self.metrics.stage('extract'):
+                hiddenBitsGenerator = hidden_bits_generator(to_rgb(inputImage))
+                header = MessageHeader(*self._read_message_metadata(hiddenBitsGenerator), version=0)
+                self._validate_capacity(header, inputImage.width * inputImage.height * 3)
+                message = io.BytesIO(self._read_bytes(header.size, hiddenBitsGenerator))
+            secret = None if secret is None else self._message_key(header, secret)
+        else:
+            # decode header from the first pixels, then only the pixels holding the message
+            with self.metrics.stage('decode'):
+                rows = self._row_decoder(source, inputImage)
+                header, layout = self._find_header(rows)
+            secret = None if secret is None else self._message_key(header, secret)
+            messageSize = header.stored_size()
+            if header.frames:
+                message = self._open_frames(source, inputImage, layout, header)
+            elif header.scatter:
+                if secret is None:
+                    raise ValueError('scattered message can\'t be read without password')
+                numberOfChannels = layout.number_of_channels(inputImage.size)
+                with self.metrics.stage('decode'):
+                    channels = self._read_channels(rows, layout, numberOfChannels)
+                message = ScatterReader(channels, messageSize, header.depth, self._scatter_permutation(header, secret, numberOfChannels),
+                                        len(header) * self.BITS_IN_BYTES)
+                message = TimedStream(message, self.metrics, 'extract')
+            elif self.stripRows:
+                message = StripReader(inputImage, layout, self._aligned_strip_rows(), messageSize, header.payload_offset(), header.depth)
+                message = TimedStream(message, self.metrics, 'extract')
+            elif self.workers > 1:
+                with self.metrics.stage('decode'):
+                    channels = self._read_channels(rows, layout, header.channels())
+                with self.metrics.stage('extract', messageSize), SharedArray(len(channels), dtype=layout.dtype.str) as sharedChannels:
+                    sharedChannels.array[:] = channels
+                    data = extract_bands(sharedChannels, messageSize, layout.number_of_channels((inputImage.width, 1)), self.workers,
+                                         header.payload_offset(), header.depth)
+                message = io.BytesIO(data)
+            else:
+                with self.metrics.stage('decode'):
+                    channels = self._read_channels(rows, layout, header.channels())
+                message = TimedStream(BitReader(channels, messageSize, header.payload_offset(), header.depth), self.metrics, 'extract')
+            if header.version:
+                message = DigestReader(message, header.size)
+
+        self._log.info(' get embedded message - size: %d, contentType: %s, codec: %s', header.size, header.contentType, header.codec)
+        return header, message, secret
+            
+    
+    def _open_frames(self, source: BinaryIO, inputImage: Image.Image, layout: CoverLayout, header: MessageHeader) -> BinaryIO:
+        """Open stream of message spread over frames (see `header.frames`), a frame is decoded when its part of the
+        message is read. Frames are extracted by `workers` processes when the image is given by path and its format
+        decodes frames on their own (TIFF).
+
+        Args:
+            source (BinaryIO): encoded image or path to it
+            inputImage (pillow Image): the image at its first frame
+            layout (CoverLayout): layout of the first frame
+            header (MessageHeader): header of the message
+
+        Raises:
+            ValueError: when the image has fewer frames than the message is spread over
+
+        Returns:
+            BinaryIO: stream of the message (data and their digest)
+        """
+        if len(header.frames) > frame_count(inputImage):
+            raise ValueError(f'embedded message is spread over {len(header.frames)} frames, image has only {frame_count(inputImage)}')
+        offsets = [header.payload_offset()] + [0] * (len(header.frames) - 1)
+        if self.workers > 1 and isinstance(source, str) and inputImage.format in PARALLEL_FORMATS:
+            tasks = ((source, index, size, header.depth, offset) for index, (size, offset) in enumerate(zip(header.frames, offsets)))
+            return TimedStream(FrameReader(map_frames(extract_frame_file, tasks, self.workers)), self.metrics, 'extract')
         
-        self._encryptService.decrypt_file(encryptedFileName, outputFilePath, secret)
-        os.remove(encryptedFileName) # remove encrypted file from fs
+        def extract_frames() -> Iterator[bytes]:
+            cursor = FrameCursor(source, inputImage)
+            for index, (size, offset) in enumerate(zip(header.frames, offsets)):
+                with self.metrics.stage('decode'):
+                    frame = cursor.seek(index)
+                    frameLayout = layout if index == 0 else CoverLayout.of(frame)
+                with self.metrics.stage('extract', size):
+                    data = extract_frame(frame, frameLayout, size, header.depth, offset)
+                yield data
         
-        self._log.info(f'embedded file saved to as {outputFilePath}')
+        return FrameReader(extract_frames())
     
     
-    def _show_embedded_message(self, messageSize: int, secret: str, generator: Generator[int, int, None]) -> None:
-        """Show embedded message.
+    def _validate_whole_message(self, header: MessageHeader) -> None:
+        """Validate that image holds whole message, not a shard of it
 
         Args:
-            messageSize (int): message size in bytes
+            header (MessageHeader): header of embedded data
+
+        Raises:
+            ValueError: when the data are shard of payload split across more images
+        """
+        if header.shard is not None:
+            _, index, count = header.shard
+            raise ValueError(f'image holds shard {index + 1} of {count}, extract all shards of the set together')
+    
+    
+    def _message_key(self, header: MessageHeader, secret: str) -> str | bytes:
+        """Derive key of embedded message from password, using key derivation record of its header
+
+        Args:
+            header (MessageHeader): header of embedded message
             secret (str): secret password for decryption
-            generator (Generator[int, int, None]): hidden bit generator
+
+        Raises:
+            ValueError: when the password is wrong
+
+        Returns:
+            str | bytes: derived key, the password itself if the message has no key derivation record
+        """
+        if not header.keyDerivation:
+            return secret
+        with self.metrics.stage('derive'):
+            return self._keyService.record_key(secret, header.keyDerivation)
+    
+    
+    def _read_header(self, rows: RowDecoder, layout: CoverLayout) -> MessageHeader:
+        """Read header of embedded message from the first channels of image, size of the message is validated
+        against capacity of the image before any data are read
+
+        Args:
+            rows (RowDecoder): rows of image containing hidden message
+            layout (CoverLayout): layout of the image
+
+        Raises:
+            ValueError: when image holds no embedded message, its header is corrupted or the message doesn't fit
+                into the image
+
+        Returns:
+            MessageHeader: header
+        """
+        header = MessageHeader.read(lambda size: extract_bytes(self._read_channels(rows, layout, size * self.BITS_IN_BYTES), size))
+        self._validate_capacity(header, layout.number_of_channels(rows.image.size))
+        return header
+    
+    
+    def _find_header(self, rows: RowDecoder) -> tuple[MessageHeader, CoverLayout]:
+        """Read header of embedded message trying the layouts of image known without decoding it (see
+        `CoverLayout.candidates`), the whole image is decoded to find its layout only when none of them holds
+        the header, so that the error of that layout is raised
+
+        Args:
+            rows (RowDecoder): rows of image containing hidden message
+
+        Raises:
+            ValueError: when image holds no embedded message, its header is corrupted or the message doesn't fit
+                into the image
+
+        Returns:
+            tuple[MessageHeader, CoverLayout]: header, layout of the image holding it
+        """
+        layouts = CoverLayout.candidates(rows.image)
+        errors = []
+        for layout in layouts:
+            try:
+                return self._read_header(rows, layout), layout
+            except ValueError as error:
+                errors.append(error)
+        
+        if len(layouts) == 1:
+            raise errors[0]
+        mode = CoverLayout.of(rows.image).mode
+        raise next(error for layout, error in zip(layouts, errors) if layout.mode == mode)
+    
+    
+    def _validate_capacity(self, header: MessageHeader, numberOfChannels: int) -> None:
+        """Validate that embedded message of header fits into image
+
+        Args:
+            header (MessageHeader): header of embedded message
+            numberOfChannels (int): number of channels of the image holding data
+
+        Raises:
+            ValueError: when the message doesn't fit - image holds no embedded message or its header is corrupted
+        """
+        if header.channels() > numberOfChannels:
+            raise ValueError(f'embedded message of {header.size} bytes can\'t fit into {numberOfChannels} channels of image, '
+                             'image holds no embedded message or its header is corrupted')
+    
+    
+    def _row_decoder(self, inputImage: BinaryIO, image: Image.Image) -> RowDecoder:
+        """Create decoder of rows of image whose first decoded rows hold `PROBE_HEADER_BYTES` of header in any layout
+
+        Args:
+            inputImage (BinaryIO): encoded image or path to it
+            image (pillow Image): the image opened from it
+
+        Returns:
+            RowDecoder: decoder of the rows
+        """
+        return RowDecoder(inputImage, image, minRows=-(-self.PROBE_HEADER_BYTES * self.BITS_IN_BYTES // image.width))
+    
+    
+    def _read_channels(self, rows: RowDecoder, layout: CoverLayout, numberOfChannels: int, firstChannel: int = 0) -> np.ndarray:
+        """Read channel values of image from `firstChannel` up to `numberOfChannels`, decoding only the rows up to
+        the last one containing them (see `RowDecoder`) and converting only the rows that contain them. Decoded
+        pixels are recorded by `metrics`.
+
+        Args:
+            rows (RowDecoder): rows of image containing hidden message
+            layout (CoverLayout): layout of the image
+            numberOfChannels (int): index following the last channel to read
+            firstChannel (int, optional): index of the first channel to read. Defaults to 0.
+
+        Raises:
+            ValueError: when image doesn't have enough channels
+
+        Returns:
+            np.ndarray: flat array of channel values (R, G, B, R, G, B, ...)
+        """
+        width, height = rows.image.size
+        rowChannels = layout.number_of_channels((width, 1))
+        numberOfRows = -(-numberOfChannels // rowChannels)
+        if numberOfRows > height:
+            raise ValueError(f'image has only {rowChannels * height} channels, {numberOfChannels} requested')
+        
+        firstRow = firstChannel // rowChannels
+        decodedRows = rows.decodedRows
+        strip = layout.convert(rows.read(firstRow, numberOfRows))
+        self.metrics.add('decode', pixels=(rows.decodedRows - decodedRows) * width)
+        stripStart = firstRow * rowChannels
+        return np.asarray(strip).reshape(-1)[firstChannel - stripStart:numberOfChannels - stripStart]
+            
+            
+    def _save_embedded_file(self, outputFilePath: str, encryptedFile: BinaryIO, secret: str | bytes, codec: Codec = Codec.NONE,
+                            cipherMode: CipherMode = CipherMode.CBC) -> None:
+        """Decrypt, decompress and save file that was embedded into image chunk by chunk.
+
+        Args:
+            outputFilePath (str): path to the output file, `STDIO_PATH` for standard output
+            encryptedFile (BinaryIO): encrypted file extracted from image
+            secret (str | bytes): secret password or derived key for decryption
+            codec (Codec, optional): codec the file was compressed with. Defaults to Codec.NONE.
+            cipherMode (CipherMode, optional): block cipher mode the file was encrypted with. Defaults to CipherMode.CBC.
+
+        Raises:
+            ValueError: when GCM authentication fails, the output file is removed then
+        """
+        if outputFilePath == self.STDIO_PATH:
+            output = TimedStream(sys.stdout.buffer, self.metrics, 'write')
+            with self.metrics.stage('decrypt'), self._compressService.decompress_into(output, codec) as output:
+                self._encryptService.decrypt_stream(encryptedFile, output, secret, cipherMode.value)
+            sys.stdout.buffer.flush()
+            return
+        
+        try:
+            with open(outputFilePath, 'wb') as outputFile:
+                output = TimedStream(outputFile, self.metrics, 'write')
+                with self.metrics.stage('decrypt'), self._compressService.decompress_into(output, codec) as output:
+                    self._encryptService.decrypt_stream(encryptedFile, output, secret, cipherMode.value)
+        except ValueError:
+            os.remove(outputFilePath) # don't leave data that failed authentication
+            raise
+        
+        self._log.info('embedded file saved to as %s', outputFilePath)
+    
+    
+    def _save_container(self, outputFilePath: str, encryptedContainer: BinaryIO, secret: str | bytes, header: MessageHeader) -> None:
+        """Decrypt container and save its files - the only file to the output file, more files into output
+        directory, `STDIO_PATH` writes their concatenated content to standard output.
+
+        Args:
+            outputFilePath (str): path to the output file or directory, `STDIO_PATH` for standard output
+            encryptedContainer (BinaryIO): encrypted container extracted from image
+            secret (str | bytes): secret password or derived key for decryption
+            header (MessageHeader): header of the container
+
+        Raises:
+            ValueError: when a chunk is corrupted or GCM authentication fails, saved files are removed then
+        """
+        if outputFilePath == self.STDIO_PATH:
+            output = TimedStream(sys.stdout.buffer, self.metrics, 'write')
+            self._unpack_container(encryptedContainer, secret, header, ContainerWriter(lambda name: output, self._chunk_decompressor(header.codec)))
+            sys.stdout.buffer.flush()
+            return
+        
+        outputFiles = []
+        def open_output(name: str) -> BinaryIO:
+            if len(writer.index.files) == 1:
+                path = outputFilePath
+            else:
+                os.makedirs(outputFilePath, exist_ok=True)
+                path = os.path.join(outputFilePath, os.path.basename(name) or f'file{len(outputFiles)}')
+            outputFiles.append(open(path, 'wb'))
+            return TimedStream(outputFiles[-1], self.metrics, 'write')
+        
+        writer = ContainerWriter(open_output, self._chunk_decompressor(header.codec))
+        try:
+            self._unpack_container(encryptedContainer, secret, header, writer)
+        except ValueError:
+            for outputFile in outputFiles:
+                outputFile.close()
+                os.remove(outputFile.name) # don't leave data that failed verification
+            raise
+        finally:
+            for outputFile in outputFiles:
+                outputFile.close()
+        
+        self._log.info('%d embedded files saved to %s', len(outputFiles), outputFilePath)
+    
+    
+    def _unpack_container(self, encryptedContainer: BinaryIO, secret: str | bytes, header: MessageHeader, writer: ContainerWriter) -> None:
+        """Decrypt container into writer, which decompresses and verifies its chunks and writes its files
+
+        Args:
+            encryptedContainer (BinaryIO): encrypted container extracted from image
+            secret (str | bytes): secret password or derived key for decryption
+            header (MessageHeader): header of the container
+            writer (ContainerWriter): writer unpacking the container
+
+        Raises:
+            ValueError: when a chunk is corrupted or GCM authentication fails
         """
-        message = bytes()
-        for _ in range(messageSize):
+        with self.metrics.stage('decrypt'), writer:
+            self._encryptService.decrypt_stream(encryptedContainer, writer, secret, header.cipherMode.value)
+    
+    
+    def _chunk_decompressor(self, codec: Codec) -> Callable[[bytes], bytes]:
+        return lambda chunk: self._compressService.decompress_chunk(chunk, codec)
+    
+    
+    def _show_embedded_message(self, encryptedMessage: BinaryIO, secret: str | bytes, codec: Codec = Codec.NONE,
+                               cipherMode: CipherMode = CipherMode.CBC) -> str:
+        """Decrypt, decompress and show embedded message.
+
+        Args:
+            encryptedMessage (BinaryIO): encrypted message extracted from image
+            secret (str | bytes): secret password or derived key for decryption
+            codec (Codec, optional): codec the message was compressed with. Defaults to Codec.NONE.
+            cipherMode (CipherMode, optional): block cipher mode the message was encrypted with. Defaults to CipherMode.CBC.
+
+        Returns:
+            str: the message
+        """
+        message = self._decrypt_message(encryptedMessage, secret, codec, cipherMode).decode('utf-8')
+        self._log.info('message is: %s', message)
+        return message
+        
+        
+    def _decrypt_message(self, encryptedMessage: BinaryIO, secret: str | bytes, codec: Codec = Codec.NONE,
+                         cipherMode: CipherMode = CipherMode.CBC) -> bytes:
+        """Decrypt and decompress embedded message in memory.
+
+        Args:
+            encryptedMessage (BinaryIO): encrypted message extracted from image
+            secret (str | bytes): secret password or derived key for decryption
+            codec (Codec, optional): codec the message was compressed with. Defaults to Codec.NONE.
+            cipherMode (CipherMode, optional): block cipher mode the message was encrypted with. Defaults to CipherMode.CBC.
+
+        Returns:
+            bytes: message
+        """
+        message = io.BytesIO()
+        with self.metrics.stage('decrypt'), self._compressService.decompress_into(message, codec) as output:
+            self._encryptService.decrypt_stream(encryptedMessage, output, secret, cipherMode.value)
+        return message.getvalue()
+        
+        
+    def _read_bytes(self, numberOfBytes: int, generator: Generator[int, int, None]) -> bytes:
+        """Read bytes from hidden bits generator (legacy engine)
+
+        Args:
+            numberOfBytes (int): number of bytes to read
+            generator (Generator[int, int, None]): hidden bits generator
+
+        Returns:
+            bytes: read bytes
+        """
+        data = bytearray(numberOfBytes)
+        for index in range(numberOfBytes):
             byte = 0
             for i in range(self.BITS_IN_BYTES):
                 byte += (next(generator) << i)
-            message += byte.to_bytes(1, 'big')
-            
-        message = self._encryptService.decrypt_string(message, secret)
-        
-        self._log.info(f'message is: {message}')
+            data[index] = byte
+        return bytes(data)
                 
                 
     def _read_message_metadata(self, generator: Generator[int, int, None]) -> [int, ContentType]:
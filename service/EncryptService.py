@@ -1,17 +1,29 @@
 import os
 import logging
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from Crypto.Cipher import AES
-from typing import BinaryIO
+from typing import BinaryIO, Callable, Iterator
 
 class EncryptService:
     """Responsible for encrypting and decryption files using AES cipher.
     Singleton pattern.
+
+    Encrypted data consist of header (size, init vector) followed by ciphered data. CBC data are padded to
+    BLOCK_SIZE, CTR and GCM data aren't padded, GCM data are followed by authentication tag. CTR and GCM data
+    can be decrypted from any position, CTR data are decrypted by `workers` threads in parallel.
     """
     
     SECRET_LENGTH = 16
     INIT_VECTOR_LENGTH = 16
     SIZE_LENGTH = 4 # number of bytes used for storing original file size
     BLOCK_SIZE = 16 # number of bytes being encrypted or decrypted
+    CHUNK_SIZE = 4 * 1024 * 1024 # default number of bytes read and ciphered at once, multiple of BLOCK_SIZE
+    TAG_LENGTH = 16 # number of bytes of GCM authentication tag
+    GCM_NONCE_LENGTH = 12 # number of leading bytes of init vector used as GCM nonce
+    
+    chunkSize = CHUNK_SIZE
+    workers = 1 # number of threads decrypting chunk of CTR data in parallel
     
     _instance = None
     _log = logging.getLogger('EncryptService')
@@ -38,6 +50,20 @@ class EncryptService:
         raise RuntimeError('Call get_instance() instead')
     
     
+    def set_chunk_size(self, chunkSize: int) -> None:
+        """Set number of bytes read and ciphered at once by file and stream methods
+
+        Args:
+            chunkSize (int): chunk size in bytes, multiple of BLOCK_SIZE
+
+        Raises:
+            ValueError: when chunk size isn't a positive multiple of BLOCK_SIZE
+        """
+        if chunkSize <= 0 or chunkSize % self.BLOCK_SIZE != 0:
+            raise ValueError(f'chunk size {chunkSize} is not a positive multiple of {self.BLOCK_SIZE}')
+        self.chunkSize = chunkSize
+        
+    
     def encrypt_string(self, plainText: str, secret: str, blockMode=AES.MODE_CBC) -> bytes:
         """Encrypt string using AES cipher
 
@@ -52,18 +78,22 @@ class EncryptService:
         secret = self._format_secret(secret)
         initVector = self._create_init_vector()
         self._log.info(f'Init vector={initVector}')
-        cipher = AES.new(secret, blockMode, initVector)
-        encryptedText = len(plainText).to_bytes(self.SIZE_LENGTH, 'big') + initVector
-        
-        # add padding of spaces to alight text to block length
-        if len(plainText) % self.BLOCK_SIZE != 0:
-            plainText += ' ' * (self.BLOCK_SIZE - (len(plainText) % self.BLOCK_SIZE))
+        cipher = self._create_cipher(secret, blockMode, initVector)
         
         plainText = bytes(plainText, 'utf-8')
-        for i in range(len(plainText) // self.BLOCK_SIZE):
-            encryptedText += cipher.encrypt(plainText[i * self.BLOCK_SIZE: (i + 1) * self.BLOCK_SIZE])
+        headerLength = self.SIZE_LENGTH + self.INIT_VECTOR_LENGTH
+        cipheredLength = self._ciphered_size(len(plainText), blockMode)
+        encryptedText = bytearray(self.encrypted_size(len(plainText), blockMode))
+        encryptedText[:headerLength] = len(plainText).to_bytes(self.SIZE_LENGTH, 'big') + initVector
+        
+        # add padding of spaces to alight text to block length (CBC)
+        plainText += b' ' * (cipheredLength - len(plainText))
+        
+        cipher.encrypt(plainText, output=memoryview(encryptedText)[headerLength:headerLength + cipheredLength])
+        if blockMode == AES.MODE_GCM:
+            encryptedText[headerLength + cipheredLength:] = cipher.digest()
             
-        return encryptedText
+        return bytes(encryptedText)
     
     
     def decrypt_string(self, encryptedText: bytes, secret: str, blockMode=AES.MODE_CBC) -> str:
@@ -76,34 +106,34 @@ class EncryptService:
 
         Raises:
             RuntimeError: when input text is in wrong format
+            ValueError: when GCM authentication fails
 
         Returns:
             string: plain text
         """
         secret = self._format_secret(secret)
+        encryptedText = memoryview(encryptedText)
         length = int.from_bytes(encryptedText[:self.SIZE_LENGTH], 'big')
-        encryptedText = encryptedText[self.SIZE_LENGTH:]
-        initVector = encryptedText[:self.INIT_VECTOR_LENGTH]
-        encryptedText = encryptedText[self.INIT_VECTOR_LENGTH:]
-        cipher = AES.new(secret, blockMode, initVector)
-        plaintText = bytes('', 'utf-8')
+        initVector = bytes(encryptedText[self.SIZE_LENGTH:self.SIZE_LENGTH + self.INIT_VECTOR_LENGTH])
+        encryptedText = encryptedText[self.SIZE_LENGTH + self.INIT_VECTOR_LENGTH:]
+        cipher = self._create_cipher(secret, blockMode, initVector)
         
         self._log.info(f'encrypted text len: {length}, init vector: {initVector}')
         
-        
-        if len(encryptedText) % self.BLOCK_SIZE != 0:
+        cipheredLength = self._ciphered_size(length, blockMode)
+        if len(encryptedText) != self.encrypted_size(length, blockMode) - self.SIZE_LENGTH - self.INIT_VECTOR_LENGTH:
             raise RuntimeError('bad format encrypted text is not aligned to block length')
         
-        for i in range(len(encryptedText) // self.BLOCK_SIZE):
-            plaintText += cipher.decrypt(encryptedText[i * self.INIT_VECTOR_LENGTH: (i + 1) * self.INIT_VECTOR_LENGTH])
-            
+        plaintText = cipher.decrypt(encryptedText[:cipheredLength])
+        if blockMode == AES.MODE_GCM:
+            self._verify_tag(cipher, encryptedText[cipheredLength:])
         plaintText = plaintText[: length] # remove the padding
     
         return plaintText.decode('utf-8')
     
 
     def encrypt_file(self, inputFilePath: str, outputFilePath: str, secret: str, blockMode=AES.MODE_CBC) -> None:
-        """Encrypt file block by block using AES cipher
+        """Encrypt file chunk by chunk using AES cipher
 
         Args:
             inputFilePath (string): path to the input file
@@ -111,39 +141,16 @@ class EncryptService:
             secret (string): secret key used for encryption and decryption
             blockMode (number, optional): Block cipher mode. Defaults to AES.MODE_CBC.
         """
-        secret = self._format_secret(secret)
-        initVector = self._create_init_vector()
-        self._log.info(f'Init vector={initVector}')
-        cipher = AES.new(secret, blockMode, initVector)
-        
-        self.save_header(inputFilePath, outputFilePath, initVector)
-        
-        inputFile = open(inputFilePath, "rb")
-        outputFile = open(outputFilePath, "ab")
-        inputBytes = True
-
-        while inputBytes:
-            inputBytes = inputFile.read(self.BLOCK_SIZE)
-            
-            if not inputBytes:
-                break
-            
-            # if input bytes aren't aligned to BLOCK_SIZE, add padding of spaces
-            if len(inputBytes) < self.BLOCK_SIZE:
-                paddingLength = self.BLOCK_SIZE - len(inputBytes)
-                inputBytes += bytes(" " * paddingLength, 'utf-8')
-                
-            outputBytes = cipher.encrypt(inputBytes)
-            outputFile.write(outputBytes)
-            
-        inputFile.close()
-        outputFile.close()
+        with open(inputFilePath, 'rb') as inputFile, open(outputFilePath, 'wb') as outputFile:
+            inputFileSize = os.fstat(inputFile.fileno()).st_size
+            for chunk in self.encrypt_stream(inputFile, inputFileSize, secret, blockMode):
+                outputFile.write(chunk)
         
         self._log.info(f'🔐 File \"{inputFilePath}\" was encrypted.')
         
     
     def decrypt_file(self, inputFilePath: str, outputFilePath: str, secret: str, blockMode=AES.MODE_CBC) -> None:
-        """Decrypt file block by block
+        """Decrypt file chunk by chunk
 
         Args:
             inputFilePath (string): path to the input file
@@ -151,35 +158,256 @@ class EncryptService:
             secret (string): secret key used for encryption and decryption
             blockMode (number, optional): Block cipher mode.. Defaults to AES.MODE_CBC.
         """
-               
-        numberOfBytesToRead, initVector, inputFile = self.read_header(inputFilePath)
+        with open(inputFilePath, 'rb') as inputFile, open(outputFilePath, 'wb') as outputFile:
+            self.decrypt_stream(inputFile, outputFile, secret, blockMode)
+            
+        self._log.info(f'🔓 File {inputFilePath} was decrypted')
 
-        secret = self._format_secret(secret)
-        cipher = AES.new(secret, blockMode, initVector)
-        outputFile = open(outputFilePath, 'wb')
-        inputBytes = True
+    
+    def encrypt_stream(self, inputStream: BinaryIO, size: int, secret: str | bytes, blockMode=AES.MODE_CBC) -> Iterator[memoryview]:
+        """Encrypt `size` bytes of input stream chunk by chunk using AES cipher. Yields header (size, init vector)
+        followed by encrypted chunks. Chunks are views into a reused buffer, they are valid until the next
+        chunk is requested.
 
-        while inputBytes:
-            inputBytes = inputFile.read(self.BLOCK_SIZE)
-            numberOfBytesToRead -= len(inputBytes)
-            
-            if not inputBytes:
-                break
-                
-            outputBytes = cipher.decrypt(inputBytes)
-            
-            # if last block
-            if numberOfBytesToRead <= self.BLOCK_SIZE:
-                outputBytes = outputBytes[0 : numberOfBytesToRead]
+        Args:
+            inputStream (BinaryIO): stream to read the plain data from
+            size (int): number of bytes to encrypt
+            secret (string | bytes): secret key (or key derived by KeyService) used for encryption and decryption
+            blockMode (number, optional): Block cipher mode. Defaults to AES.MODE_CBC.
+
+        Raises:
+            RuntimeError: when input stream ends before `size` bytes are read
+
+        Yields:
+            Iterator[memoryview]: header, encrypted chunks and authentication tag (GCM)
+        """
+        secret = self._format_secret(secret)
+        initVector = self._create_init_vector()
+        cipher = self._create_cipher(secret, blockMode, initVector)
+        
+        yield memoryview(size.to_bytes(self.SIZE_LENGTH, 'big') + initVector)
+        
+        bufferSize = min(self.chunkSize, self._ciphered_size(size, blockMode))
+        inputBuffer = memoryview(bytearray(bufferSize))
+        outputBuffer = memoryview(bytearray(bufferSize))
+        remaining = size
+        
+        while remaining > 0:
+            length = self._read_into(inputStream, inputBuffer[:min(remaining, bufferSize)])
+            if length == 0:
+                raise RuntimeError(f'input stream ended {remaining} bytes before expected size {size}')
+            remaining -= length
             
-            outputFile.write(outputBytes)
+            # if input bytes aren't aligned to BLOCK_SIZE, add padding of spaces (CBC)
+            paddingLength = self._ciphered_size(length, blockMode) - length
+            inputBuffer[length:length + paddingLength] = b' ' * paddingLength
+            length += paddingLength
             
-        inputFile.close()
-        outputFile.close()
+            cipher.encrypt(inputBuffer[:length], output=outputBuffer[:length])
+            yield outputBuffer[:length]
+        
+        if blockMode == AES.MODE_GCM:
+            yield memoryview(cipher.digest())
             
-        self._log.info(f'🔓 File {inputFilePath} was decrypted')
+        self._log.info('🔐 Stream of %d bytes was encrypted.', size)
+        
+    
+    def decrypt_stream(self, inputStream: BinaryIO, outputStream: BinaryIO, secret: str | bytes, blockMode=AES.MODE_CBC) -> int:
+        """Decrypt stream chunk by chunk using AES cipher, header (size, init vector) is read from input stream.
 
+        Args:
+            inputStream (BinaryIO): stream to read the encrypted data from
+            outputStream (BinaryIO): stream to write the plain data to
+            secret (string | bytes): secret key (or key derived by KeyService) used for encryption and decryption
+            blockMode (number, optional): Block cipher mode. Defaults to AES.MODE_CBC.
+
+        Raises:
+            RuntimeError: when input stream is in wrong format
+            ValueError: when GCM authentication fails (data were already written to output stream)
+
+        Returns:
+            int: number of decrypted bytes
+        """
+        size = int.from_bytes(inputStream.read(self.SIZE_LENGTH), 'big')
+        initVector = inputStream.read(self.INIT_VECTOR_LENGTH)
+        secret = self._format_secret(secret)
+        cipher = self._create_cipher(secret, blockMode, initVector)
+        parallel = blockMode == AES.MODE_CTR and self.workers > 1
+        
+        bufferSize = min(self.chunkSize * (self.workers if parallel else 1), self._ciphered_size(size, blockMode))
+        inputBuffer = memoryview(bytearray(bufferSize))
+        outputBuffer = memoryview(bytearray(bufferSize))
+        remaining = size
+        position = 0
+        
+        with ThreadPoolExecutor(self.workers) if parallel else nullcontext() as pool:
+            while remaining > 0:
+                length = min(self._ciphered_size(remaining, blockMode), bufferSize)
+                if self._read_into(inputStream, inputBuffer[:length]) != length:
+                    raise RuntimeError('bad format encrypted stream is shorter than its size')
+                
+                if parallel:
+                    self._decrypt_parallel(pool, secret, blockMode, initVector, position, inputBuffer[:length], outputBuffer[:length])
+                else:
+                    cipher.decrypt(inputBuffer[:length], output=outputBuffer[:length])
+                outputStream.write(outputBuffer[:min(length, remaining)]) # the last block may contain padding
+                remaining -= length
+                position += length
+        
+        if blockMode == AES.MODE_GCM:
+            self._verify_tag(cipher, inputStream.read(self.TAG_LENGTH))
             
+        self._log.info('🔓 Stream of %d bytes was decrypted', size)
+        return size
+        
+        
+    def encrypt_into(self, data: bytes, buffer: bytearray, secret: str | bytes, blockMode=AES.MODE_CBC) -> memoryview:
+        """Encrypt data into buffer in the format of `encrypt_stream` - header (size, init vector) followed by
+        encrypted blocks. Data are ciphered in place, the buffer can be reused by following calls.
+
+        Args:
+            data (bytes): plain data
+            buffer (bytearray): buffer of at least `encrypted_size(len(data))` bytes
+            secret (string | bytes): secret key (or key derived by KeyService) used for encryption and decryption
+            blockMode (number, optional): Block cipher mode. Defaults to AES.MODE_CBC.
+
+        Raises:
+            ValueError: when buffer is too small
+
+        Returns:
+            memoryview: encrypted data, view into the buffer
+        """
+        size = len(data)
+        encryptedSize = self.encrypted_size(size, blockMode)
+        if len(buffer) < encryptedSize:
+            raise ValueError(f'buffer of {len(buffer)} bytes can\'t hold {encryptedSize} encrypted bytes')
+        
+        initVector = self._create_init_vector()
+        encrypted = memoryview(buffer)[:encryptedSize]
+        encrypted[:self.SIZE_LENGTH] = size.to_bytes(self.SIZE_LENGTH, 'big')
+        encrypted[self.SIZE_LENGTH:self.SIZE_LENGTH + self.INIT_VECTOR_LENGTH] = initVector
+        
+        headerLength = self.SIZE_LENGTH + self.INIT_VECTOR_LENGTH
+        blocks = encrypted[headerLength:headerLength + self._ciphered_size(size, blockMode)]
+        blocks[:size] = data
+        blocks[size:] = b' ' * (len(blocks) - size) # padding of spaces (CBC)
+        cipher = self._create_cipher(self._format_secret(secret), blockMode, initVector)
+        cipher.encrypt(blocks, output=blocks)
+        if blockMode == AES.MODE_GCM:
+            encrypted[headerLength + len(blocks):] = cipher.digest()
+        return encrypted
+    
+    
+    def decrypt_into(self, encrypted: memoryview, secret: str | bytes, blockMode=AES.MODE_CBC) -> memoryview:
+        """Decrypt data in the format of `encrypt_stream` in place.
+
+        Args:
+            encrypted (memoryview): writable encrypted data
+            secret (string | bytes): secret key (or key derived by KeyService) used for encryption and decryption
+            blockMode (number, optional): Block cipher mode. Defaults to AES.MODE_CBC.
+
+        Raises:
+            RuntimeError: when encrypted data are in wrong format
+            ValueError: when GCM authentication fails
+
+        Returns:
+            memoryview: plain data, view into the encrypted data
+        """
+        size = int.from_bytes(encrypted[:self.SIZE_LENGTH], 'big')
+        initVector = bytes(encrypted[self.SIZE_LENGTH:self.SIZE_LENGTH + self.INIT_VECTOR_LENGTH])
+        if len(encrypted) != self.encrypted_size(size, blockMode):
+            raise RuntimeError('bad format encrypted data are not aligned to block length or shorter than their size')
+        
+        headerLength = self.SIZE_LENGTH + self.INIT_VECTOR_LENGTH
+        blocks = encrypted[headerLength:headerLength + self._ciphered_size(size, blockMode)]
+        secret = self._format_secret(secret)
+        if blockMode == AES.MODE_CTR and self.workers > 1:
+            with ThreadPoolExecutor(self.workers) as pool:
+                self._decrypt_parallel(pool, secret, blockMode, initVector, 0, blocks, blocks)
+        else:
+            cipher = self._create_cipher(secret, blockMode, initVector)
+            cipher.decrypt(blocks, output=blocks)
+            if blockMode == AES.MODE_GCM:
+                self._verify_tag(cipher, encrypted[headerLength + len(blocks):])
+        return blocks[:size] # remove the padding
+    
+    
+    def decrypt_range(self, readEncrypted: Callable[[int, int], bytes], start: int, end: int, secret: str | bytes,
+                      blockMode=AES.MODE_CBC) -> bytes:
+        """Decrypt bytes from `start` to `end` of plain data without decrypting the preceding data. Only blocks
+        holding the range (and for CBC one preceding block) are read. GCM tag isn't verified.
+
+        Args:
+            readEncrypted (Callable[[int, int], bytes]): returns bytes of encrypted data (in the format of
+                `encrypt_stream`) at position, called with position and number of bytes
+            start (int): position of the first byte of the range in plain data
+            end (int): position following the last byte of the range, it's clipped to size of plain data
+            secret (string | bytes): secret key (or key derived by KeyService) used for encryption and decryption
+            blockMode (number, optional): Block cipher mode. Defaults to AES.MODE_CBC.
+
+        Raises:
+            ValueError: when the range is invalid
+
+        Returns:
+            bytes: plain data of the range
+        """
+        header = readEncrypted(0, self.SIZE_LENGTH + self.INIT_VECTOR_LENGTH)
+        size = int.from_bytes(header[:self.SIZE_LENGTH], 'big')
+        initVector = bytes(header[self.SIZE_LENGTH:])
+        end = min(end, size)
+        if not 0 <= start <= end:
+            raise ValueError(f'range {start}:{end} is out of data of {size} bytes')
+        if start == end:
+            return b''
+        
+        # blocks holding the range
+        first = start // self.BLOCK_SIZE * self.BLOCK_SIZE
+        last = -(-end // self.BLOCK_SIZE) * self.BLOCK_SIZE
+        if blockMode != AES.MODE_CBC:
+            last = min(last, size) # CTR and GCM data aren't padded
+        
+        secret = self._format_secret(secret)
+        if blockMode == AES.MODE_CBC:
+            # CBC block is decrypted using the preceding encrypted block (init vector for the first block)
+            if first > 0:
+                initVector = bytes(readEncrypted(len(header) + first - self.BLOCK_SIZE, self.BLOCK_SIZE))
+            cipher = AES.new(secret, AES.MODE_CBC, initVector)
+        else:
+            cipher = self._create_counter_cipher(secret, blockMode, initVector, first)
+        
+        plainData = cipher.decrypt(readEncrypted(len(header) + first, last - first))
+        return plainData[start - first:end - first]
+        
+        
+    def encrypted_size(self, size: int, blockMode=AES.MODE_CBC) -> int:
+        """Compute size of encrypted data including header (size, init vector) and authentication tag (GCM)
+
+        Args:
+            size (int): size of plain data in bytes
+            blockMode (number, optional): Block cipher mode. Defaults to AES.MODE_CBC.
+
+        Returns:
+            int: size of encrypted data in bytes
+        """
+        tagLength = self.TAG_LENGTH if blockMode == AES.MODE_GCM else 0
+        return self.SIZE_LENGTH + self.INIT_VECTOR_LENGTH + self._ciphered_size(size, blockMode) + tagLength
+    
+    
+    def _ciphered_size(self, size: int, blockMode) -> int:
+        """Compute size of ciphered data - CBC data are padded to BLOCK_SIZE, CTR and GCM data aren't
+
+        Args:
+            size (int): size of plain data in bytes
+            blockMode (number): Block cipher mode
+
+        Returns:
+            int: size of ciphered data in bytes
+        """
+        if blockMode == AES.MODE_CBC:
+            return -(-size // self.BLOCK_SIZE) * self.BLOCK_SIZE
+        return size
+    
+
     def save_header(self, inputFilePath: str, outputFilePath: str, initVector: bytes) -> None:
         """Save header containing metadata (file size, init vector) to output file
 
@@ -214,16 +442,19 @@ class EncryptService:
         return fileSize, initVector, inputFile
 
 
-    def _format_secret(self, secret: str) -> bytes:
+    def _format_secret(self, secret: str | bytes) -> bytes:
         """Format secret key to SECRET_LENGTH and convert it into bytes, if longer, delete remaining
-        bytes, if shorter, pad remaining bytes with spaces
+        bytes, if shorter, pad remaining bytes with spaces. Bytes are a key derived by KeyService, they are
+        used as they are.
 
         Args:
-            secret (string): secret key
+            secret (string | bytes): secret key or derived key
 
         Returns:
             bytes: formatted secret
         """
+        if isinstance(secret, (bytes, bytearray)):
+            return bytes(secret)
         if len(secret) < self.SECRET_LENGTH:
             secret = secret + ' ' * (self.SECRET_LENGTH - len(secret))
         elif len(secret) > self.SECRET_LENGTH:
@@ -231,10 +462,103 @@ class EncryptService:
         return bytes(secret, 'utf-8')
 
 
+    def _create_cipher(self, secret: bytes, blockMode, initVector: bytes):
+        """Create AES cipher ciphering data from the beginning
+
+        Args:
+            secret (bytes): formatted secret
+            blockMode (number): Block cipher mode
+            initVector (bytes): init vector
+
+        Returns:
+            cipher object
+        """
+        if blockMode == AES.MODE_CBC:
+            return AES.new(secret, blockMode, initVector)
+        if blockMode == AES.MODE_GCM:
+            return AES.new(secret, blockMode, nonce=initVector[:self.GCM_NONCE_LENGTH], mac_len=self.TAG_LENGTH)
+        return self._create_counter_cipher(secret, blockMode, initVector, 0)
+    
+    
+    def _create_counter_cipher(self, secret: bytes, blockMode, initVector: bytes, position: int):
+        """Create AES cipher in counter mode ciphering CTR or GCM data from position
+
+        Args:
+            secret (bytes): formatted secret
+            blockMode (number): Block cipher mode, AES.MODE_CTR or AES.MODE_GCM
+            initVector (bytes): init vector
+            position (int): position in ciphered data, multiple of BLOCK_SIZE
+
+        Returns:
+            cipher object
+        """
+        block = position // self.BLOCK_SIZE
+        if blockMode == AES.MODE_GCM:
+            # GCM ciphers data in counter mode, counter of the first block is nonce followed by 32-bit 2
+            return AES.new(secret, AES.MODE_CTR, nonce=initVector[:self.GCM_NONCE_LENGTH], initial_value=2 + block)
+        # counter is the whole init vector, incremented by one for every block
+        counter = (int.from_bytes(initVector, 'big') + block) % (1 << 8 * self.INIT_VECTOR_LENGTH)
+        return AES.new(secret, AES.MODE_CTR, nonce=b'', initial_value=counter)
+    
+    
+    def _decrypt_parallel(self, pool: ThreadPoolExecutor, secret: bytes, blockMode, initVector: bytes, position: int,
+                          inputBuffer: memoryview, outputBuffer: memoryview) -> None:
+        """Decrypt CTR data split into segments by threads of pool, AES releases GIL while ciphering
+
+        Args:
+            pool (ThreadPoolExecutor): pool of `workers` threads
+            secret (bytes): formatted secret
+            blockMode (number): Block cipher mode, AES.MODE_CTR
+            initVector (bytes): init vector
+            position (int): position of the input buffer in ciphered data, multiple of BLOCK_SIZE
+            inputBuffer (memoryview): ciphered data
+            outputBuffer (memoryview): buffer of the same size for plain data, may be the input buffer
+        """
+        segmentSize = max(-(-len(inputBuffer) // self.workers // self.BLOCK_SIZE), 1) * self.BLOCK_SIZE
+        decrypt = lambda start: self._create_counter_cipher(secret, blockMode, initVector, position + start).decrypt(
+            inputBuffer[start:start + segmentSize], output=outputBuffer[start:start + segmentSize])
+        list(pool.map(decrypt, range(0, len(inputBuffer), segmentSize)))
+    
+    
+    def _verify_tag(self, cipher, tag: bytes) -> None:
+        """Verify GCM authentication tag of decrypted data
+
+        Args:
+            cipher: GCM cipher that decrypted the data
+            tag (bytes): authentication tag following the data
+
+        Raises:
+            ValueError: when the data or tag were modified (or the secret is wrong)
+        """
+        try:
+            cipher.verify(bytes(tag))
+        except ValueError:
+            raise ValueError('authentication failed, encrypted data were modified or the secret is wrong') from None
+
+
     def _create_init_vector(self, length:int=INIT_VECTOR_LENGTH) -> bytes:
         """Create random initialization vector of chosen length
 
         Returns:
             (bytes): init vector
         """
-        return os.urandom(length)
\ No newline at end of file
+        return os.urandom(length)
+    
+    
+    def _read_into(self, stream: BinaryIO, buffer: memoryview) -> int:
+        """Read from stream until buffer is full or stream ends
+
+        Args:
+            stream (BinaryIO): stream to read from
+            buffer (memoryview): buffer to fill
+
+        Returns:
+            int: number of bytes read
+        """
+        length = 0
+        while length < len(buffer):
+            read = stream.readinto(buffer[length:])
+            if not read:
+                break
+            length += read
+        return length
\ No newline at end of file
@@ -0,0 +1,180 @@
+import hashlib
+import hmac
+import logging
+import os
+import struct
+import time
+from collections import OrderedDict
+from Kdf import Kdf
+
+
+class KeyService:
+    """Responsible for deriving encryption keys from passwords. Derived keys are kept in an LRU cache with
+    time to live, because derivation is deliberately expensive and the same message (the same password and salt)
+    is read by many jobs. Every embedded message gets a key of its own random salt. Callers get copies of keys,
+    the cached ones are zeroed when they are evicted from the cache.
+    Singleton pattern.
+
+    Key derivation record stored in message header: KDF (1 byte), parameters, salt, key check. Key check lets
+    a wrong password be detected without decrypting the message.
+    """
+
+    KEY_LENGTH = 32 # AES-256
+    SALT_LENGTH = 16
+    CHECK_LENGTH = 4 # number of bytes of key check
+    PARAMS_FORMATS = {Kdf.SCRYPT: '>BBB', Kdf.PBKDF2: '>I'} # scrypt: log2 of N, r, p; PBKDF2: number of iterations
+    DEFAULT_PARAMS = {Kdf.SCRYPT: (15, 8, 1), Kdf.PBKDF2: (600000,)}
+    SCRYPT_MAX_MEMORY = 256 * 1024 * 1024
+
+    cacheSize = 64 # max number of cached keys
+    cacheTtl = 600 # seconds a cached key lives
+
+    _instance = None
+    _log = logging.getLogger('KeyService')
+    _cache = OrderedDict() # (secret, kdf, params, salt) -> (key, expiration time)
+
+
+    @classmethod
+    def get_instance(cls):
+        """Create singleton instance
+
+        Returns:
+            KeyService: singleton instance
+        """
+        if cls._instance == None:
+            cls._instance = cls.__new__(cls)
+        return cls._instance
+
+
+    def __init__(self):
+        """Singleton has forbidden constructor
+
+        Raises:
+            RuntimeError: when this method is called, call `get_instance()` instead
+        """
+        raise RuntimeError('Call get_instance() instead')
+
+
+    def new_key(self, secret: str, kdf: Kdf) -> tuple[bytes, bytes]:
+        """Derive key from password with default parameters of KDF and new random salt for embedding a message,
+        so that no two messages share a key
+
+        Args:
+            secret (str): password
+            kdf (Kdf): key derivation function, not Kdf.NONE
+
+        Returns:
+            tuple[bytes, bytes]: key, key derivation record
+        """
+        params = self.DEFAULT_PARAMS[kdf]
+        salt = os.urandom(self.SALT_LENGTH)
+        key = self.derive_key(secret, kdf, params, salt)
+
+        record = bytes([kdf.value]) + struct.pack(self.PARAMS_FORMATS[kdf], *params) + salt + self._key_check(key)
+        return key, record
+
+
+    def record_key(self, secret: str, record: bytes) -> bytes:
+        """Derive key from password using key derivation record of message header
+
+        Args:
+            secret (str): password
+            record (bytes): key derivation record
+
+        Raises:
+            ValueError: when the password is wrong (key check doesn't match)
+
+        Returns:
+            bytes: key
+        """
+        kdf = Kdf(record[0])
+        paramsSize = struct.calcsize(self.PARAMS_FORMATS[kdf])
+        params = struct.unpack(self.PARAMS_FORMATS[kdf], record[1:1 + paramsSize])
+        salt = record[1 + paramsSize:1 + paramsSize + self.SALT_LENGTH]
+        check = record[1 + paramsSize + self.SALT_LENGTH:]
+
+        key = self.derive_key(secret, kdf, params, salt)
+        if not hmac.compare_digest(self._key_check(key), check):
+            raise ValueError('wrong password')
+        return key
+
+
+    def record_size(self, kdf: Kdf) -> int:
+        """Size of key derivation record
+
+        Args:
+            kdf (Kdf): key derivation function
+
+        Returns:
+            int: size in bytes, 0 for Kdf.NONE
+        """
+        if kdf == Kdf.NONE:
+            return 0
+        return 1 + struct.calcsize(self.PARAMS_FORMATS[kdf]) + self.SALT_LENGTH + self.CHECK_LENGTH
+
+
+    def derive_key(self, secret: str, kdf: Kdf, params: tuple, salt: bytes) -> bytes:
+        """Derive key from password, cached keys (of the same password, parameters and salt) are reused
+
+        Args:
+            secret (str): password
+            kdf (Kdf): key derivation function
+            params (tuple): parameters of the function
+            salt (bytes): salt
+
+        Returns:
+            bytes: copy of the key, the cached one is zeroed when it's evicted
+        """
+        self._evict_expired()
+        cacheKey = (secret, kdf, params, bytes(salt))
+        if cacheKey in self._cache:
+            self._cache.move_to_end(cacheKey)
+            return bytes(self._cache[cacheKey][0])
+
+        if kdf == Kdf.SCRYPT:
+            logN, r, p = params
+            key = hashlib.scrypt(secret.encode('utf-8'), salt=salt, n=1 << logN, r=r, p=p,
+                                 maxmem=self.SCRYPT_MAX_MEMORY, dklen=self.KEY_LENGTH)
+        else:
+            key = hashlib.pbkdf2_hmac('sha256', secret.encode('utf-8'), salt, params[0], self.KEY_LENGTH)
+        self._log.debug('🔑 key derived using %s', kdf)
+
+        if self.cacheSize > 0:
+            self._cache[cacheKey] = (bytearray(key), time.monotonic() + self.cacheTtl)
+            while len(self._cache) > self.cacheSize:
+                self._evict(next(iter(self._cache)))
+        return key
+
+
+    def clear_cache(self) -> None:
+        """Evict all keys from the cache"""
+        for cacheKey in list(self._cache):
+            self._evict(cacheKey)
+
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        for cacheKey in [cacheKey for cacheKey, (_, expiration) in self._cache.items() if expiration <= now]:
+            self._evict(cacheKey)
+
+
+    def _evict(self, cacheKey: tuple) -> None:
+        """Remove key from the cache and zero the cached copy, copies held by callers stay valid
+
+        Args:
+            cacheKey (tuple): key of the cache entry
+        """
+        key, _ = self._cache.pop(cacheKey)
+        key[:] = bytes(len(key))
+
+
+    def _key_check(self, key: bytes) -> bytes:
+        """Short digest of key stored in header, detects wrong password
+
+        Args:
+            key (bytes): derived key
+
+        Returns:
+            bytes: key check
+        """
+        return hmac.new(bytes(key), b'key check', hashlib.sha256).digest()[:self.CHECK_LENGTH]
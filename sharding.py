@@ -0,0 +1,264 @@
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO
+from PIL import Image
+from batch import configure_services
+from bitplane import CoverLayout
+from ContentType import ContentType
+from encoder import DEFAULT_FORMAT, EXTENSIONS
+from MessageHeader import MessageHeader
+from service.EmbedService import EmbedService
+
+# Payload too big for one cover is compressed and encrypted once, then the encrypted data are split into shards
+# by capacity of the covers. Every shard is embedded into its own cover, its header carries set ID, index and count
+# of the shards besides the fields of the whole payload (codec, key derivation, cipher mode, ...). Shards are read
+# in any order and concatenated by index before decryption.
+
+IMAGE_EXTENSIONS = ('.png', '.bmp', '.tif', '.tiff', '.jpg', '.jpeg', '.webp')
+
+log = logging.getLogger('Sharding')
+
+
+def list_images(directory: str) -> list[str]:
+    """List images of directory sorted by name
+
+    Args:
+        directory (str): path to the directory
+
+    Returns:
+        list[str]: paths to the images
+    """
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def split_by_capacity(size: int, capacities: list[int]) -> list[int]:
+    """Split data into shards proportional to capacities of covers, so that every cover is filled evenly
+
+    Args:
+        size (int): number of bytes to split, at most sum of capacities
+        capacities (list[int]): number of bytes fitting into every cover
+
+    Returns:
+        list[int]: size of shard of every cover
+    """
+    totalCapacity = sum(capacities)
+    sizes = [size * capacity // totalCapacity for capacity in capacities]
+    # bytes lost by rounding down go to covers with free capacity
+    for index, capacity in enumerate(capacities):
+        extra = min(size - sum(sizes), capacity - sizes[index])
+        sizes[index] += extra
+    return sizes
+
+
+def embed_sharded(pathsToCovers: list[str], outputDirectory: str, secret: str, poolSize: int, settings: dict, chunkSize: int,
+                  pathsToFilesToEmbed: list[str] = None, plainText: str = None) -> bool:
+    """Embed file(s) or string split into shards into covers, covers are embedded in a pool of worker processes.
+    Shards are saved into output directory as images named after the covers, in `imageFormat` (PNG by default)
+    whatever the format of the covers is.
+
+    Args:
+        pathsToCovers (list[str]): paths to the covers
+        outputDirectory (str): directory to save images with embedded shards to
+        secret (str): secret password for encryption
+        poolSize (int): number of worker processes
+        settings (dict): attributes of `EmbedService` set in every worker
+        chunkSize (int): number of bytes encrypted and decrypted at once
+        pathsToFilesToEmbed (list[str], optional): files to embed, more of them (or `container` setting) are packed
+            into container, - reads standard input. Defaults to None.
+        plainText (str, optional): string to embed instead of files. Defaults to None.
+
+    Returns:
+        bool: True if the payload was embedded, False if it doesn't fit into the covers
+    """
+    embedService = EmbedService.get_instance()
+    files = []
+    try:
+        for path in pathsToFilesToEmbed or []:
+            files.append(_open_file(path))
+
+        covers = [(path, _cover_channels(path)) for path in pathsToCovers]
+        limit = sum(numberOfChannels * embedService.depth // 8 for _, numberOfChannels in covers)
+        if plainText is not None:
+            plainText = plainText.encode('utf-8')
+            encrypted = embedService.encrypt_payload(io.BytesIO(plainText), len(plainText), ContentType.STRING, limit, secret)
+        elif len(files) == 1 and not embedService.container:
+            _, payload, payloadSize = files[0]
+            encrypted = embedService.encrypt_payload(payload, payloadSize, ContentType.FILE, limit, secret)
+        else:
+            encrypted = embedService.encrypt_payload(None, sum(size for _, _, size in files), ContentType.FILE, limit, secret, files)
+    finally:
+        for _, payload, _ in files:
+            payload.close()
+
+    try:
+        if encrypted is None:
+            log.error('🚨 covers are too small, embedded content can\'t fit there')
+            return False
+        data, header = encrypted
+
+        # header length doesn't depend on size, index and count of shard
+        header.shard = (os.urandom(MessageHeader.SHARD_ID_LENGTH), 0, 0)
+        covers = [(path, embedService.data_capacity(numberOfChannels, header)) for path, numberOfChannels in covers]
+        covers = [(path, capacity) for path, capacity in covers if capacity > 0]
+        if len(data) > sum(capacity for _, capacity in covers):
+            log.error('🚨 covers are too small, embedded content can\'t fit there')
+            return False
+
+        os.makedirs(outputDirectory, exist_ok=True)
+        extension = EXTENSIONS[embedService.imageFormat or DEFAULT_FORMAT]
+        shards, position = [], 0
+        for index, ((path, _), size) in enumerate(zip(covers, split_by_capacity(len(data), [capacity for _, capacity in covers]))):
+            shardHeader = MessageHeader(size, header.contentType, header.depth, header.codec, header.keyDerivation, header.cipherMode,
+                                        header.layout, (header.shard[0], index, len(covers)))
+            outputPath = os.path.join(outputDirectory, os.path.splitext(os.path.basename(path))[0] + extension)
+            shards.append((bytes(data[position:position + size]), shardHeader, path, outputPath))
+            position += size
+        if len({outputPath for *_, outputPath in shards}) < len(shards):
+            raise ValueError('covers must have distinct names, shards are saved under them')
+
+        with embedService.metrics.stage('embed', len(data)), \
+             ProcessPoolExecutor(min(poolSize, len(shards)), initializer=configure_services, initargs=(settings, chunkSize)) as executor:
+            tasks = [executor.submit(_embed_shard, *shard) for shard in shards]
+            try:
+                for task in tasks:
+                    task.result()
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                executor.shutdown(wait=True)
+                for *_, outputPath in shards:
+                    if os.path.exists(outputPath):
+                        os.remove(outputPath)
+                raise
+
+        log.info('🧩 %d bytes embedded in %d shards into %s', len(data), len(shards), outputDirectory)
+        return True
+    finally:
+        embedService.metrics.emit('embed')
+
+
+def extract_sharded(pathsToImages: list[str], outputFilePath: str, secret: str, poolSize: int, settings: dict, chunkSize: int) -> str:
+    """Extract payload split into shards from images given in any order, images are read in a pool of worker
+    processes. Headers are read first, so that a missing shard is reported before any data are extracted.
+
+    Args:
+        pathsToImages (list[str]): paths to the images holding the shards
+        outputFilePath (str): path to the output file if the payload is file, - writes it to standard output
+        secret (str): secret password for decryption
+        poolSize (int): number of worker processes
+        settings (dict): attributes of `EmbedService` set in every worker
+        chunkSize (int): number of bytes encrypted and decrypted at once
+
+    Raises:
+        ValueError: when an image doesn't hold a shard, shards belong to different sets, a shard is missing
+            or the password is wrong
+
+    Returns:
+        str: the payload if it's string, None otherwise
+    """
+    embedService = EmbedService.get_instance()
+    try:
+        if not pathsToImages:
+            raise ValueError('no images holding shards given')
+        with ProcessPoolExecutor(min(poolSize, len(pathsToImages)), initializer=configure_services, initargs=(settings, chunkSize)) as executor:
+            headers = list(executor.map(_read_header, pathsToImages))
+
+            shards = {}
+            for path, header in zip(pathsToImages, headers):
+                if header.shard is None:
+                    raise ValueError(f'{path} doesn\'t hold a shard')
+                setId, index, count = header.shard
+                if (setId, count) != (headers[0].shard[0], headers[0].shard[2]):
+                    raise ValueError(f'{path} holds shard of a different set')
+                if index in shards:
+                    log.warning('shard %d is held by both %s and %s, the first one is used', index, shards[index], path)
+                    continue
+                shards[index] = path
+            missing = sorted(set(range(count)) - set(shards))
+            if missing:
+                raise ValueError(f'{len(missing)} of {count} shards are missing (indices {", ".join(map(str, missing))})')
+
+            # encrypted data of shards are concatenated by index
+            data = bytearray()
+            for _, shard in executor.map(_read_shard, [shards[index] for index in range(count)]):
+                data += shard
+        log.info('🧩 %d bytes extracted from %d shards', len(data), count)
+
+        header = headers[0]
+        header = MessageHeader(len(data), header.contentType, header.depth, header.codec, header.keyDerivation, header.cipherMode, header.layout)
+        return embedService.save_message(header, io.BytesIO(data), outputFilePath, secret)
+    finally:
+        embedService.metrics.emit('extract')
+
+
+def _open_file(path: str) -> tuple[str, BinaryIO, int]:
+    """Open file to embed, standard input is read into memory
+
+    Args:
+        path (str): path to the file, - for standard input
+
+    Returns:
+        tuple[str, BinaryIO, int]: name, stream and size of the file
+    """
+    if path == EmbedService.STDIO_PATH:
+        data = sys.stdin.buffer.read()
+        return 'stdin', io.BytesIO(data), len(data)
+    payload = open(path, 'rb')
+    return os.path.basename(path), payload, os.fstat(payload.fileno()).st_size
+
+
+def _cover_channels(path: str) -> int:
+    """Number of channels of cover holding data, alpha of covers having it is checked by decoding them (unless
+    they are cached)
+
+    Args:
+        path (str): path to the cover
+
+    Returns:
+        int: number of channels
+    """
+    coverCache = EmbedService.get_instance().coverCache
+    if coverCache is not None:
+        cover, layout = coverCache.open(path, EmbedService.get_instance().metrics)
+        return layout.number_of_channels(cover.size)
+    cover = Image.open(path)
+    return CoverLayout.of(cover).number_of_channels(cover.size)
+
+
+def _embed_shard(shard: bytes, header: MessageHeader, pathToCover: str, pathToOutputImage: str) -> None:
+    """Embed shard into cover, executed in worker process
+
+    Args:
+        shard (bytes): part of encrypted payload
+        header (MessageHeader): header of the shard
+        pathToCover (str): path to the cover
+        pathToOutputImage (str): path to the output image
+    """
+    EmbedService.get_instance().embed_shard(shard, header, pathToCover, pathToOutputImage)
+
+
+def _read_header(pathToImage: str) -> MessageHeader:
+    """Read header of embedded shard, executed in worker process
+
+    Args:
+        pathToImage (str): path to the image holding the shard
+
+    Returns:
+        MessageHeader: header of the shard
+    """
+    return EmbedService.get_instance().read_header(pathToImage)
+
+
+def _read_shard(pathToImage: str) -> tuple[MessageHeader, bytes]:
+    """Read embedded shard, executed in worker process
+
+    Args:
+        pathToImage (str): path to the image holding the shard
+
+    Returns:
+        tuple[MessageHeader, bytes]: header of the shard, encrypted data of the shard
+    """
+    return EmbedService.get_instance().read_shard(pathToImage)
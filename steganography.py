@@ -1,6 +1,18 @@
 import argparse
 import logging.config
+import os
+import sys
+from batch import run_batch
+from scan import run_scan
+from server import Server
+from sharding import embed_sharded, extract_sharded, list_images
+from CipherMode import CipherMode
+from covercache import CoverCache
+from Codec import Codec
+from Kdf import Kdf
+from metrics import JsonMetrics, PrometheusMetrics
 from service.EmbedService import EmbedService
+from service.EncryptService import EncryptService
 
 # logging set up
 logging.config.fileConfig('logger.conf')
@@ -13,20 +25,138 @@ embedService = EmbedService.get_instance()
 parser = argparse.ArgumentParser(description="Steganography")
 parser.add_argument('-e', '--embed', action='store_true', help='Embed data to input image.')
 parser.add_argument('-x', '--extract', action='store_true', help='Extract data from input image.')
-parser.add_argument('-p', '--password', type=str, help='Secret password for encryption and decryption (max length is 16).')
-parser.add_argument('-i', '--input-file', type=str, help='File to embed data into or extract data from.')
-parser.add_argument('-f', '--file-content', type=str, help='File content to embed.')
+parser.add_argument('-p', '--password', type=str, help='Secret password for encryption and decryption (max length is 16 with --kdf none).')
+parser.add_argument('-i', '--input-file', type=str, help='File to embed data into or extract data from. ' +
+                    'Directory of covers splits embedded data into shards across them (output file is directory then), ' +
+                    'directory of images holding shards extracts the data from them.')
+parser.add_argument('-f', '--file-content', type=str, action='append', help='File content to embed, - reads it from standard input. ' +
+                    'Repeated option embeds the files as container (and extracts them into output directory).')
 parser.add_argument('-s', '--string-content', type=str, help='String to embed into the input image.')
 parser.add_argument('-o', '--output-file', type=str, help='Output file that will contain the embedded file ' + 
-                    'in case of embedding, extracted data in case of extracting')
+                    'in case of embedding, extracted data in case of extracting (- writes extracted file to standard output)')
+parser.add_argument('-d', '--depth', type=int, default=1, choices=range(1, 5), help='Number of least significant bits of each channel holding embedded data.')
+parser.add_argument('-c', '--compression', choices=['none', 'zlib', 'lzma', 'auto'], default='none',
+                    help='Compress embedded content before encryption, auto uses zlib unless content is incompressible.')
+parser.add_argument('--kdf', choices=['none', 'scrypt', 'pbkdf2'], help='Derive encryption key from password ' +
+                    '(salt is stored in the embedded header), none pads password to the key length (default with --legacy-engine). ' +
+                    'Defaults to scrypt.')
+parser.add_argument('--cipher', choices=['cbc', 'ctr', 'gcm'], default='cbc', help='Block cipher mode of encryption ' +
+                    '(stored in the embedded header), CTR is decrypted in parallel by --workers threads, GCM authenticates embedded data.')
+parser.add_argument('--scatter', action='store_true', help='Scatter embedded data over the whole image in order of ' +
+                    'pseudo-random permutation derived from the password (stored in the embedded header), not from the first rows.')
+parser.add_argument('--update', action='store_true', help='Replace message embedded into input image by the content ' +
+                    '(clean cover isn\'t needed), reusing key derivation, cipher mode, depth and scatter salt of its header. ' +
+                    'Only channels holding the old or new message change. Output file defaults to the input file.')
+parser.add_argument('--container', action='store_true', help='Embed file content as chunk-indexed container, ' +
+                    'so that --range of it can be extracted without decoding and decrypting the rest.')
+parser.add_argument('--range', type=str, metavar='START:END', help='Extract only bytes from START to END (open ends allowed) ' +
+                    'of container content (or of content that is not compressed).')
+parser.add_argument('--list', action='store_true', help='List files of embedded container with their offsets and sizes.')
+parser.add_argument('--image-format', choices=['png', 'webp', 'tiff', 'bmp'], help='Lossless format of output image ' +
+                    '(by default given by extension of output file, PNG without extension), lossy formats are rejected.')
+parser.add_argument('--compress-level', type=int, choices=range(0, 10), help='Compression level of PNG and lossless WebP ' +
+                    'output image from 0 (fastest) to 9 (smallest), TIFF and BMP are uncompressed. Defaults to 6.')
+parser.add_argument('--chunk-size', type=int, default=4, help='Number of MiB encrypted and decrypted at once.')
+parser.add_argument('--workers', type=int, default=1, help='Number of processes embedding and extracting in parallel (row bands, pages of multi-page TIFF).')
+parser.add_argument('--strip-rows', type=int, help='Process image in place in strips of this many rows to bound memory.')
+parser.add_argument('--cover-cache', type=str, metavar='DIRECTORY', help='Cache decoded covers in directory, ' +
+                    'embedding into cached cover again (e.g. by batch jobs) skips decoding it.')
+parser.add_argument('--cover-cache-size', type=int, default=1024, help='Number of MiB of decoded covers kept in --cover-cache, ' +
+                    'least recently used ones are evicted.')
+parser.add_argument('--legacy-engine', action='store_true', help='Embed pixel by pixel (slow, for comparison).')
+parser.add_argument('--metrics', choices=['json', 'prometheus'], help='Record time, bytes and pixels of every stage ' +
+                    '(decode, compress, derive, validate, encrypt, pack, embed, encode, write / extract, derive, decrypt).')
+parser.add_argument('--metrics-file', type=str, help='File to write metrics to, JSON lines are appended ' +
+                    '(standard error by default), Prometheus textfile is replaced.')
+parser.add_argument('--batch', type=str, metavar='MANIFEST', help='Run embed and extract jobs of JSON lines manifest ' +
+                    '(- reads it from standard input) in a pool of processes, result of every job is written to standard output.')
+parser.add_argument('--batch-workers', type=int, default=os.cpu_count(), help='Number of processes running batch jobs.')
+parser.add_argument('--scan', type=str, metavar='DIRECTORY', help='Find images of directory tree holding embedded data by reading ' +
+                    'only their headers, JSON line of every image is appended to --output-file (standard output by default). ' +
+                    'Images already listed in output file are skipped, so that interrupted scan resumes.')
+parser.add_argument('--scan-workers', type=int, default=os.cpu_count(), help='Number of processes scanning images.')
+parser.add_argument('--shard-workers', type=int, default=os.cpu_count(), help='Number of processes embedding and extracting shards.')
+parser.add_argument('--serve', action='store_true', help='Serve embed and extract requests over HTTP on Unix socket or localhost port.')
+parser.add_argument('--socket', type=str, help='Unix socket the server listens on.')
+parser.add_argument('--port', type=int, default=8080, help='Localhost port the server listens on (unless --socket is set).')
+parser.add_argument('--serve-workers', type=int, default=os.cpu_count(), help='Number of processes running requests of the server.')
+parser.add_argument('--queue-depth', type=int, default=64, help='Number of requests waiting for a worker, more are rejected with 503.')
 
-args = parser.parse_args()
+# worker processes spawned by --workers import this module, only the main process runs the command
+if __name__ == '__main__':
+    args = parser.parse_args()
 
-if args.embed:
-    if args.string_content:
-        print(f'string content is: {args.string_content}')
-        embedService.embed_string(args.string_content, args.input_file, args.output_file, args.password)
-    elif args.file_content:
-        embedService.embed_file(args.file_content, args.input_file, args.output_file, args.password)
-elif args.extract:
-    embedService.get_embedded_message(args.input_file, args.output_file, args.password)
+    settings = {
+        'legacyEngine': args.legacy_engine,
+        'workers': args.workers,
+        'stripRows': args.strip_rows,
+        'depth': args.depth,
+        'codec': Codec.ZLIB if args.compression == 'auto' else Codec[args.compression.upper()],
+        'autoCodec': args.compression == 'auto',
+        'kdf': Kdf[(args.kdf or ('none' if args.legacy_engine else 'scrypt')).upper()],
+        'cipherMode': CipherMode[args.cipher.upper()],
+        'container': args.container,
+        'scatter': args.scatter,
+        'update': args.update,
+        'imageFormat': args.image_format.upper() if args.image_format else None,
+        'compressLevel': args.compress_level,
+        'coverCache': CoverCache(args.cover_cache, args.cover_cache_size * 1024 * 1024) if args.cover_cache else None,
+    }
+    for name, value in settings.items():
+        setattr(embedService, name, value)
+    EncryptService.get_instance().set_chunk_size(args.chunk_size * 1024 * 1024)
+    EncryptService.get_instance().workers = args.workers
+    
+    if args.metrics == 'json':
+        embedService.metrics = JsonMetrics(open(args.metrics_file, 'a') if args.metrics_file else None)
+    elif args.metrics == 'prometheus':
+        if not args.metrics_file:
+            parser.error('--metrics prometheus requires --metrics-file')
+        embedService.metrics = PrometheusMetrics(args.metrics_file)
+
+    if args.batch:
+        summary = run_batch(args.batch, args.batch_workers, settings, args.chunk_size * 1024 * 1024, sys.stdout)
+        sys.exit(1 if summary['failed'] else 0)
+    elif args.scan:
+        run_scan(args.scan, args.scan_workers, settings, args.chunk_size * 1024 * 1024,
+                 args.output_file if args.output_file != '-' else None, sys.stdout)
+    elif args.serve:
+        Server(settings, args.chunk_size * 1024 * 1024, args.serve_workers, args.queue_depth).serve(args.socket, args.port)
+    elif args.input_file and os.path.isdir(args.input_file):
+        if args.update:
+            parser.error('--update can\'t replace shards')
+        if args.legacy_engine:
+            parser.error('--legacy-engine can\'t split data into shards')
+        images = list_images(args.input_file)
+        if args.embed and not args.output_file:
+            parser.error('embedding into directory of covers requires --output-file directory')
+        if args.embed:
+            embed_sharded(images, args.output_file, args.password, args.shard_workers, settings, args.chunk_size * 1024 * 1024,
+                          args.file_content, args.string_content)
+        elif args.extract:
+            extract_sharded(images, args.output_file, args.password, args.shard_workers, settings, args.chunk_size * 1024 * 1024)
+    elif args.embed:
+        if args.update and args.legacy_engine:
+            parser.error('--update embeds with array engine, not --legacy-engine')
+        if args.update and not args.output_file:
+            args.output_file = args.input_file
+        if args.string_content:
+            print(f'string content is: {args.string_content}')
+            embedService.embed_string(args.string_content, args.input_file, args.output_file, args.password)
+        elif args.file_content and len(args.file_content) > 1:
+            embedService.embed_files(args.file_content, args.input_file, args.output_file, args.password)
+        elif args.file_content:
+            embedService.embed_file(args.file_content[0], args.input_file, args.output_file, args.password)
+    elif args.extract and args.list:
+        for name, offset, size in embedService.list_files(args.input_file, args.password):
+            print(f'{offset}:{offset + size}\t{size}\t{name}')
+    elif args.extract and args.range:
+        start, _, end = args.range.partition(':')
+        data = embedService.extract_range(args.input_file, int(start or 0), int(end) if end else sys.maxsize, args.password)
+        if args.output_file and args.output_file != '-':
+            with open(args.output_file, 'wb') as outputFile:
+                outputFile.write(data)
+        else:
+            sys.stdout.buffer.write(data)
+    elif args.extract:
+        embedService.get_embedded_message(args.input_file, args.output_file, args.password)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# modules of the repository are imported as top-level modules, as steganography.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
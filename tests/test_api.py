@@ -0,0 +1,39 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from api import Extractor
+from ContentType import ContentType
+from MessageHeader import MessageHeader
+from service.EmbedService import EmbedService
+
+SECRET = 'secret'
+
+
+@pytest.fixture
+def cover(tmp_path):
+    path = str(tmp_path / 'cover.png')
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)).save(path)
+    return path
+
+
+def test_extractor_rejects_shard(cover, tmp_path):
+    output = str(tmp_path / 'shard.png')
+    shard = os.urandom(300)
+    EmbedService.get_instance().embed_shard(shard, MessageHeader(len(shard), ContentType.FILE, shard=(os.urandom(8), 0, 2)), cover, output)
+
+    with pytest.raises(ValueError, match='shard 1 of 2'):
+        Extractor(SECRET).extract(output)
+
+
+def test_extractor_rejects_container(cover, tmp_path, monkeypatch):
+    embedService = EmbedService.get_instance()
+    monkeypatch.setattr(embedService, 'container', True)
+    pathToFile = str(tmp_path / 'file.bin')
+    with open(pathToFile, 'wb') as file:
+        file.write(os.urandom(500))
+    output = str(tmp_path / 'container.png')
+    assert embedService.embed_files([pathToFile], cover, output, SECRET)
+
+    with pytest.raises(ValueError, match='container'):
+        Extractor(SECRET).extract(output)
@@ -0,0 +1,34 @@
+import io
+import json
+import numpy as np
+import pytest
+from PIL import Image
+from covercache import CoverCache
+from metrics import JsonMetrics
+from service.EmbedService import EmbedService
+
+
+@pytest.fixture
+def covers(tmp_path):
+    paths = []
+    for index in range(2):
+        path = str(tmp_path / f'cover{index}.png')
+        Image.fromarray(np.random.default_rng(index).integers(0, 256, (60, 80, 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_cache_counters_are_reported_by_metrics(tmp_path, covers, monkeypatch):
+    embedService = EmbedService.get_instance()
+    output = io.StringIO()
+    monkeypatch.setattr(embedService, 'metrics', JsonMetrics(output))
+    monkeypatch.setattr(embedService, 'coverCache', CoverCache(str(tmp_path / 'cache'), 60 * 80 * 3)) # budget of one cover
+
+    for cover in [covers[0], covers[0], covers[1]]:
+        assert embedService.embed_string('message', cover, str(tmp_path / 'out.png'), 'secret')
+
+    jobs = [json.loads(line)['stages'] for line in output.getvalue().splitlines()]
+    counters = [{name: job[f'cover_cache_{name}']['calls'] for name in ('hits', 'misses', 'evictions') if f'cover_cache_{name}' in job}
+                for job in jobs]
+    assert counters == [{'misses': 1}, {'hits': 1}, {'misses': 1, 'evictions': 1}]
+    assert embedService.coverCache.stats() == {'hits': 1, 'misses': 2, 'evictions': 1}
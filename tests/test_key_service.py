@@ -0,0 +1,30 @@
+import pytest
+from Kdf import Kdf
+from service.KeyService import KeyService
+
+
+@pytest.fixture
+def keyService(monkeypatch):
+    keyService = KeyService.get_instance()
+    monkeypatch.setitem(KeyService.DEFAULT_PARAMS, Kdf.PBKDF2, (1000,))
+    keyService.clear_cache()
+    yield keyService
+    keyService.clear_cache()
+
+
+def test_new_keys_of_one_password_have_their_own_salts(keyService):
+    firstKey, firstRecord = keyService.new_key('secret', Kdf.PBKDF2)
+    secondKey, secondRecord = keyService.new_key('secret', Kdf.PBKDF2)
+    assert firstRecord != secondRecord
+    assert firstKey != secondKey
+    assert keyService.record_key('secret', firstRecord) == firstKey
+    assert keyService.record_key('secret', secondRecord) == secondKey
+
+
+def test_key_held_by_caller_survives_eviction(keyService):
+    key, record = keyService.new_key('secret', Kdf.PBKDF2)
+    cachedKey = keyService.record_key('secret', record)
+    keyService.clear_cache()
+    assert key == cachedKey
+    assert any(key)
+    assert keyService.record_key('secret', record) == key
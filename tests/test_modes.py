@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageFile
+from api import Embedder, Extractor
+from service.EmbedService import EmbedService
+
+SECRET = 'secret'
+MESSAGE = 'message embedded into every cover mode'
+WIDTH, HEIGHT = 160, 120
+
+
+def random_cover(mode: str, alpha: int = None) -> Image.Image:
+    """Random cover of mode, alpha of every pixel is at least `alpha` when it's set (low alpha when it's small)"""
+    rng = np.random.default_rng(0)
+    if mode == 'I;16':
+        return Image.fromarray(rng.integers(0, 65536, (HEIGHT, WIDTH), dtype=np.uint16))
+    array = rng.integers(0, 256, (HEIGHT, WIDTH, len(mode)), dtype=np.uint8)
+    if alpha is not None:
+        array[..., -1] = rng.integers(alpha, alpha + 16, (HEIGHT, WIDTH))
+    return Image.fromarray(array[..., 0] if mode == 'L' else array, mode)
+
+
+COVERS = {
+    'L': lambda: random_cover('L'),
+    'LA': lambda: random_cover('LA', alpha=200),
+    'RGBA opaque': lambda: random_cover('RGBA', alpha=200),
+    'RGBA low alpha': lambda: random_cover('RGBA', alpha=0),
+    'I;16': lambda: random_cover('I;16'),
+}
+
+
+@pytest.fixture(params=COVERS)
+def cover(request, tmp_path):
+    path = str(tmp_path / 'cover.png')
+    COVERS[request.param]().save(path, dpi=(300, 300))
+    return path
+
+
+def assert_source_kept(cover: str, output: Image.Image) -> None:
+    """Output keeps mode, metadata and (not embedded) alpha of the cover"""
+    source = Image.open(cover)
+    assert output.mode == source.mode
+    assert output.info['dpi'] == pytest.approx(source.info['dpi'], abs=0.1)
+    if source.mode == 'RGBA' and np.asarray(source)[..., 3].min() < 16:
+        assert np.array_equal(np.asarray(output)[..., 3], np.asarray(source)[..., 3])
+
+
+def test_service_round_trip(cover, tmp_path):
+    embedService = EmbedService.get_instance()
+    output = str(tmp_path / 'output.png')
+    assert embedService.embed_string(MESSAGE, cover, output, SECRET)
+
+    assert embedService.get_embedded_message(output, None, SECRET) == MESSAGE
+    assert Extractor(SECRET).extract_string(output) == MESSAGE
+    assert_source_kept(cover, Image.open(output))
+
+
+def test_api_round_trip(cover, tmp_path):
+    output = str(tmp_path / 'output.png')
+    with open(output, 'wb') as file:
+        file.write(Embedder(SECRET, depth=2).embed_bytes(MESSAGE, cover))
+
+    assert Extractor(SECRET).extract_string(output) == MESSAGE
+    assert EmbedService.get_instance().get_embedded_message(output, None, SECRET) == MESSAGE
+    assert_source_kept(cover, Image.open(output))
+
+
+def test_consecutive_embeds_keep_earlier_results(cover):
+    embedder = Embedder(SECRET)
+    first = embedder.embed('first message', cover)
+    pixels = np.asarray(first).copy()
+    second = embedder.embed('second message', cover)
+
+    assert np.array_equal(np.asarray(first), pixels)
+    assert Extractor(SECRET).extract_string(first) == 'first message'
+    assert Extractor(SECRET).extract_string(second) == 'second message'
+
+
+def test_header_of_low_alpha_image_is_read_without_decoding_it(tmp_path, monkeypatch):
+    cover, output = str(tmp_path / 'cover.png'), str(tmp_path / 'output.png')
+    random_cover('RGBA', alpha=0).save(cover)
+    EmbedService.get_instance().embed_string(MESSAGE, cover, output, SECRET)
+    decodedRows = []
+    load = ImageFile.ImageFile.load
+
+    def counting_load(image):
+        decodedRows.extend(bottom - top for _, (_, top, _, bottom), *_ in image.tile)
+        return load(image)
+
+    monkeypatch.setattr(ImageFile.ImageFile, 'load', counting_load)
+    header = EmbedService.get_instance().read_header(output)
+
+    assert header.size > 0
+    assert 0 < sum(decodedRows) < HEIGHT
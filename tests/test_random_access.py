@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from CipherMode import CipherMode
+from metrics import Metrics
+from service.EmbedService import EmbedService
+
+WIDTH = 600
+HEIGHT = 2000
+
+
+class RecordingMetrics(Metrics):
+    """Metrics keeping stages of every finished job"""
+
+    def __init__(self):
+        super().__init__()
+        self.jobs = []
+
+
+    def _write(self, operation: str, stages: dict[str, dict]) -> None:
+        self.jobs.append((operation, stages))
+
+
+    def decoded_rows(self, width: int = WIDTH) -> int:
+        return sum(stages.get('decode', {}).get('pixels', 0) for _, stages in self.jobs) // width
+
+
+@pytest.fixture
+def embedService(monkeypatch):
+    embedService = EmbedService.get_instance()
+    monkeypatch.setattr(embedService, 'cipherMode', CipherMode.CTR)
+    monkeypatch.setattr(embedService, 'container', True)
+    monkeypatch.setattr(embedService, 'containerChunkSize', 1024)
+    return embedService
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = []
+    for index, size in enumerate([3000, 5000, 2000]):
+        path = tmp_path / f'file{index}.bin'
+        path.write_bytes(os.urandom(size))
+        paths.append(str(path))
+    return paths
+
+
+@pytest.fixture
+def stegoImage(tmp_path, embedService, files):
+    cover = tmp_path / 'cover.png'
+    Image.fromarray(np.random.default_rng(1).integers(0, 256, (HEIGHT, WIDTH, 3), dtype=np.uint8)).save(cover, compress_level=1)
+    stegoImage = str(tmp_path / 'stego.png')
+    assert embedService.embed_files(files, str(cover), stegoImage, 'secret')
+    return stegoImage
+
+
+def message_rows(embedService: EmbedService, stegoImage: str) -> int:
+    messageRows = -(-embedService.read_header(stegoImage).channels() // (WIDTH * 3))
+    assert messageRows < HEIGHT // 10
+    return messageRows
+
+
+def test_extract_range_decodes_only_message_rows(embedService, files, stegoImage, monkeypatch):
+    content = b''.join(open(path, 'rb').read() for path in files)
+    messageRows = message_rows(embedService, stegoImage)
+    metrics = RecordingMetrics()
+    monkeypatch.setattr(embedService, 'metrics', metrics)
+
+    assert embedService.extract_range(stegoImage, 10, 20, 'secret') == content[10:20]
+    assert 0 < metrics.decoded_rows() < messageRows
+
+
+def test_list_files_decodes_only_message_rows(embedService, files, stegoImage, monkeypatch):
+    messageRows = message_rows(embedService, stegoImage)
+    metrics = RecordingMetrics()
+    monkeypatch.setattr(embedService, 'metrics', metrics)
+
+    listing = embedService.list_files(stegoImage, 'secret')
+    assert [(name, size) for name, _, size in listing] == [(os.path.basename(path), os.path.getsize(path)) for path in files]
+    assert 0 < metrics.decoded_rows() < messageRows
+
+
+def test_extraction_decodes_only_message_rows(embedService, files, stegoImage, tmp_path, monkeypatch):
+    messageRows = message_rows(embedService, stegoImage)
+    metrics = RecordingMetrics()
+    monkeypatch.setattr(embedService, 'metrics', metrics)
+
+    embedService.get_embedded_message(stegoImage, str(tmp_path / 'out'), 'secret')
+    for path in files:
+        assert (tmp_path / 'out' / os.path.basename(path)).read_bytes() == open(path, 'rb').read()
+    assert 0 < metrics.decoded_rows() <= 2 * messageRows
+
+
+def test_extract_range_of_frame_decodes_only_its_rows(embedService, tmp_path, monkeypatch):
+    width, height = 300, 400
+    pages = [Image.fromarray(np.random.default_rng(page).integers(0, 256, (height, width, 3), dtype=np.uint8)) for page in range(3)]
+    cover = str(tmp_path / 'cover.tiff')
+    pages[0].save(cover, save_all=True, append_images=pages[1:])
+    payload = tmp_path / 'payload.bin'
+    payload.write_bytes(os.urandom(width * height * 3 // 8 * 2))
+    stegoImage = str(tmp_path / 'stego.tiff')
+    assert embedService.embed_files([str(payload)], cover, stegoImage, 'secret')
+    assert len(embedService.read_header(stegoImage).frames) == 3
+    metrics = RecordingMetrics()
+    monkeypatch.setattr(embedService, 'metrics', metrics)
+
+    end = payload.stat().st_size - 100
+    assert embedService.extract_range(stegoImage, end - 10, end, 'secret') == payload.read_bytes()[end - 10:end]
+    assert 0 < metrics.decoded_rows(width) < height
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageFile
+from scan import scan_image
+
+
+def random_image(seed: int, width: int, height: int, mode: str) -> Image.Image:
+    array = np.random.default_rng(seed).integers(0, 256, (height, width, len(mode)), dtype=np.uint8)
+    return Image.fromarray(array, mode)
+
+
+@pytest.mark.parametrize('extension, frames', [
+    ('tiff', [(300, 100, 'RGB'), (200, 150, 'RGBA'), (100, 120, 'RGB')]),
+    ('png', [(300, 200, 'RGB')] * 3),
+])
+def test_capacity_of_following_frames_is_counted_without_decoding_them(tmp_path, monkeypatch, extension, frames):
+    images = [random_image(index, width, height, mode) for index, (width, height, mode) in enumerate(frames)]
+    path = str(tmp_path / f'cover.{extension}')
+    images[0].save(path, save_all=True, append_images=images[1:])
+    decodedRows = []
+    load = ImageFile.ImageFile.load
+
+    def counting_load(image):
+        decodedRows.extend(bottom - top for _, (_, top, _, bottom), *_ in image.tile)
+        return load(image)
+
+    monkeypatch.setattr(ImageFile.ImageFile, 'load', counting_load)
+    result = scan_image(path)
+
+    assert result['error'] is None and not result['detected']
+    assert 0 < sum(decodedRows) < frames[0][1]
+    following = sum(width * height * 3 // 8 for width, height, _ in frames[1:]) # alpha isn't counted
+    assert following < result['capacity'] < following + frames[0][0] * frames[0][1] * 3 // 8
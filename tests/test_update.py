@@ -0,0 +1,79 @@
+import os
+import numpy as np
+from typing import Callable
+import pytest
+from PIL import Image
+from bitplane import extract_bits
+from Codec import Codec
+from scatter import ScatterPermutation, gather_bits, scatter_seed
+from service.EmbedService import EmbedService
+from service.KeyService import KeyService
+
+SECRET = 'secret'
+
+
+@pytest.fixture
+def embedService(monkeypatch):
+    embedService = EmbedService.get_instance()
+    monkeypatch.setattr(embedService, 'update', False)
+    return embedService
+
+
+@pytest.fixture
+def cover(tmp_path):
+    path = str(tmp_path / 'cover.png')
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (120, 160, 3), dtype=np.uint8)).save(path)
+    return path
+
+
+def channels(path: str) -> np.ndarray:
+    return np.asarray(Image.open(path)).reshape(-1)
+
+
+def old_bits(embedService: EmbedService, path: str) -> Callable[[str], np.ndarray]:
+    """Function reading bits at positions of data (after the header) of message currently embedded into image"""
+    header = embedService.read_header(path)
+    imageChannels = channels(path)
+    if header.scatter:
+        key = KeyService.get_instance().record_key(SECRET, header.keyDerivation)
+        base = len(header) * 8
+        permutation = ScatterPermutation(scatter_seed(key, header.scatter), len(imageChannels) - base)
+        return lambda image: gather_bits(channels(image), header.stored_size() * 8, 0, header.depth, permutation, base)
+    return lambda image: extract_bits(channels(image), header.stored_size() * 8, header.payload_offset(), header.depth)
+
+
+def update(embedService: EmbedService, message: str, path: str, monkeypatch) -> None:
+    monkeypatch.setattr(embedService, 'update', True)
+    assert embedService.embed_string(message, path, path, SECRET)
+    monkeypatch.setattr(embedService, 'update', False)
+
+
+@pytest.mark.parametrize('newSize', [3000, 200], ids=['larger', 'smaller'])
+def test_update_replaces_old_message(embedService, cover, tmp_path, monkeypatch, newSize):
+    path = str(tmp_path / 'stego.png')
+    assert embedService.embed_string('o' * 1000, cover, path, SECRET)
+    read_old = old_bits(embedService, path)
+    before = read_old(path)
+
+    update(embedService, 'n' * newSize, path, monkeypatch)
+
+    assert embedService.get_embedded_message(path, '', SECRET) == 'n' * newSize
+    assert np.mean(read_old(path) == before) < 0.6 # random bits match half of the old ones
+
+
+def test_update_of_scattered_message_with_other_header_length(embedService, cover, tmp_path, monkeypatch):
+    path = str(tmp_path / 'stego.png')
+    monkeypatch.setattr(embedService, 'scatter', True)
+    monkeypatch.setattr(embedService, 'codec', Codec.ZLIB)
+    assert embedService.embed_string(os.urandom(1000).hex(), cover, path, SECRET)
+    previous = embedService.read_header(path)
+    read_old = old_bits(embedService, path)
+    before = read_old(path)
+
+    monkeypatch.setattr(embedService, 'codec', Codec.NONE)
+    update(embedService, 'new message', path, monkeypatch)
+
+    header = embedService.read_header(path)
+    assert header.scatter and len(header) != len(previous)
+    assert embedService.get_embedded_message(path, '', SECRET) == 'new message'
+    assert np.mean(read_old(path) == before) < 0.6